@@ -0,0 +1,13 @@
+// The file names inside the zips of /api/generate-bundle. The zip itself is
+// written by python/bundle.py, in the render worker.
+
+// Builder name -> file name inside the bundle (the single endpoints' names)
+const BUNDLE_FILES = {
+    resume: 'resume_output.docx',
+    cv: 'cv_output.docx',
+    'ats-cv': 'ats_cv_output.docx',
+    'ats-resume': 'ats_resume_output.docx',
+    'modern-resume': 'modern_resume.docx',
+};
+
+module.exports = { BUNDLE_FILES };
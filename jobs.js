@@ -0,0 +1,426 @@
+// Asynchronous render jobs. POST /api/jobs queues a render and answers with a
+// job id straight away, so large renders don't hold a connection open; the
+// status and the result are fetched later. Jobs travel through a pluggable
+// queue - in-process, or a spool directory that render workers in other
+// processes or on other hosts pull from (python/job_worker.py) - and
+// finished results are kept in a bounded store until their TTL runs out.
+
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+
+class JobError extends Error {
+    constructor(message, status) {
+        super(message);
+        this.status = status;
+    }
+}
+
+// Sortable by creation time, so the spool directory can be read in order
+const newJobId = () => `${Date.now().toString(36).padStart(9, '0')}-${crypto.randomBytes(6).toString('hex')}`;
+
+// Job records and their results. Finished jobs are dropped `ttlMs` after they
+// finish, and the oldest results go first once they hold more than
+// `maxBytes`. At most `maxPending` jobs may be queued or running.
+class JobStore {
+    constructor({ ttlMs = 15 * 60 * 1000, maxBytes = 256 * 1024 * 1024, maxPending = 1000, now = Date.now } = {}) {
+        this.options = { ttlMs, maxBytes, maxPending };
+        this.now = now;
+        this.jobs = new Map();
+        this.results = new Map();
+        this.bytes = 0;
+        this.pending = 0;
+        this.counters = { created: 0, completed: 0, failed: 0, expired: 0, evicted: 0 };
+    }
+
+    create(builder, filename) {
+        this.sweep();
+        if (this.pending >= this.options.maxPending) {
+            throw new JobError('Too many jobs in progress, please retry shortly', 429);
+        }
+        const job = { id: newJobId(), builder, filename, status: 'queued', createdAt: this.now() };
+        this.jobs.set(job.id, job);
+        this.pending++;
+        this.counters.created++;
+        return job;
+    }
+
+    get(id) {
+        this.sweep();
+        return this.jobs.get(id);
+    }
+
+    start(id) {
+        const job = this.jobs.get(id);
+        if (!job || job.status !== 'queued') return false;
+        job.status = 'running';
+        job.startedAt = this.now();
+        return true;
+    }
+
+    // `builder` and `filename` are the template that rendered, when a
+    // template-fallback replaced the one the job was created for
+    complete(id, body, { degraded = [], builder = null, filename = null } = {}) {
+        const job = this.finish(id, 'done');
+        if (!job) return;
+        job.size = body.length;
+        job.degraded = degraded;
+        if (builder) job.renderedBuilder = builder;
+        if (filename) job.filename = filename;
+        this.results.set(id, body);
+        this.bytes += body.length;
+        this.counters.completed++;
+        for (const [oldId, oldBody] of this.results) {
+            if (this.bytes <= this.options.maxBytes) break;
+            this.drop(oldId, oldBody);
+            this.counters.evicted++;
+        }
+    }
+
+    fail(id, error, status = 500) {
+        const job = this.finish(id, 'failed');
+        if (!job) return;
+        job.error = error;
+        job.errorStatus = status;
+        this.counters.failed++;
+    }
+
+    finish(id, status) {
+        const job = this.jobs.get(id);
+        if (!job || job.status === 'done' || job.status === 'failed') return null;
+        job.status = status;
+        job.finishedAt = this.now();
+        this.pending--;
+        return job;
+    }
+
+    result(id) {
+        return this.results.get(id);
+    }
+
+    drop(id, body = this.results.get(id)) {
+        this.jobs.delete(id);
+        if (body !== undefined) {
+            this.results.delete(id);
+            this.bytes -= body.length;
+        }
+    }
+
+    // Jobs finish in order of insertion only roughly, so every finished job
+    // is checked; this runs on each request and is cheap next to a render.
+    sweep() {
+        const cutoff = this.now() - this.options.ttlMs;
+        for (const job of this.jobs.values()) {
+            if (job.finishedAt !== undefined && job.finishedAt <= cutoff) {
+                this.drop(job.id);
+                this.counters.expired++;
+            }
+        }
+    }
+
+    // The public view of a job, as returned by GET /api/jobs/:id
+    describe(job) {
+        const { id, builder, renderedBuilder, status, createdAt, startedAt, finishedAt, size, degraded, error } = job;
+        const iso = (ms) => (ms === undefined ? undefined : new Date(ms).toISOString());
+        return {
+            id, builder, renderedBuilder, status, size, degraded, error,
+            createdAt: iso(createdAt), startedAt: iso(startedAt), finishedAt: iso(finishedAt),
+            expiresAt: iso(finishedAt === undefined ? undefined : finishedAt + this.options.ttlMs),
+        };
+    }
+
+    stats() {
+        const byStatus = { queued: 0, running: 0, done: 0, failed: 0 };
+        for (const job of this.jobs.values()) byStatus[job.status]++;
+        return { ...byStatus, bytes: this.bytes };
+    }
+}
+
+// In-process queue: jobs are rendered by this server's own worker pool.
+// Messages are { id, builder, data, photo } with `photo` a Buffer or null.
+class MemoryQueue {
+    constructor() {
+        this.messages = [];
+        this.takers = [];
+    }
+
+    start() {
+        return this;
+    }
+
+    push(message) {
+        const taker = this.takers.shift();
+        if (taker) {
+            taker(message);
+        } else {
+            this.messages.push(message);
+        }
+    }
+
+    // Resolves with the next message, waiting for one if the queue is empty
+    take() {
+        if (this.messages.length) return Promise.resolve(this.messages.shift());
+        return new Promise((resolve) => this.takers.push(resolve));
+    }
+
+    // Called once a message taken here has been rendered
+    release() {}
+
+    get depth() {
+        return this.messages.length;
+    }
+
+    stop() {}
+}
+
+// Spool directory shared by everything that renders jobs:
+//   pending/<id>.json, <id>.photo   queued jobs
+//   claimed/<id>.json, <id>.photo   taken by a renderer; the rename is the lock
+//   done/<id>.json, <id>.docx       results left by python/job_worker.py
+//   failed/                         job and result files that couldn't be read,
+//                                   set aside for someone to look at
+// One server and any number of job workers share the directory, on one host
+// or over a network filesystem with atomic renames. Results that job workers
+// leave in done/ are handed to `onResult`, and jobs they claim to `onClaimed`.
+// A renderer touches its claims while it works on them, however long the
+// render takes; claims untouched for `claimTimeoutMs` (a renderer that died)
+// are put back. Other hosts write these files and the directory may be on a
+// network mount, so any file can be unreadable: such a job is moved to
+// failed/ and fails, and the queue carries on.
+class FileQueue {
+    constructor({ dir, pollMs = 200, claimTimeoutMs = 5 * 60 * 1000 }) {
+        this.dir = dir;
+        this.options = { pollMs, claimTimeoutMs };
+        this.dirs = {};
+        for (const name of ['pending', 'claimed', 'done', 'failed']) {
+            this.dirs[name] = path.join(dir, name);
+            fs.mkdirSync(this.dirs[name], { recursive: true });
+        }
+        this.takers = [];
+        this.timer = null;
+        // Ids of the claims this queue took and hasn't released yet
+        this.active = new Set();
+    }
+
+    start({ onResult = () => {}, onClaimed = () => {} } = {}) {
+        this.onResult = onResult;
+        this.onClaimed = onClaimed;
+        this.timer = setInterval(() => this.poll(), this.options.pollMs);
+        this.timer.unref();
+        return this;
+    }
+
+    // Written under a temporary name and renamed, so a reader never sees half a job
+    push({ id, builder, data, photo }) {
+        const pending = this.dirs.pending;
+        if (photo) fs.writeFileSync(path.join(pending, `${id}.photo`), photo);
+        const header = JSON.stringify({ id, builder, data, photo: Boolean(photo) });
+        fs.writeFileSync(path.join(pending, `${id}.json.tmp`), header);
+        fs.renameSync(path.join(pending, `${id}.json.tmp`), path.join(pending, `${id}.json`));
+        this.poll();
+    }
+
+    take() {
+        const message = this.claimNext();
+        if (message) return Promise.resolve(message);
+        return new Promise((resolve) => this.takers.push(resolve));
+    }
+
+    claimNext() {
+        const names = fs.readdirSync(this.dirs.pending).filter((name) => name.endsWith('.json')).sort();
+        for (const name of names) {
+            const id = name.slice(0, -'.json'.length);
+            const claimed = path.join(this.dirs.claimed, name);
+            try {
+                fs.renameSync(path.join(this.dirs.pending, name), claimed);
+            } catch (err) {
+                if (err.code === 'ENOENT') continue; // another renderer was first
+                throw err;
+            }
+            try {
+                // The claim's age is what checkClaims() looks at
+                const now = new Date();
+                fs.utimesSync(claimed, now, now);
+                const header = JSON.parse(fs.readFileSync(claimed, 'utf8'));
+                let photo = null;
+                if (header.photo) {
+                    const photoName = `${id}.photo`;
+                    fs.renameSync(path.join(this.dirs.pending, photoName), path.join(this.dirs.claimed, photoName));
+                    photo = fs.readFileSync(path.join(this.dirs.claimed, photoName));
+                }
+                this.active.add(id);
+                return { id, builder: header.builder, data: header.data, photo };
+            } catch (err) {
+                this.setAside(this.dirs.claimed, id, err);
+            }
+        }
+        return null;
+    }
+
+    // Moves what is left of job `id` in `dir` (and a photo still pending) to
+    // failed/, and fails the job
+    setAside(dir, id, err) {
+        const files = [[dir, '.json'], [dir, '.photo'], [dir, '.docx'], [this.dirs.pending, '.photo']];
+        for (const [from, suffix] of files) {
+            try {
+                fs.renameSync(path.join(from, `${id}${suffix}`), path.join(this.dirs.failed, `${id}${suffix}`));
+            } catch (renameErr) {
+                // Not there, or just as unreachable
+            }
+        }
+        console.error(`Job ${id} moved to failed/: ${err.message}`);
+        this.onResult(id, { ok: false, error: `Unreadable job files: ${err.message}` });
+    }
+
+    release(id) {
+        this.active.delete(id);
+        fs.rmSync(path.join(this.dirs.claimed, `${id}.photo`), { force: true });
+        fs.rmSync(path.join(this.dirs.claimed, `${id}.json`), { force: true });
+    }
+
+    // Runs from a timer, where an exception would take the server down, so
+    // each step's errors are only logged and the next poll tries again
+    poll() {
+        for (const step of ['feedTakers', 'collectResults', 'checkClaims']) {
+            try {
+                this[step]();
+            } catch (err) {
+                console.error(`Job spool ${step} failed: ${err.message}`);
+            }
+        }
+    }
+
+    feedTakers() {
+        while (this.takers.length) {
+            const message = this.claimNext();
+            if (!message) break;
+            this.takers.shift()(message);
+        }
+    }
+
+    collectResults() {
+        for (const name of fs.readdirSync(this.dirs.done).filter((n) => n.endsWith('.json'))) {
+            const file = path.join(this.dirs.done, name);
+            const id = name.slice(0, -'.json'.length);
+            const bodyFile = path.join(this.dirs.done, `${id}.docx`);
+            let result;
+            try {
+                result = JSON.parse(fs.readFileSync(file, 'utf8'));
+                if (result.ok) result.body = fs.readFileSync(bodyFile);
+            } catch (err) {
+                this.setAside(this.dirs.done, id, err);
+                continue;
+            }
+            try {
+                fs.rmSync(bodyFile, { force: true });
+                fs.unlinkSync(file);
+            } catch (err) {
+                // Collected again next time; the store ignores finished jobs
+                console.error(`Could not remove the result of job ${id}: ${err.message}`);
+            }
+            this.onResult(id, result);
+        }
+    }
+
+    checkClaims() {
+        const now = Date.now();
+        const cutoff = now - this.options.claimTimeoutMs;
+        for (const name of fs.readdirSync(this.dirs.claimed).filter((n) => n.endsWith('.json'))) {
+            const file = path.join(this.dirs.claimed, name);
+            const id = name.slice(0, -'.json'.length);
+            let stat;
+            try {
+                stat = fs.statSync(file);
+            } catch (err) {
+                continue; // finished meanwhile
+            }
+            try {
+                if (this.active.has(id)) {
+                    // Still rendering here: keep the claim fresh
+                    if (stat.mtimeMs < now - this.options.claimTimeoutMs / 3) fs.utimesSync(file, new Date(now), new Date(now));
+                    continue;
+                }
+                if (stat.mtimeMs < cutoff) {
+                    // Put back; one that can't be read is set aside when it is claimed again
+                    const photoName = `${id}.photo`;
+                    if (fs.existsSync(path.join(this.dirs.claimed, photoName))) {
+                        fs.renameSync(path.join(this.dirs.claimed, photoName), path.join(this.dirs.pending, photoName));
+                    }
+                    fs.renameSync(file, path.join(this.dirs.pending, name));
+                } else {
+                    this.onClaimed(id);
+                }
+            } catch (err) {
+                console.error(`Could not check the claim on job ${id}: ${err.message}`);
+            }
+        }
+    }
+
+    get depth() {
+        return fs.readdirSync(this.dirs.pending).filter((name) => name.endsWith('.json')).length;
+    }
+
+    stop() {
+        clearInterval(this.timer);
+    }
+}
+
+// Takes jobs off `queue` and renders them with `render(message)`, a promise
+// for { body, degraded, builder, filename }, at most `concurrency` at a time. Renders rejected for
+// load (an error with a status, e.g. a full render queue) are retried a few
+// times before the job fails.
+class JobRunner {
+    constructor(queue, store, render, { concurrency = 1, retries = 5, retryDelayMs = 1000 } = {}) {
+        this.queue = queue;
+        this.store = store;
+        this.render = render;
+        this.options = { concurrency, retries, retryDelayMs };
+    }
+
+    start() {
+        for (let i = 0; i < this.options.concurrency; i++) this.loop();
+        return this;
+    }
+
+    // Nothing may end the loop: it runs unawaited, so an error escaping it
+    // would be an unhandled rejection, which stops the server
+    async loop() {
+        for (;;) {
+            try {
+                const message = await this.queue.take();
+                await this.run(message);
+            } catch (err) {
+                console.error(`Job queue error: ${err.message}`);
+                await new Promise((resolve) => setTimeout(resolve, this.options.retryDelayMs));
+            }
+        }
+    }
+
+    async run(message) {
+        try {
+            // Expired, or queued before a restart: nobody can fetch the result
+            const job = this.store.get(message.id);
+            if (!job || job.finishedAt !== undefined) return;
+            this.store.start(message.id);
+            for (let attempt = 0; ; attempt++) {
+                try {
+                    const { body, ...details } = await this.render(message);
+                    this.store.complete(message.id, body, details);
+                    break;
+                } catch (err) {
+                    if (err.status && attempt < this.options.retries) {
+                        await new Promise((resolve) => setTimeout(resolve, this.options.retryDelayMs));
+                        continue;
+                    }
+                    console.error(`Job ${message.id} failed: ${err.message}`);
+                    this.store.fail(message.id, err.message, err.status || 500);
+                    break;
+                }
+            }
+        } finally {
+            this.queue.release(message.id);
+        }
+    }
+}
+
+module.exports = { JobStore, JobError, MemoryQueue, FileQueue, JobRunner };
@@ -0,0 +1,68 @@
+// Live preview from the server: posts the form data to /api/preview/:builder
+// a moment after the last edit and shows the HTML it gets back, which comes
+// from the same layouts as the Word download (see python/preview.py).
+//
+//     const preview = LivePreview.create({
+//         builder: 'ats-resume',
+//         target: document.getElementById('serverPreview'),
+//         collect: collectFormData,
+//         onError: () => showLocalPreview(),
+//     });
+//     preview.update();   // on every input event
+//
+// Only the latest edit matters: a request still in flight when the next one
+// goes out is aborted, and an unchanged payload is answered with a 304.
+(function() {
+    const DEFAULT_SERVER = 'http://localhost:3000';
+
+    function create({ builder, target, collect, server = DEFAULT_SERVER, delayMs = 250, onRender, onError }) {
+        let timer = null;
+        let controller = null;
+        let etag = null;
+
+        async function run() {
+            timer = null;
+            if (controller) controller.abort();
+            controller = new AbortController();
+            const { signal } = controller;
+
+            const headers = { 'Content-Type': 'application/json' };
+            if (etag) headers['If-None-Match'] = etag;
+            try {
+                const response = await fetch(`${server}/api/preview/${builder}`, {
+                    method: 'POST',
+                    headers,
+                    body: JSON.stringify(collect()),
+                    signal,
+                });
+                if (response.status === 304) return;
+                if (!response.ok) throw new Error(`Preview failed with status ${response.status}`);
+                const html = await response.text();
+                if (signal.aborted) return;
+                etag = response.headers.get('ETag');
+                target.innerHTML = html;
+                if (onRender) onRender(target);
+            } catch (error) {
+                if (error.name === 'AbortError') return;
+                etag = null;
+                if (onError) onError(error);
+            }
+        }
+
+        return {
+            // Schedules a preview; calls within `delayMs` of each other
+            // collapse into one request.
+            update() {
+                clearTimeout(timer);
+                timer = setTimeout(run, delayMs);
+            },
+            cancel() {
+                clearTimeout(timer);
+                timer = null;
+                if (controller) controller.abort();
+            },
+        };
+    }
+
+    window.LivePreview = { create };
+})();
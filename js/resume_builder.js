@@ -1,128 +1,86 @@
+// Resume builder form. The preview is rendered by the server from the same
+// layout as the Word download (js/live_preview.js, loaded before this file),
+// so the form only turns its fields into the payload /api/generate-resume takes.
 document.addEventListener('DOMContentLoaded', () => {
-    // Start Mappings
-    // Mapping of input IDs to preview IDs
-    const mappings = {
-        'input-name': ['preview-name', 'preview-pd-name', 'preview-sig-name'],
-        'input-co': 'preview-co',
-        'input-addr1': 'preview-addr1',
-        'input-addr2': 'preview-addr2',
-        'input-addr3': 'preview-addr3',
-        'input-mobile': 'preview-mobile',
-        'input-email': 'preview-email',
-        'input-objective': 'preview-objective',
-
-        // Diploma
-        'input-diploma-inst': 'preview-diploma-inst',
-        'input-diploma-board': 'preview-diploma-board',
-        'input-diploma-subj': 'preview-diploma-subj',
-        'input-diploma-year': 'preview-diploma-year',
-
-        // SSC
-        'input-ssc-school': 'preview-ssc-school',
-        'input-ssc-board': 'preview-ssc-board',
-        'input-ssc-group': 'preview-ssc-group',
-        'input-ssc-year': 'preview-ssc-year',
-        'input-ssc-gpa': 'preview-ssc-gpa',
-
-        // Computer
-        'input-comp-apps': 'preview-comp-apps',
-        'input-comp-other': 'preview-comp-other',
-        'input-comp-prog': 'preview-comp-prog',
-
-        // Language
-        'input-lang-bengali': 'preview-lang-bengali',
-        'input-lang-english': 'preview-lang-english',
-
-        // Personal Details
-        'input-pd-father': 'preview-pd-father',
-        'input-pd-mother': 'preview-pd-mother',
-        'input-pd-dob': 'preview-pd-dob',
-        'input-pd-gender': 'preview-pd-gender',
-        'input-pd-marital': 'preview-pd-marital',
-        'input-pd-religion': 'preview-pd-religion',
-        'input-pd-nationality': 'preview-pd-nationality',
-        'input-pd-blood': 'preview-pd-blood',
-        'input-pd-height': 'preview-pd-height',
-        'input-pd-nid': 'preview-pd-nid',
-        'input-pd-perm-addr': 'preview-pd-perm-addr',
-
-        // Declaration & Date
-        'input-declaration': 'preview-declaration',
-        'input-date': 'preview-date'
+    const form = document.getElementById('resume-form');
+    const value = (id) => {
+        const input = document.getElementById(id);
+        return input ? input.value.trim() : '';
     };
-    // End Mappings
-
-    // Start Event Listeners
-    // Add event listeners for standard fields
-    for (const [inputId, previewIds] of Object.entries(mappings)) {
-        const input = document.getElementById(inputId);
-        if (!input) continue;
-
-        input.addEventListener('input', (e) => {
-            const value = e.target.value;
-
-            if (Array.isArray(previewIds)) {
-                previewIds.forEach(id => {
-                    const el = document.getElementById(id);
-                    if (el) el.textContent = value;
-                });
-            } else {
-                const el = document.getElementById(previewIds);
-                if (el) el.textContent = value;
-            }
-        });
+    const lines = (id) => value(id).split('\n').map((line) => line.trim()).filter(Boolean);
+    const joined = (separator, ...parts) => parts.filter(Boolean).join(separator);
+
+    // Start Form Data
+    // The uploaded photo, as a data URL
+    let photo = null;
+
+    // Form Data, as the generate and preview endpoints take it
+    function collectFormData() {
+        const education = [
+            {
+                degree: joined(' in ', value('input-diploma-subj') && 'Diploma', value('input-diploma-subj')),
+                school: joined(', ', value('input-diploma-inst'), value('input-diploma-board')),
+                year: value('input-diploma-year'),
+            },
+            {
+                degree: joined(' ', value('input-ssc-group') && 'SSC', value('input-ssc-group'),
+                    value('input-ssc-gpa') && `(GPA ${value('input-ssc-gpa')})`),
+                school: joined(', ', value('input-ssc-school'), value('input-ssc-board')),
+                year: value('input-ssc-year'),
+            },
+        ].filter((entry) => entry.degree || entry.school || entry.year);
+
+        return {
+            name: value('input-name'),
+            email: value('input-email'),
+            phone: value('input-mobile'),
+            address: joined(', ', value('input-addr1'), value('input-addr2'), value('input-addr3')),
+            objective: value('input-objective'),
+            skills: [...lines('input-qualities'), ...['input-comp-apps', 'input-comp-other', 'input-comp-prog'].map(value).filter(Boolean)],
+            languages: [
+                joined(': ', value('input-lang-bengali') && 'Bengali', value('input-lang-bengali')),
+                joined(': ', value('input-lang-english') && 'English', value('input-lang-english')),
+            ].filter(Boolean),
+            education,
+            photo,
+        };
     }
-    // End Event Listeners
-
-    // Start Key Qualities
-    // Special handling for Key Qualities (List)
-    const qualitiesInput = document.getElementById('input-qualities');
-    const qualitiesPreview = document.getElementById('preview-qualities');
-
-    if (qualitiesInput && qualitiesPreview) {
-        qualitiesInput.addEventListener('input', (e) => {
-            const lines = e.target.value.split('\n');
-            qualitiesPreview.innerHTML = ''; // Clear existing list
-
-            lines.forEach(line => {
-                if (line.trim() !== '') {
-                    const li = document.createElement('li');
-                    li.textContent = line;
-                    qualitiesPreview.appendChild(li);
-                }
-            });
-        });
+    // End Form Data
+
+    // Start Live Preview
+    const preview = LivePreview.create({
+        builder: 'resume',
+        target: document.getElementById('serverPreview'),
+        collect: collectFormData,
+        onError: () => {
+            document.getElementById('serverPreview').textContent = 'The preview is unavailable while the server can\'t be reached.';
+        },
+    });
+
+    if (form) {
+        form.addEventListener('input', () => preview.update());
     }
-    // End Key Qualities
 
-    // Start Image Upload Handling
-    // Image Upload Handling
     const photoInput = document.getElementById('input-photo');
-    const photoPreview = document.getElementById('preview-photo');
-    const photoPlaceholder = document.getElementById('photo-placeholder');
-
-    if (photoInput && photoPreview && photoPlaceholder) {
+    if (photoInput) {
         photoInput.addEventListener('change', (e) => {
             const file = e.target.files[0];
-            if (file) {
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    photoPreview.src = e.target.result;
-                    photoPreview.style.display = 'block';
-                    photoPlaceholder.style.display = 'none';
-                };
-                reader.readAsDataURL(file);
-            } else {
-                photoPreview.src = '';
-                photoPreview.style.display = 'none';
-                photoPlaceholder.style.display = 'block';
+            if (!file) {
+                photo = null;
+                preview.update();
+                return;
             }
+            const reader = new FileReader();
+            reader.onload = (e) => {
+                photo = e.target.result;
+                preview.update();
+            };
+            reader.readAsDataURL(file);
         });
     }
-    // End Image Upload Handling
-    
+    // End Live Preview
+
     // Start Auto Save & Clear Logic
-    const form = document.getElementById('resume-form');
     const STORAGE_KEY = 'resume_builder_data';
 
     function saveData() {
@@ -145,29 +103,15 @@ document.addEventListener('DOMContentLoaded', () => {
 
         Object.keys(data).forEach(id => {
             const input = document.getElementById(id);
-            if (input) {
-                input.value = data[id];
-                // Trigger input event to update preview
-                input.dispatchEvent(new Event('input'));
-            }
+            if (input) input.value = data[id];
         });
     }
 
     function clearData() {
         localStorage.removeItem(STORAGE_KEY);
         form.reset();
-        // Reset preview by triggering input events on empty fields
-        const inputs = form.querySelectorAll('input, textarea');
-        inputs.forEach(input => {
-            if (input.type !== 'file') {
-                input.value = ''; // Ensure value is cleared
-                input.dispatchEvent(new Event('input'));
-            }
-        });
-        // Restore default placeholders if needed, or just let them be empty
-        // For specific fields like lists, we might need extra handling, but dispatching input handles most.
-        document.getElementById('preview-photo').style.display = 'none';
-        document.getElementById('photo-placeholder').style.display = 'block';
+        photo = null;
+        preview.update();
     }
 
     // Attach Auto Save to all inputs
@@ -181,5 +125,6 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Load data on startup
     loadData();
+    preview.update();
     // End Auto Save & Clear Logic
 });
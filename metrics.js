@@ -0,0 +1,115 @@
+// Minimal Prometheus text exposition (format 0.0.4): labelled histograms
+// that are observed as requests finish, plus gauges and counters whose
+// values are read from a callback when /metrics is scraped.
+
+const escapeLabel = (value) => String(value).replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"');
+
+const formatLabels = (names, values, extra = '') => {
+    const pairs = names.map((name, i) => `${name}="${escapeLabel(values[i])}"`);
+    if (extra) pairs.push(extra);
+    return pairs.length ? `{${pairs.join(',')}}` : '';
+};
+
+const formatValue = (value) => {
+    if (value === Infinity) return '+Inf';
+    if (value === -Infinity) return '-Inf';
+    return String(value);
+};
+
+// Render latencies in seconds, from sub-millisecond fast-path phases up to
+// the render timeout.
+const SECONDS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60];
+const BYTES_BUCKETS = [8e3, 16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6];
+
+class Histogram {
+    constructor(name, help, labelNames = [], buckets = SECONDS_BUCKETS) {
+        this.name = name;
+        this.help = help;
+        this.labelNames = labelNames;
+        this.buckets = buckets.slice().sort((a, b) => a - b);
+        // Joined label values -> { values, counts, sum, count }
+        this.series = new Map();
+    }
+
+    observe(labels, value) {
+        if (!Number.isFinite(value)) return;
+        const values = this.labelNames.map((name) => (labels[name] === undefined ? '' : labels[name]));
+        const key = values.join('\u0000');
+        let series = this.series.get(key);
+        if (!series) {
+            series = { values, counts: new Array(this.buckets.length).fill(0), sum: 0, count: 0 };
+            this.series.set(key, series);
+        }
+        // Buckets are cumulative when rendered, so only the first match counts here
+        const index = this.buckets.findIndex((bound) => value <= bound);
+        if (index !== -1) series.counts[index]++;
+        series.sum += value;
+        series.count++;
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} histogram`];
+        for (const { values, counts, sum, count } of this.series.values()) {
+            let cumulative = 0;
+            this.buckets.forEach((bound, i) => {
+                cumulative += counts[i];
+                lines.push(`${this.name}_bucket${formatLabels(this.labelNames, values, `le="${formatValue(bound)}"`)} ${cumulative}`);
+            });
+            lines.push(`${this.name}_bucket${formatLabels(this.labelNames, values, 'le="+Inf"')} ${count}`);
+            lines.push(`${this.name}_sum${formatLabels(this.labelNames, values)} ${sum}`);
+            lines.push(`${this.name}_count${formatLabels(this.labelNames, values)} ${count}`);
+        }
+        return lines.join('\n');
+    }
+}
+
+// A gauge or counter read on every scrape. `collect` returns either a number
+// or a list of [labels, value] pairs.
+class Collected {
+    constructor(name, help, type, labelNames, collect) {
+        this.name = name;
+        this.help = help;
+        this.type = type;
+        this.labelNames = labelNames;
+        this.collect = collect;
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} ${this.type}`];
+        const result = this.collect();
+        const samples = typeof result === 'number' ? [[{}, result]] : result;
+        for (const [labels, value] of samples) {
+            const values = this.labelNames.map((name) => labels[name]);
+            lines.push(`${this.name}${formatLabels(this.labelNames, values)} ${formatValue(value)}`);
+        }
+        return lines.join('\n');
+    }
+}
+
+class MetricsRegistry {
+    constructor() {
+        this.metrics = [];
+    }
+
+    histogram(name, help, labelNames, buckets) {
+        const metric = new Histogram(name, help, labelNames, buckets);
+        this.metrics.push(metric);
+        return metric;
+    }
+
+    gauge(name, help, collect, labelNames = []) {
+        this.metrics.push(new Collected(name, help, 'gauge', labelNames, collect));
+    }
+
+    counter(name, help, collect, labelNames = []) {
+        this.metrics.push(new Collected(name, help, 'counter', labelNames, collect));
+    }
+
+    render() {
+        return `${this.metrics.map((metric) => metric.render()).join('\n')}\n`;
+    }
+}
+
+const CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8';
+
+module.exports = { MetricsRegistry, Histogram, SECONDS_BUCKETS, BYTES_BUCKETS, CONTENT_TYPE };
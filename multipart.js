@@ -0,0 +1,128 @@
+// multipart/form-data bodies for the render endpoints. The request is read
+// into one buffer and every part is a view into it, so an uploaded photo is
+// never copied or turned into a string on its way to the render worker.
+
+const CRLF = Buffer.from('\r\n');
+const HEADER_END = Buffer.from('\r\n\r\n');
+
+class MultipartError extends Error {
+    constructor(message, status = 400) {
+        super(message);
+        this.status = status;
+    }
+}
+
+// Resolves with the whole request body, rejecting with 413 past `limit` bytes.
+// The rest of an oversized body is read and dropped rather than the socket
+// destroyed, so the client gets to see the 413 instead of a reset.
+const readBody = (req, limit) => new Promise((resolve, reject) => {
+    const chunks = [];
+    let length = 0;
+    const onData = (chunk) => {
+        length += chunk.length;
+        if (length > limit) {
+            req.removeListener('data', onData);
+            req.resume();
+            reject(new MultipartError(`Request body is larger than ${limit} bytes`, 413));
+            return;
+        }
+        chunks.push(chunk);
+    };
+    req.on('data', onData);
+    req.on('end', () => resolve(chunks.length === 1 ? chunks[0] : Buffer.concat(chunks, length)));
+    req.on('error', reject);
+});
+
+const boundaryOf = (contentType) => {
+    const match = /boundary=(?:"([^"]+)"|([^;]+))/i.exec(contentType || '');
+    return match ? (match[1] || match[2]).trim() : null;
+};
+
+const parseHeaders = (block) => {
+    const headers = {};
+    for (const line of block.split('\r\n')) {
+        const colon = line.indexOf(':');
+        if (colon > 0) headers[line.slice(0, colon).trim().toLowerCase()] = line.slice(colon + 1).trim();
+    }
+    return headers;
+};
+
+const dispositionParam = (disposition, name) => {
+    const match = new RegExp(`;\\s*${name}="([^"]*)"`, 'i').exec(disposition);
+    return match ? match[1] : null;
+};
+
+// Splits `body` into { fields: { name: string }, files: { name: { filename,
+// contentType, data } } }, where `data` is a view into `body`.
+const parseMultipart = (body, boundary) => {
+    const delimiter = Buffer.from(`--${boundary}`);
+    const nextDelimiter = Buffer.from(`\r\n--${boundary}`);
+    const fields = {};
+    const files = {};
+
+    let position = body.indexOf(delimiter);
+    if (position === -1) throw new MultipartError('Malformed multipart body: boundary not found');
+    position += delimiter.length;
+
+    for (;;) {
+        // "--" after a delimiter closes the body
+        if (body[position] === 0x2d && body[position + 1] === 0x2d) break;
+        if (!body.subarray(position, position + 2).equals(CRLF)) {
+            throw new MultipartError('Malformed multipart body: bad delimiter line');
+        }
+        const headerStart = position + 2;
+        const headerEnd = body.indexOf(HEADER_END, headerStart);
+        if (headerEnd === -1) throw new MultipartError('Malformed multipart body: unterminated part headers');
+        const contentStart = headerEnd + HEADER_END.length;
+        const contentEnd = body.indexOf(nextDelimiter, contentStart);
+        if (contentEnd === -1) throw new MultipartError('Malformed multipart body: missing closing boundary');
+
+        const headers = parseHeaders(body.toString('utf8', headerStart, headerEnd));
+        const disposition = headers['content-disposition'] || '';
+        const name = dispositionParam(disposition, 'name');
+        const filename = dispositionParam(disposition, 'filename');
+        const data = body.subarray(contentStart, contentEnd);
+        if (name !== null) {
+            if (filename !== null) {
+                files[name] = { filename, contentType: headers['content-type'] || 'application/octet-stream', data };
+            } else {
+                fields[name] = data.toString('utf8');
+            }
+        }
+        position = contentEnd + nextDelimiter.length;
+    }
+    return { fields, files };
+};
+
+// Middleware for render requests sent as multipart/form-data: a `data` field
+// with the JSON payload and an optional `photo` file. Sets req.body to the
+// payload and req.photo to { contentType, data } (a Buffer) or null. Other
+// content types pass through untouched.
+const renderUpload = ({ limit = 16 * 1024 * 1024 } = {}) => (req, res, next) => {
+    if (!/^multipart\/form-data/i.test(req.get('Content-Type') || '')) return next();
+    const boundary = boundaryOf(req.get('Content-Type'));
+    if (!boundary) {
+        res.status(400).send('Multipart request without a boundary');
+        return;
+    }
+    readBody(req, limit)
+        .then((body) => {
+            const { fields, files } = parseMultipart(body, boundary);
+            try {
+                req.body = fields.data ? JSON.parse(fields.data) : {};
+            } catch (err) {
+                throw new MultipartError(`Invalid JSON in the data field: ${err.message}`);
+            }
+            const photo = files.photo;
+            req.photo = photo && photo.data.length ? { contentType: photo.contentType, data: photo.data } : null;
+            next();
+        })
+        .catch((err) => {
+            if (res.headersSent) return;
+            // Don't wait for the rest of an oversized upload on this connection
+            if (err.status === 413) res.set('Connection', 'close');
+            res.status(err.status || 400).send(err.message);
+        });
+};
+
+module.exports = { renderUpload, parseMultipart, readBody, MultipartError };
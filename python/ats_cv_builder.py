@@ -1,19 +1,30 @@
 import sys
-import json
 import os
-import base64
-import io
-from docx import Document
 from docx.shared import Pt, Inches, Mm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-def generate_ats_cv(json_path):
-    # Load data
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+from photos import prepare_photo, report_error
+from interrupts import BudgetExceeded
+import fast_docx
+import schema
+from prototypes import new_document
+from sections import Section, render_sections, ensure_paragraph
+from styles import Style, CHARACTER, add_styles
+from render_utils import OUTPUT_DIR, load_json, save_document, write_output, run_cli
 
-    document = Document()
-    
+# Named styles used by the content, see styles.py
+STYLES = [
+    Style('Name', size=Pt(24), bold=True),
+    Style('Description', left_indent=Pt(10)),
+    Style('Job Title', CHARACTER, size=Pt(12), bold=True),
+    Style('Company', CHARACTER, bold=True),
+    Style('School', CHARACTER, bold=True),
+]
+
+def _setup_ats_cv(document):
+    """
+    Margins, styles and the header layout table, built once per process.
+    """
     # Set margins (Normal 1 inch is good for ATS, but we can make it slightly smaller if needed)
     sections = document.sections
     for section in sections:
@@ -32,13 +43,23 @@ def generate_ats_cv(json_path):
     header_table.columns[0].width = Inches(4.5) # Text column
     header_table.columns[1].width = Inches(1.5) # Photo column
 
+    # Sections append to the header cells; empty cells get their paragraph back after rendering
+    for cell in header_table.rows[0].cells:
+        cell._element.remove(cell.paragraphs[0]._p)
+
+    # Plain Arial throughout, with black headings
+    normal = document.styles['Normal'].font
+    normal.name = 'Arial'
+    normal.size = Pt(10)
+    heading = document.styles['Heading 1'].font
+    heading.name = 'Arial'
+    heading.color.rgb = None # Default black
+
+    add_styles(document, STYLES)
+
+def _render_header(text_cell, data):
     # Text Cell
-    text_cell = header_table.cell(0, 0)
-    name_paragraph = text_cell.paragraphs[0]
-    name_run = name_paragraph.add_run(data.get('name', 'Your Name'))
-    name_run.bold = True
-    name_run.font.size = Pt(24)
-    name_run.font.name = 'Arial'
+    text_cell.add_paragraph(data.get('name', 'Your Name'), 'Name')
 
     # Contact Info
     contact_info = []
@@ -48,85 +69,68 @@ def generate_ats_cv(json_path):
     if 'linkedin' in data and data['linkedin']: contact_info.append(data['linkedin'])
     
     if contact_info:
-        contact_p = text_cell.add_paragraph(" | ".join(contact_info))
-        contact_p.style.font.name = 'Arial'
-        contact_p.style.font.size = Pt(10)
+        text_cell.add_paragraph(" | ".join(contact_info))
 
+def _render_photo(photo_cell, data):
     # Photo Cell
-    photo_cell = header_table.cell(0, 1)
     if 'photo' in data and data['photo']:
         try:
-            # Decode base64 image
-            # Expecting data:image/png;base64,......
-            header, encoded = data['photo'].split(",", 1)
-            image_data = base64.b64decode(encoded)
-            image_stream = io.BytesIO(image_data)
-            
-            paragraph = photo_cell.paragraphs[0]
+            # Expecting data:image/png;base64,...... (decoded, downscaled and cached once)
+            image_stream = prepare_photo(data['photo'], 1.2)
+
+            paragraph = photo_cell.add_paragraph()
             paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
             run = paragraph.add_run()
             run.add_picture(image_stream, width=Inches(1.2))
+        except (BudgetExceeded, MemoryError):
+            # Left to governor.py, which drops the photo and says so
+            raise
         except Exception as e:
-            print(f"Error processing photo: {e}")
+            report_error(e)
 
+def _render_summary(document, data):
     document.add_paragraph() # Spacer
 
     # Professional Summary
     if 'objective' in data and data['objective']:
-        h = document.add_heading('PROFESSIONAL SUMMARY', level=1)
-        h.style.font.name = 'Arial'
-        h.style.font.color.rgb = None # Default black
-        p = document.add_paragraph(data['objective'])
-        p.style.font.name = 'Arial'
+        document.add_heading('PROFESSIONAL SUMMARY', level=1)
+        document.add_paragraph(data['objective'])
 
+def _render_experience(document, data):
     # Experience
     if 'experience' in data and len(data['experience']) > 0:
-        h = document.add_heading('WORK EXPERIENCE', level=1)
-        h.style.font.name = 'Arial'
-        h.style.font.color.rgb = None
+        document.add_heading('WORK EXPERIENCE', level=1)
         
         for exp in data['experience']:
             p = document.add_paragraph()
-            p.style.font.name = 'Arial'
             
             # Title and Company
-            title_run = p.add_run(f"{exp.get('title', '')}")
-            title_run.bold = True
-            title_run.font.size = Pt(12)
-            
-            company_run = p.add_run(f" | {exp.get('company', '')}")
-            company_run.bold = True
+            p.add_run(f"{exp.get('title', '')}", 'Job Title')
+            p.add_run(f" | {exp.get('company', '')}", 'Company')
             
             # Date
             if 'date' in exp:
-                p.add_run(f"\t{exp.get('date', '')}").bold = False
+                p.add_run(f"\t{exp.get('date', '')}")
             
             # Description
             if 'description' in exp:
-                desc_p = document.add_paragraph(exp.get('description', ''))
-                desc_p.style.font.name = 'Arial'
-                desc_p.paragraph_format.left_indent = Pt(10)
+                document.add_paragraph(exp.get('description', ''), 'Description')
 
+def _render_skills(document, data):
     # Skills
     if 'skills' in data and data['skills']:
-        h = document.add_heading('SKILLS', level=1)
-        h.style.font.name = 'Arial'
-        h.style.font.color.rgb = None
-        p = document.add_paragraph(data['skills'])
-        p.style.font.name = 'Arial'
+        document.add_heading('SKILLS', level=1)
+        document.add_paragraph(data['skills'])
 
+def _render_education(document, data):
     # Education
     if 'education' in data and len(data['education']) > 0:
-        h = document.add_heading('EDUCATION', level=1)
-        h.style.font.name = 'Arial'
-        h.style.font.color.rgb = None
+        document.add_heading('EDUCATION', level=1)
         
         for edu in data['education']:
             p = document.add_paragraph()
-            p.style.font.name = 'Arial'
             
-            school_run = p.add_run(f"{edu.get('school', '')}")
-            school_run.bold = True
+            p.add_run(f"{edu.get('school', '')}", 'School')
             
             if 'degree' in edu:
                 p.add_run(f" - {edu.get('degree', '')}")
@@ -134,17 +138,46 @@ def generate_ats_cv(json_path):
             if 'year' in edu:
                 p.add_run(f"\t{edu.get('year', '')}")
 
-    # Save the document
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docx')
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    output_filename = os.path.join(output_dir, 'ats_cv_output.docx')
-    document.save(output_filename)
+SECTIONS = [
+    Section('header', 'text', ('name', 'address', 'phone', 'email', 'linkedin'), _render_header),
+    # Pictures add a relationship to the document part, so they can't be reused
+    Section('photo', 'photo', ('photo',), _render_photo, cacheable=False),
+    Section('summary', 'body', ('objective',), _render_summary),
+    Section('experience', 'body', ('experience',), _render_experience),
+    Section('skills', 'body', ('skills',), _render_skills),
+    Section('education', 'body', ('education',), _render_education),
+]
+
+def _containers(document):
+    header_table = document.tables[0]
+    return {'body': document, 'text': header_table.cell(0, 0), 'photo': header_table.cell(0, 1)}
+
+# Writes the same document straight to XML, see fast_docx
+FAST_TEMPLATE = fast_docx.FastTemplate('ats-cv', _setup_ats_cv, SECTIONS, _containers)
+
+def build_ats_cv(data):
+    document = new_document('ats-cv', _setup_ats_cv)
+    containers = _containers(document)
+    render_sections(SECTIONS, containers, data, 'ats-cv')
+    ensure_paragraph(containers['text'])
+    ensure_paragraph(containers['photo'])
+    return document
+
+def render_ats_cv(data, stream=None):
+    """
+    Render the ATS CV for `data` (a payload dict or a schema.Resume) and
+    return the DOCX bytes, or write them to `stream` if one is given.
+    """
+    data = schema.view(data, 'ats-cv')
+    if fast_docx.ENABLED:
+        return FAST_TEMPLATE.render(data, stream)
+    return save_document(build_ats_cv(data), stream)
+
+def generate_ats_cv(json_path):
+    data = load_json(json_path)
+    output_filename = os.path.join(OUTPUT_DIR, 'ats_cv_output.docx')
+    write_output(render_ats_cv, data, output_filename)
     print(f"ATS CV generated successfully: {output_filename}")
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        generate_ats_cv(sys.argv[1])
-    else:
-        print("Error: No JSON file provided.")
+    sys.exit(run_cli(render_ats_cv, 'ats_cv_output.docx', 'ATS CV', name='ats-cv'))
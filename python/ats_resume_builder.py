@@ -1,17 +1,30 @@
 import sys
-import json
 import os
-from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-def generate_ats_resume(json_path):
-    # Load data
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+import fast_docx
+import schema
+from prototypes import new_document
+from sections import Section, render_sections
+from styles import Style, CHARACTER, add_styles
+from render_utils import OUTPUT_DIR, load_json, save_document, write_output, run_cli
 
-    document = Document()
-    
+# Named styles used by the content, see styles.py
+STYLES = [
+    Style('Name', size=Pt(24), bold=True, alignment=WD_ALIGN_PARAGRAPH.CENTER),
+    Style('Contact', alignment=WD_ALIGN_PARAGRAPH.CENTER),
+    Style('Job Title', size=Pt(12), bold=True, space_after=Pt(2)),
+    Style('Job Details', space_before=Pt(0), space_after=Pt(2)),
+    Style('Description', space_after=Pt(10)),
+    Style('Company', CHARACTER, bold=True),
+    Style('School', CHARACTER, bold=True),
+]
+
+def _setup_ats_resume(document):
+    """
+    Margins and styles shared by every ATS resume, built once per process.
+    """
     # Set margins (Standard 1 inch)
     sections = document.sections
     for section in sections:
@@ -26,13 +39,18 @@ def generate_ats_resume(json_path):
     font.name = 'Arial'
     font.size = Pt(11)
 
+    # Section headings: plain black Arial so ATS parsers read them as text
+    heading = document.styles['Heading 1'].font
+    heading.name = 'Arial'
+    heading.size = Pt(14)
+    heading.color.rgb = None # Black
+    heading.bold = True
+
+    add_styles(document, STYLES)
+
+def _render_header(document, data):
     # Header (Name & Contact)
-    name_p = document.add_paragraph()
-    name_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    name_run = name_p.add_run(data.get('name', 'Your Name'))
-    name_run.bold = True
-    name_run.font.size = Pt(24)
-    name_run.font.name = 'Arial'
+    document.add_paragraph(data.get('name', 'Your Name'), 'Name')
 
     # Contact Info (Single line, separated by |)
     contact_info = []
@@ -42,65 +60,51 @@ def generate_ats_resume(json_path):
     if 'linkedin' in data and data['linkedin']: contact_info.append(data['linkedin'])
     
     if contact_info:
-        contact_p = document.add_paragraph(" | ".join(contact_info))
-        contact_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        contact_p.style.font.name = 'Arial'
+        document.add_paragraph(" | ".join(contact_info), 'Contact')
 
     document.add_paragraph() # Spacer
 
-    # Helper for Section Headings
-    def add_section_heading(text):
-        h = document.add_heading(text.upper(), level=1)
-        h.style.font.name = 'Arial'
-        h.style.font.size = Pt(14)
-        h.style.font.color.rgb = None # Black
-        h.style.font.bold = True
-        # Add border bottom manually if needed, but standard heading style is usually fine for ATS
+# Helper for Section Headings
+def add_section_heading(document, text):
+    document.add_heading(text.upper(), level=1)
+    # Add border bottom manually if needed, but standard heading style is usually fine for ATS
 
+def _render_summary(document, data):
     # Professional Summary
     if 'objective' in data and data['objective']:
-        add_section_heading('Professional Summary')
-        p = document.add_paragraph(data['objective'])
-        p.style.font.name = 'Arial'
+        add_section_heading(document, 'Professional Summary')
+        document.add_paragraph(data['objective'])
 
+def _render_experience(document, data):
     # Work Experience
     if 'experience' in data and len(data['experience']) > 0:
-        add_section_heading('Work Experience')
+        add_section_heading(document, 'Work Experience')
         
         for exp in data['experience']:
             # Title
-            p_title = document.add_paragraph()
-            p_title.paragraph_format.space_after = Pt(2)
-            run_title = p_title.add_run(f"{exp.get('title', '')}")
-            run_title.bold = True
-            run_title.font.size = Pt(12)
+            document.add_paragraph(f"{exp.get('title', '')}", 'Job Title')
             
             # Company & Date line
-            p_meta = document.add_paragraph()
-            p_meta.paragraph_format.space_before = Pt(0)
-            p_meta.paragraph_format.space_after = Pt(2)
-            run_company = p_meta.add_run(f"{exp.get('company', '')}")
-            run_company.bold = True
+            p_meta = document.add_paragraph(style='Job Details')
+            p_meta.add_run(f"{exp.get('company', '')}", 'Company')
             
             if 'date' in exp:
                 p_meta.add_run(f" | {exp.get('date', '')}")
 
             # Description
             if 'description' in exp:
-                desc_p = document.add_paragraph(exp.get('description', ''))
-                desc_p.style.font.name = 'Arial'
-                desc_p.paragraph_format.space_after = Pt(10)
+                document.add_paragraph(exp.get('description', ''), 'Description')
 
+def _render_education(document, data):
     # Education (No Tables!)
     if 'education' in data and len(data['education']) > 0:
-        add_section_heading('Education')
+        add_section_heading(document, 'Education')
         
         for edu in data['education']:
             p = document.add_paragraph()
             
             # School Name
-            run_school = p.add_run(f"{edu.get('school', '')}")
-            run_school.bold = True
+            p.add_run(f"{edu.get('school', '')}", 'School')
             
             # Degree and Year
             details = []
@@ -110,23 +114,46 @@ def generate_ats_resume(json_path):
             if details:
                 p.add_run(f" | {' - '.join(details)}")
 
+def _render_skills(document, data):
     # Skills
     if 'skills' in data and data['skills']:
-        add_section_heading('Skills')
-        p = document.add_paragraph(data['skills'])
-        p.style.font.name = 'Arial'
-
-    # Save the document
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docx')
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    output_filename = os.path.join(output_dir, 'ats_resume_output.docx')
-    document.save(output_filename)
+        add_section_heading(document, 'Skills')
+        document.add_paragraph(data['skills'])
+
+SECTIONS = [
+    Section('header', 'body', ('name', 'address', 'phone', 'email', 'linkedin'), _render_header),
+    Section('summary', 'body', ('objective',), _render_summary),
+    Section('experience', 'body', ('experience',), _render_experience),
+    Section('education', 'body', ('education',), _render_education),
+    Section('skills', 'body', ('skills',), _render_skills),
+]
+
+def _containers(document):
+    return {'body': document}
+
+# Writes the same document straight to XML, see fast_docx
+FAST_TEMPLATE = fast_docx.FastTemplate('ats-resume', _setup_ats_resume, SECTIONS, _containers)
+
+def build_ats_resume(data):
+    document = new_document('ats-resume', _setup_ats_resume)
+    render_sections(SECTIONS, _containers(document), data, 'ats-resume')
+    return document
+
+def render_ats_resume(data, stream=None):
+    """
+    Render the ATS resume for `data` (a payload dict or a schema.Resume) and
+    return the DOCX bytes, or write them to `stream` if one is given.
+    """
+    data = schema.view(data, 'ats-resume')
+    if fast_docx.ENABLED:
+        return FAST_TEMPLATE.render(data, stream)
+    return save_document(build_ats_resume(data), stream)
+
+def generate_ats_resume(json_path):
+    data = load_json(json_path)
+    output_filename = os.path.join(OUTPUT_DIR, 'ats_resume_output.docx')
+    write_output(render_ats_resume, data, output_filename)
     print(f"ATS Resume generated successfully: {output_filename}")
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        generate_ats_resume(sys.argv[1])
-    else:
-        print("Error: No JSON file provided.")
+    sys.exit(run_cli(render_ats_resume, 'ats_resume_output.docx', 'ATS Resume', name='ats-resume'))
@@ -0,0 +1,332 @@
+"""
+Score resumes against job postings the way an applicant tracking system
+would: by how well their keywords match.
+
+A corpus of postings is indexed once into sparse BM25 and TF-IDF matrices
+(postings x terms) saved as .npy files. Loading an index memory-maps them,
+so it is instant and every process on the host shares the same pages.
+Resumes are tokenized from their normalized skills, summary and experience
+descriptions (see schema.py) and scored with sparse matrix products, so
+one resume against thousands of postings, or thousands of resumes against
+one posting, is a single vectorized operation.
+
+    python ats_score.py build postings.jsonl -o ats_index
+    python ats_score.py rank ats_index resume.json --top 10
+    python ats_score.py match ats_index --posting backend-42 resumes/*.json
+    python ats_score.py match ats_index --posting-file job.txt resumes/*.json --method tfidf
+
+Postings are JSON lines with "id", "text" and optionally "title", or a
+directory of .txt files (the file name is the id). BM25 scores are
+unbounded and only comparable within one ranking; TF-IDF scores are cosine
+similarities between 0 and 1.
+
+Needs NumPy and SciPy (see txt/requirements.txt).
+"""
+import sys
+import os
+import re
+import json
+import argparse
+
+import numpy as np
+from scipy import sparse
+
+import schema
+
+INDEX_VERSION = 1
+METHODS = ('bm25', 'tfidf')
+
+# BM25 term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+# Longer tokens are cut, which keeps the fixed-width term array small
+MAX_TERM_LENGTH = 32
+
+# Keeps "c++", "c#", "node.js" and "ci/cd" whole, without trailing punctuation
+_TOKEN = re.compile(r"[a-z0-9](?:[a-z0-9+#./-]*[a-z0-9+#])?")
+_STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been being but by can could did do does doing down
+during each few for from further had has have having he her here hers him his how i if in into is it its
+itself just me more most my no nor not of off on once only or other our ours out over own same she should
+so some such than that the their theirs them then there these they this those through to too under until
+up very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+def tokenize(text):
+    """
+    Lowercase keyword tokens of `text`, without stopwords.
+    """
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+def resume_text(data):
+    """
+    The text of a resume that is matched against postings: skills, summary
+    and experience titles and descriptions. `data` is a payload dict or a
+    schema.Resume.
+    """
+    resume = schema.parse(data)
+    parts = [skill.name for skill in resume.skills or ()]
+    if resume.summary:
+        parts.append(resume.summary)
+    for entry in resume.experience or ():
+        parts.extend(text for text in (entry.title, entry.description) if text)
+    return '\n'.join(parts)
+
+# Index building
+
+def read_postings(path):
+    """
+    Yield (id, title, text) for every posting in a JSON lines file or a
+    directory of .txt files.
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.txt'):
+                with open(os.path.join(path, name), encoding='utf-8') as f:
+                    yield name[:-len('.txt')], name[:-len('.txt')], f.read()
+        return
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            posting_id = str(record.get('id', number))
+            yield posting_id, record.get('title', posting_id), record['text']
+
+def _tf_matrix(column_lists, width):
+    """
+    Term counts as a CSR matrix with one row per array of term columns
+    (one entry per occurrence).
+    """
+    indptr = [0]
+    indices = []
+    counts = []
+    for columns in column_lists:
+        row_columns, row_counts = np.unique(np.asarray(columns, dtype=np.int32), return_counts=True)
+        indices.append(row_columns)
+        counts.append(row_counts)
+        indptr.append(indptr[-1] + len(row_columns))
+    return sparse.csr_matrix((np.concatenate(counts).astype(np.float32), np.concatenate(indices),
+                              np.array(indptr, dtype=np.int64)), shape=(len(column_lists), width))
+
+def _bm25_weights(tf, idf, avgdl):
+    lengths = np.asarray(tf.sum(axis=1)).ravel()
+    weights = tf.copy()
+    row_lengths = np.repeat(lengths, np.diff(tf.indptr))
+    counts = weights.data
+    weights.data = (idf[weights.indices] * counts * (K1 + 1)
+                    / (counts + K1 * (1 - B + B * row_lengths / avgdl))).astype(np.float32)
+    return weights
+
+def _tfidf_weights(tf, idf):
+    weights = tf.copy()
+    weights.data = ((1 + np.log(weights.data)) * idf[weights.indices]).astype(np.float32)
+    return _normalize_rows(weights)
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32)
+
+def build_index(postings, output_dir):
+    """
+    Index `postings` ((id, title, text) tuples) into `output_dir`. Returns
+    the number of postings indexed.
+    """
+    ids, titles, token_lists = [], [], []
+    for posting_id, title, text in postings:
+        ids.append(posting_id)
+        titles.append(title)
+        token_lists.append(tokenize(text))
+    if not ids:
+        raise ValueError("No postings to index")
+
+    terms = sorted({token for tokens in token_lists for token in tokens})
+    if not terms:
+        raise ValueError("No terms to index: the postings are empty or only stopwords")
+    column_of = {term: column for column, term in enumerate(terms)}
+    tf = _tf_matrix([[column_of[token] for token in tokens] for tokens in token_lists], len(terms))
+
+    document_frequency = np.bincount(tf.indices, minlength=len(terms))
+    count = len(ids)
+    idf = np.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+    avgdl = float(tf.sum()) / count
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'terms.npy'), np.array(terms, dtype=f'<U{MAX_TERM_LENGTH}'))
+    np.save(os.path.join(output_dir, 'idf.npy'), idf)
+    for method, weights in (('bm25', _bm25_weights(tf, idf, avgdl)), ('tfidf', _tfidf_weights(tf, idf))):
+        for part in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(output_dir, f'{method}.{part}.npy'), getattr(weights, part))
+    with open(os.path.join(output_dir, 'postings.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': INDEX_VERSION, 'avgdl': avgdl, 'ids': ids, 'titles': titles}, f)
+    return count
+
+# Scoring
+
+class Index:
+    """
+    A memory-mapped posting index written by build_index().
+    """
+    def __init__(self, path):
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode='r')
+
+        with open(os.path.join(path, 'postings.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"{path} was built by another version of ats_score.py, rebuild it")
+        self.path = path
+        self.ids = meta['ids']
+        self.titles = meta['titles']
+        self.avgdl = meta['avgdl']
+        self.terms = load('terms.npy')
+        self.idf = load('idf.npy')
+        shape = (len(self.ids), len(self.terms))
+        self.weights = {method: sparse.csr_matrix((load(f'{method}.data.npy'), load(f'{method}.indices.npy'),
+                                                   load(f'{method}.indptr.npy')), shape=shape, copy=False)
+                        for method in METHODS}
+
+    def columns(self, tokens):
+        """
+        Columns of the `tokens` and a mask of which are in the vocabulary
+        (the column of an unknown token is meaningless).
+        """
+        candidates = np.array(tokens, dtype=f'<U{MAX_TERM_LENGTH}')
+        if not len(self.terms):
+            return np.zeros(len(candidates), dtype=np.intp), np.zeros(len(candidates), dtype=bool)
+        positions = np.searchsorted(self.terms, candidates)
+        positions[positions == len(self.terms)] = 0
+        return positions, self.terms[positions] == candidates
+
+    def query_matrix(self, texts, method='bm25'):
+        """
+        One row per text: BM25 queries weigh every distinct known term 1,
+        TF-IDF queries by its idf and normalize the row.
+        """
+        token_lists = [tokenize(text) for text in texts]
+        rows = np.repeat(np.arange(len(token_lists), dtype=np.int64), [len(tokens) for tokens in token_lists])
+        columns, known = self.columns([token for tokens in token_lists for token in tokens])
+        # Distinct (row, column) pairs, in row then column order
+        keys = np.unique(rows[known] * len(self.terms) + columns[known])
+        rows, indices = np.divmod(keys, len(self.terms))
+        indptr = np.searchsorted(rows, np.arange(len(token_lists) + 1))
+        indices = indices.astype(np.int32)
+        data = np.ones(len(indices), dtype=np.float32) if method == 'bm25' else self.idf[indices]
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(token_lists), len(self.terms)))
+        return matrix if method == 'bm25' else _normalize_rows(matrix)
+
+    def posting_vector(self, posting_id=None, text=None, method='bm25'):
+        """
+        Weights of an indexed posting, or of the `text` of another one, as
+        a 1 x terms sparse row.
+        """
+        if text is None:
+            row = self.ids.index(posting_id)
+            return self.weights[method][row:row + 1]
+        columns, known = self.columns(tokenize(text))
+        tf = _tf_matrix([columns[known]], len(self.terms))
+        if method == 'bm25':
+            return _bm25_weights(tf, np.asarray(self.idf), self.avgdl)
+        return _tfidf_weights(tf, np.asarray(self.idf))
+
+_indexes = {}
+
+def load_index(path):
+    """
+    The Index at `path`, loaded once per process.
+    """
+    path = os.path.abspath(path)
+    if path not in _indexes:
+        _indexes[path] = Index(path)
+    return _indexes[path]
+
+def _top(scores, top):
+    if top >= len(scores):
+        order = np.argsort(-scores, kind='stable')
+    else:
+        best = np.argpartition(-scores, top)[:top]
+        order = best[np.argsort(-scores[best], kind='stable')]
+    return [(int(i), float(scores[i])) for i in order]
+
+def score_postings(index, resumes, method='bm25'):
+    """
+    Scores of every resume (payload dicts or schema.Resume) against every
+    posting, as a resumes x postings array.
+    """
+    queries = index.query_matrix([resume_text(resume) for resume in resumes], method)
+    return (queries @ index.weights[method].T).toarray()
+
+def rank_postings(index, resume, top=10, method='bm25'):
+    """
+    The `top` postings for one resume: [(posting id, title, score)].
+    """
+    scores = score_postings(index, [resume], method)[0]
+    return [(index.ids[row], index.titles[row], score) for row, score in _top(scores, top)]
+
+def rank_resumes(index, resumes, posting_id=None, top=10, method='bm25', posting_text=None):
+    """
+    The `top` of `resumes` for one posting - `posting_id` in the index, or
+    `posting_text` for another one: [(position in resumes, score)].
+    """
+    queries = index.query_matrix([resume_text(resume) for resume in resumes], method)
+    posting = index.posting_vector(posting_id, posting_text, method)
+    scores = (queries @ posting.T).toarray().ravel()
+    return _top(scores, top)
+
+# Command line
+
+def _load_resume(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score resumes against job postings by keyword match.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Index a corpus of postings.")
+    build.add_argument('postings', help="JSON lines file or directory of .txt postings.")
+    build.add_argument('-o', '--output', default='ats_index', help="Index directory (default: ats_index).")
+
+    rank = commands.add_parser('rank', help="Rank the indexed postings for a resume.")
+    rank.add_argument('index')
+    rank.add_argument('resume', help="Resume payload JSON.")
+
+    match = commands.add_parser('match', help="Rank resumes for one posting.")
+    match.add_argument('index')
+    match.add_argument('resumes', nargs='+', help="Resume payload JSON files.")
+    posting = match.add_mutually_exclusive_group(required=True)
+    posting.add_argument('--posting', help="Id of an indexed posting.")
+    posting.add_argument('--posting-file', help="Text file with a posting that isn't indexed.")
+
+    for command in (rank, match):
+        command.add_argument('-n', '--top', type=int, default=10, help="Results to show (default: 10).")
+        command.add_argument('-m', '--method', choices=METHODS, default='bm25', help="Scoring (default: bm25).")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build_index(read_postings(args.postings), args.output)
+        print(f"Indexed {count} postings into {args.output}")
+        return 0
+
+    index = load_index(args.index)
+    if args.command == 'rank':
+        for posting_id, title, score in rank_postings(index, _load_resume(args.resume), args.top, args.method):
+            print(f"{score:10.4f}  {posting_id}  {title}")
+        return 0
+
+    posting_text = None
+    if args.posting_file:
+        with open(args.posting_file, encoding='utf-8') as f:
+            posting_text = f.read()
+    elif args.posting not in index.ids:
+        print(f"Unknown posting '{args.posting}'", file=sys.stderr)
+        return 1
+    resumes = [_load_resume(path) for path in args.resumes]
+    for position, score in rank_resumes(index, resumes, args.posting, args.top, args.method, posting_text):
+        print(f"{score:10.4f}  {args.resumes[position]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Check that generated ATS documents read back the way an applicant tracking
+system would read them.
+
+An ATS sees a document as a flat sequence of paragraphs. This reads that
+sequence straight out of word/document.xml in the zip with iterparse,
+without python-docx, and compares it with what the builder should have
+written for the payload: the name, the contact line, the section headings
+and every entry, in order, with nothing lost and nothing inside a table that
+shouldn't be (the ATS CV keeps its header in a layout table by design).
+
+Point it at a batch_render.py input and its output (a directory or a .zip
+with the manifest next to it); the documents are checked in a process pool
+and every one gets a line in a JSONL report:
+
+    python ats_verify.py class.jsonl out.zip
+    python ats_verify.py class.jsonl out/ --report verify.jsonl -j 8
+
+Documents of other builders are skipped.
+"""
+import sys
+import os
+import io
+import json
+import time
+import zipfile
+import argparse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import schema
+from batch_render import iter_records, unpack_record, _chunks
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_P, _T, _TAB, _BR, _CR, _TBL = (_W + tag for tag in ('p', 't', 'tab', 'br', 'cr', 'tbl'))
+
+def read_paragraphs(docx):
+    """
+    The text of every non-empty paragraph of a DOCX (a path or file
+    object) in reading order, as (text, inside a table) pairs. Tabs and
+    line breaks come back as '\\t' and '\\n'.
+    """
+    paragraphs = []
+    pieces = []
+    with zipfile.ZipFile(docx) as package, package.open('word/document.xml') as document:
+        # End events only, which halves the work; a table marks the
+        # paragraphs it held when it ends
+        for _, element in ET.iterparse(document):
+            tag = element.tag
+            if tag == _T:
+                pieces.append(element.text or '')
+            elif tag == _TAB:
+                pieces.append('\t')
+            elif tag == _BR or tag == _CR:
+                pieces.append('\n')
+            elif tag == _P:
+                element.clear()
+                if pieces:
+                    paragraphs.append([''.join(pieces), False])
+                    pieces = []
+                    element.text = 'x'
+            elif tag == _TBL:
+                held = sum(1 for paragraph in element.iter(_P) if paragraph.text)
+                for paragraph in paragraphs[len(paragraphs) - held:]:
+                    paragraph[1] = True
+                element.clear()
+    return [tuple(paragraph) for paragraph in paragraphs]
+
+# What each builder writes, as (text, inside a table) pairs in reading order.
+# These follow the builders' _render_* functions; a change to the text they
+# write has to be made here as well.
+
+def _contact_line(data):
+    return ' | '.join(data[key] for key in ('address', 'phone', 'email', 'linkedin') if data.get(key))
+
+def _expected_ats_resume(data):
+    lines = [data.get('name', 'Your Name'), _contact_line(data)]
+    if data.get('objective'):
+        lines += ['PROFESSIONAL SUMMARY', data['objective']]
+    if data.get('experience'):
+        lines.append('WORK EXPERIENCE')
+        for entry in data['experience']:
+            lines.append(entry.get('title', ''))
+            lines.append(entry.get('company', '') + (f" | {entry['date']}" if 'date' in entry else ''))
+            if 'description' in entry:
+                lines.append(entry['description'])
+    if data.get('education'):
+        lines.append('EDUCATION')
+        for entry in data['education']:
+            details = [entry[key] for key in ('degree', 'year') if key in entry]
+            lines.append(entry.get('school', '') + (f" | {' - '.join(details)}" if details else ''))
+    if data.get('skills'):
+        lines += ['SKILLS', data['skills']]
+    return [(line, False) for line in lines]
+
+def _expected_ats_cv(data):
+    header = [(data.get('name', 'Your Name'), True), (_contact_line(data), True)]
+    lines = []
+    if data.get('objective'):
+        lines += ['PROFESSIONAL SUMMARY', data['objective']]
+    if data.get('experience'):
+        lines.append('WORK EXPERIENCE')
+        for entry in data['experience']:
+            lines.append(f"{entry.get('title', '')} | {entry.get('company', '')}"
+                         + (f"\t{entry['date']}" if 'date' in entry else ''))
+            if 'description' in entry:
+                lines.append(entry['description'])
+    if data.get('skills'):
+        lines += ['SKILLS', data['skills']]
+    if data.get('education'):
+        lines.append('EDUCATION')
+        for entry in data['education']:
+            lines.append(entry.get('school', '')
+                         + (f" - {entry['degree']}" if 'degree' in entry else '')
+                         + (f"\t{entry['year']}" if 'year' in entry else ''))
+    return header + [(line, False) for line in lines]
+
+EXPECTED = {
+    'ats-resume': _expected_ats_resume,
+    'ats-cv': _expected_ats_cv,
+}
+
+def expected_paragraphs(builder, data):
+    """
+    The non-empty paragraphs `builder` writes for `data`, as (text, inside
+    a table) pairs.
+    """
+    lines = EXPECTED[builder](schema.view(data, builder))
+    # Word has no carriage returns: both \r and \n are written as breaks
+    return [(text.replace('\r', '\n'), table) for text, table in lines if text]
+
+def _shorten(text):
+    return repr(text if len(text) <= 60 else text[:57] + '...')
+
+def _describe(paragraph):
+    text, table = paragraph
+    return _shorten(text) + (' (in a table)' if table else '')
+
+def verify(docx, builder, data):
+    """
+    Problems with how the `builder` document `docx` (a path or file object)
+    for `data` reads back, or an empty list if it reads back exactly.
+    """
+    expected = expected_paragraphs(builder, data)
+    try:
+        found = read_paragraphs(docx)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        return [f"unreadable: {type(e).__name__}: {e}"]
+    problems = []
+    for position, (want, got) in enumerate(zip(expected, found)):
+        if want == got:
+            continue
+        if want[0] == got[0]:
+            where = 'inside' if got[1] else 'outside'
+            problems.append(f"paragraph {position + 1} {_shorten(got[0])} is {where} a table")
+            continue
+        problems.append(f"paragraph {position + 1}: expected {_describe(want)}, found {_describe(got)}")
+        return problems  # everything after is shifted
+    if len(found) < len(expected):
+        problems.append(f"missing from paragraph {len(found) + 1}: {_describe(expected[len(found)])}")
+    elif len(found) > len(expected):
+        problems.append(f"unexpected from paragraph {len(expected) + 1}: {_describe(found[len(expected)])}")
+    return problems
+
+# Batch verification
+
+def read_manifest(path):
+    """
+    {record index: manifest entry} for the documents a batch wrote.
+    """
+    entries = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if entry.get('ok'):
+                    entries[entry['index']] = entry
+    return entries
+
+class _Outputs:
+    """
+    Opens the documents of a batch output directory or zip.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path) if path.lower().endswith('.zip') else None
+
+    def read(self, name):
+        if self.zip is not None:
+            return self.zip.read(name)
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+_outputs = None
+
+def _init_worker(output):
+    global _outputs
+    _outputs = _Outputs(output)
+
+def _verify_chunk(jobs):
+    """
+    Worker side: verify a list of (manifest entry, payload) and return the
+    report entry of each.
+    """
+    results = []
+    for entry, payload in jobs:
+        try:
+            problems = verify(io.BytesIO(_outputs.read(entry['output'])), entry['builder'], payload)
+        except (OSError, KeyError, ValueError) as e:
+            problems = [f"{type(e).__name__}: {e}"]
+        results.append({'index': entry['index'], 'id': entry.get('id'), 'builder': entry['builder'],
+                        'output': entry['output'], 'ok': not problems, 'problems': problems})
+    return results
+
+def run_verify(source, output, report, manifest=None, workers=None, chunk_size=64):
+    """
+    Verify the ATS documents of a batch: `source` is the batch_render.py
+    input and `output` its output directory or zip. Writes a report line per
+    document to `report` and returns {'passed': n, 'failed': n, 'skipped': n}.
+    """
+    if manifest is None:
+        manifest = os.path.splitext(output)[0] + '.manifest.jsonl' if output.lower().endswith('.zip') \
+            else os.path.join(output, 'manifest.jsonl')
+    entries = read_manifest(manifest)
+    counts = {'passed': 0, 'failed': 0, 'skipped': 0}
+
+    def jobs():
+        for index, record, error in iter_records(source):
+            entry = entries.get(index)
+            if error or entry is None:
+                continue  # not rendered, the manifest says why
+            if entry['builder'] not in EXPECTED:
+                counts['skipped'] += 1
+                continue
+            yield entry, unpack_record(record, entry['builder'])[2]
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                             initializer=_init_worker, initargs=(output,)) as pool:
+        for results in pool.map(_verify_chunk, _chunks(jobs(), chunk_size)):
+            for result in results:
+                counts['passed' if result['ok'] else 'failed'] += 1
+                report.write(json.dumps(result) + '\n')
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that a batch of ATS documents reads back as rendered.")
+    parser.add_argument('input', help="The batch_render.py input: JSONL file or directory of .json files.")
+    parser.add_argument('output', help="The batch_render.py output directory or .zip.")
+    parser.add_argument('-m', '--manifest', help="The batch manifest (default: where batch_render.py puts it).")
+    parser.add_argument('-r', '--report', help="Report path (default: <output>.verify.jsonl).")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Documents sent to a worker at a time.")
+    args = parser.parse_args(argv)
+
+    report_path = args.report or os.path.splitext(args.output.rstrip('/\\'))[0] + '.verify.jsonl'
+    start = time.perf_counter()
+    with open(report_path, 'w') as report:
+        counts = run_verify(args.input, args.output, report, args.manifest, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    total = counts['passed'] + counts['failed']
+    print(f"Verified {total} documents in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f}/s): "
+          f"{counts['passed']} passed, {counts['failed']} failed, {counts['skipped']} skipped, "
+          f"report: {report_path}")
+    return 1 if counts['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
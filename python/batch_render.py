@@ -0,0 +1,249 @@
+"""
+Render many documents in one go, e.g. a whole graduating class.
+
+Input is a JSONL file (one record per line, '-' for stdin) or a directory of
+*.json files. A record is either a bare payload, rendered with --builder (or
+its own "builder" key), or an envelope:
+
+    {"id": "jane-doe", "builder": "ats-resume", "data": {...}}
+
+Records are rendered in a process pool in chunks, with a bounded number of
+chunks in flight, and the documents are written to a directory or a .zip as
+they finish, so memory stays flat however large the batch is. Every record
+gets one line in a JSONL manifest with its outcome.
+
+    python batch_render.py class_of_2025.jsonl -o out.zip --builder ats-resume
+"""
+import sys
+import os
+import re
+import json
+import time
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import registry
+import render_utils
+
+def iter_records(source):
+    """
+    Yield (index, record, error) for every input record without loading the
+    whole input. `error` is set when a record can't be parsed.
+    """
+    if source != '-' and os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.endswith('.json'))
+        for index, name in enumerate(names):
+            try:
+                with open(os.path.join(source, name), 'r') as f:
+                    record = json.load(f)
+                if isinstance(record, dict) and 'data' not in record:
+                    record.setdefault('id', os.path.splitext(name)[0])
+                yield index, record, None
+            except (OSError, ValueError) as e:
+                yield index, {'id': os.path.splitext(name)[0]}, f"{type(e).__name__}: {e}"
+        return
+
+    stream = sys.stdin if source == '-' else open(source, 'r')
+    try:
+        index = 0
+        # Records are numbered without the blank lines, errors point at the file's lines
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line), None
+            except ValueError as e:
+                yield index, {}, f"Invalid JSON on line {line_number}: {e}"
+            index += 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def unpack_record(record, default_builder):
+    """
+    Split a record into (id, builder name, payload).
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+    if isinstance(record.get('data'), dict):
+        payload = record['data']
+    else:
+        payload = record
+    builder = record.get('builder') or default_builder
+    if not builder:
+        raise ValueError("No builder given for record (use --builder or a 'builder' key)")
+    registry.get_builder(builder)
+    return record.get('id'), builder, payload
+
+def _render_chunk(jobs):
+    """
+    Worker side: render a list of (index, builder, payload) and return
+    (index, ok, docx bytes or error message, milliseconds) for each.
+    """
+    results = []
+    for index, builder, payload in jobs:
+        start = time.perf_counter()
+        try:
+            docx_bytes = registry.get_builder(builder).render(payload)
+            results.append((index, True, docx_bytes, (time.perf_counter() - start) * 1000))
+        except Exception as e:
+            results.append((index, False, f"{type(e).__name__}: {e}", (time.perf_counter() - start) * 1000))
+    return results
+
+class DirectorySink:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), 'wb') as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+class ZipSink:
+    def __init__(self, path):
+        # DOCX files are already deflated, so store them as-is
+        self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+
+    def write(self, name, data):
+        self.zip.writestr(name, data)
+
+    def close(self):
+        self.zip.close()
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9._-]+')
+
+class BatchRun:
+    """
+    Tracks in-flight records and writes results to the sink and manifest as
+    they complete.
+    """
+
+    def __init__(self, sink, manifest):
+        self.sink = sink
+        self.manifest = manifest
+        self.in_flight = {}
+        self.used_names = set()
+        self.succeeded = 0
+        self.failed = 0
+
+    def output_name(self, index, record_id, builder):
+        stem = _UNSAFE_CHARS.sub('_', str(record_id)).strip('._') if record_id is not None else ''
+        name = f"{stem or f'{index:06d}'}-{builder}.docx"
+        if name in self.used_names:
+            name = f"{index:06d}-{name}"
+        self.used_names.add(name)
+        return name
+
+    def record(self, entry):
+        if entry['ok']:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self.manifest.write(json.dumps(entry) + '\n')
+
+    def fail(self, index, record_id, builder, error):
+        self.record({'index': index, 'id': record_id, 'builder': builder, 'ok': False, 'error': error})
+
+    def collect(self, results):
+        for index, ok, value, elapsed_ms in results:
+            record_id, builder = self.in_flight.pop(index)
+            entry = {'index': index, 'id': record_id, 'builder': builder, 'ok': ok, 'ms': round(elapsed_ms, 2)}
+            if ok:
+                name = self.output_name(index, record_id, builder)
+                self.sink.write(name, value)
+                entry.update({'output': name, 'bytes': len(value)})
+            else:
+                entry['error'] = value
+            self.record(entry)
+
+def _chunks(records, size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _init_worker(compression_level):
+    if compression_level is not None:
+        render_utils.COMPRESSION_LEVEL = compression_level
+    registry.warm_up()
+
+def run_batch(source, sink, manifest, default_builder=None, workers=None, chunk_size=16, compression_level=None):
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    run = BatchRun(sink, manifest)
+    pending = set()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(compression_level,)) as pool:
+        for chunk in _chunks(iter_records(source), chunk_size):
+            jobs = []
+            for index, record, error in chunk:
+                record_id = record.get('id') if isinstance(record, dict) else None
+                if error:
+                    run.fail(index, record_id, None, error)
+                    continue
+                try:
+                    record_id, builder, payload = unpack_record(record, default_builder)
+                except ValueError as e:
+                    run.fail(index, record_id, None, str(e))
+                    continue
+                run.in_flight[index] = (record_id, builder)
+                jobs.append((index, builder, payload))
+
+            if jobs:
+                pending.add(pool.submit(_render_chunk, jobs))
+            # Don't read further ahead than the pool can use
+            while len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    run.collect(future.result())
+
+        for future in wait(pending).done:
+            run.collect(future.result())
+
+    return run
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a batch of resumes/CVs from JSONL or a directory of JSON files.")
+    parser.add_argument('input', help="JSONL file, directory of .json files, or '-' for JSONL on stdin.")
+    parser.add_argument('-o', '--output', required=True, help="Output directory, or a path ending in .zip.")
+    parser.add_argument('-b', '--builder', choices=sorted(registry.BUILDERS),
+                        help="Builder for records that don't name one.")
+    parser.add_argument('-m', '--manifest', help="Manifest path (default: manifest.jsonl in the output "
+                                                 "directory, or <output>.manifest.jsonl next to a zip).")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('--chunk-size', type=int, default=16, help="Records sent to a worker at a time.")
+    parser.add_argument('--compression-level', type=int, choices=range(-1, 10), metavar='LEVEL',
+                        help="Zip compression of the documents: 0 stores, 1 is fastest, 9 smallest.")
+    args = parser.parse_args(argv)
+
+    is_zip = args.output.lower().endswith('.zip')
+    manifest_path = args.manifest
+    if not manifest_path:
+        manifest_path = os.path.splitext(args.output)[0] + '.manifest.jsonl' if is_zip \
+            else os.path.join(args.output, 'manifest.jsonl')
+
+    sink = ZipSink(args.output) if is_zip else DirectorySink(args.output)
+    start = time.perf_counter()
+    try:
+        with open(manifest_path, 'w') as manifest:
+            run = run_batch(args.input, sink, manifest, args.builder, args.workers, args.chunk_size,
+                            args.compression_level)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - start
+    total = run.succeeded + run.failed
+    print(f"Rendered {run.succeeded}/{total} documents in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.1f}/s), manifest: {manifest_path}")
+    return 1 if run.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
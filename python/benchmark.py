@@ -0,0 +1,325 @@
+"""
+Benchmark every builder across synthetic payloads.
+
+Payloads vary along three axes:
+
+    entries   number of experience and education entries (0, 10, 100, 1000)
+    skills    a comma separated string, a list of names, or {name, level} objects
+    photo     none, ~100 KB or ~5 MB (needs Pillow to generate)
+
+Each builder renders each payload once untimed, which builds what a
+long-running worker keeps for the template (its prototype and its compressed
+package plan), then --repeat times with the section, photo, compressed media
+and font subset caches cleared, so every timed run processes the whole
+payload, photo included. Reported per case: median and minimum wall time,
+peak Python allocations (tracemalloc, measured in a separate render), the
+process's peak RSS during the case and the output size. A case that fails is
+recorded as an error rather than stopping the run, and makes the run exit
+with 1: every builder should render every case.
+
+    python benchmark.py -o baseline.json
+    python benchmark.py --compare baseline.json --entries 0 10 100
+    python benchmark.py --embed-fonts Arial -o embedded.json
+
+With --embed-fonts (see fonts.py) the wall time and output size include the
+embedded font subsets; compare against a run without it for their cost.
+
+Comparing reruns the cases in the baseline (or the ones selected) and exits
+with 1 if any fails or got slower, hungrier or bigger than the thresholds
+allow. Cases that failed in the baseline have nothing to compare against.
+"""
+import sys
+import base64
+import io
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import registry
+import sections
+import photos
+import render_utils
+import fast_docx
+import fonts
+
+ENTRY_COUNTS = (0, 10, 100, 1000)
+SKILL_SHAPES = ('string', 'list', 'objects')
+PHOTO_SIZES = {'none': 0, '100k': 100 * 1024, '5m': 5 * 1024 * 1024}
+
+SKILL_NAMES = ['Python', 'SQL', 'Docker', 'Kubernetes', 'React', 'Go', 'Terraform', 'Leadership',
+               'Public speaking', 'Data analysis', 'Machine learning', 'Technical writing']
+
+# --- Synthetic payloads ---
+
+def make_photo(size_bytes, seed=0):
+    """
+    A data URL of a PNG close to `size_bytes`. Random pixels barely
+    compress, so the file is roughly width * height * 3 bytes.
+    """
+    side = max(8, int((size_bytes / 3) ** 0.5))
+    pixels = random.Random(seed).randbytes(side * side * 3)
+    output = io.BytesIO()
+    Image.frombytes('RGB', (side, side), pixels).save(output, format='PNG', compress_level=1)
+    return 'data:image/png;base64,' + base64.b64encode(output.getvalue()).decode('ascii')
+
+def make_skills(shape, count=len(SKILL_NAMES)):
+    names = SKILL_NAMES[:count]
+    if shape == 'string':
+        return ', '.join(names)
+    if shape == 'list':
+        return names
+    return [{'name': name, 'level': 40 + (i * 7) % 60} for i, name in enumerate(names)]
+
+def make_payload(entries, skills, photo=None, seed=0):
+    """
+    A payload that fills in the fields of every builder.
+    """
+    rng = random.Random(seed)
+    words = ['built', 'led', 'designed', 'shipped', 'scaled', 'migrated', 'automated', 'reduced', 'improved',
+             'the', 'platform', 'pipeline', 'service', 'team', 'latency', 'costs', 'by', '40%', 'across', 'regions']
+
+    def sentence(length):
+        return ' '.join(rng.choice(words) for _ in range(length)).capitalize() + '.'
+
+    data = {
+        'name': 'Alex Example',
+        'title': 'Senior Software Engineer',
+        'jobTitle': 'Senior Software Engineer',
+        'email': 'alex@example.com',
+        'phone': '+1 555 0100',
+        'address': '1 Example Street, Springfield',
+        'location': 'Springfield',
+        'linkedin': 'linkedin.com/in/alex-example',
+        'objective': sentence(40),
+        'summary': sentence(40),
+        'languages': 'English, Spanish',
+        'hobbies': 'Climbing, Chess',
+        'skills': make_skills(skills),
+        'experience': [{
+            'title': f'Engineer {i + 1}',
+            'company': f'Company {i + 1}',
+            'date': f'{2000 + i % 25} - {2001 + i % 25}',
+            'description': sentence(30),
+        } for i in range(entries)],
+        'education': [{
+            'degree': f'Degree {i + 1}',
+            'school': f'University {i + 1}',
+            'year': str(2000 + i % 25),
+        } for i in range(entries)],
+    }
+    if photo:
+        data['photo'] = photo
+    return data
+
+def iter_cases(builders, entry_counts, skill_shapes, photo_sizes):
+    """
+    Yield (case id, builder name, axes dict, payload) for every combination.
+    Payloads are built once and shared by the builders.
+    """
+    photo_cache = {}
+    for entries in entry_counts:
+        for skills in skill_shapes:
+            for photo in photo_sizes:
+                if photo != 'none' and photo not in photo_cache:
+                    photo_cache[photo] = make_photo(PHOTO_SIZES[photo])
+                data = make_payload(entries, skills, photo_cache.get(photo))
+                for builder in builders:
+                    axes = {'entries': entries, 'skills': skills, 'photo': photo}
+                    yield f"{builder}/entries={entries},skills={skills},photo={photo}", builder, axes, data
+
+# --- Measuring ---
+
+def _clear_caches():
+    sections.clear_cache()
+    photos.clear_cache()
+    render_utils.clear_media_cache()
+    fonts.clear_cache()
+
+def _reset_peak_rss():
+    # Linux only: lets VmHWM measure this case rather than the whole run
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    return None
+
+def measure(render, data, repeat):
+    """
+    Render `data` once to warm the template up, time `repeat` renders of it
+    with the payload caches cleared, then measure peak allocations in one
+    more. Returns the result dict for a case.
+    """
+    render(data)
+    _reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        _clear_caches()
+        start = time.perf_counter()
+        body = render(data)
+        times.append((time.perf_counter() - start) * 1000)
+
+    _clear_caches()
+    tracemalloc.start()
+    try:
+        render(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_ms': {'median': round(statistics.median(times), 3), 'min': round(min(times), 3)},
+        'tracemalloc_peak_kb': round(peak / 1024, 1),
+        'rss_peak_kb': _peak_rss_kb(),
+        'output_bytes': len(body),
+    }
+
+def run(cases, repeat, progress=None):
+    results = {}
+    for case_id, builder, axes, data in cases:
+        render = registry.get_builder(builder).render
+        try:
+            result = measure(render, data, repeat)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        results[case_id] = {'builder': builder, **axes, **result}
+        if progress:
+            progress(case_id, results[case_id])
+    return results
+
+# --- Baselines ---
+
+def environment():
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'fast_path': fast_docx.ENABLED,
+        'embedded_fonts': dict(fonts.FAMILIES),
+    }
+
+def compare(baseline, results, time_threshold, memory_threshold, size_threshold):
+    """
+    Return a list of (case id, message) for every regression of `results`
+    against `baseline` (both case id -> result dicts). A case that fails is
+    a regression even if it failed in the baseline too.
+    """
+    regressions = []
+    for case_id, new in results.items():
+        old = baseline.get(case_id)
+        if old is None:
+            continue
+        if 'error' in new:
+            regressions.append((case_id, f"{'still' if 'error' in old else 'now'} fails: {new['error']}"))
+            continue
+        if 'error' in old:
+            continue
+        checks = (
+            ('wall time', old['wall_ms']['median'], new['wall_ms']['median'], time_threshold, 'ms'),
+            ('tracemalloc peak', old['tracemalloc_peak_kb'], new['tracemalloc_peak_kb'], memory_threshold, 'KB'),
+            ('output size', old['output_bytes'], new['output_bytes'], size_threshold, 'B'),
+        )
+        for label, before, after, threshold, unit in checks:
+            if before and after > before * (1 + threshold):
+                regressions.append((case_id, f"{label} {before:g}{unit} -> {after:g}{unit} "
+                                             f"(+{(after / before - 1) * 100:.0f}%)"))
+    return regressions
+
+def _print_result(case_id, result):
+    if 'error' in result:
+        print(f"{case_id:<60} error: {result['error']}")
+        return
+    print(f"{case_id:<60} {result['wall_ms']['median']:>9.1f}ms {result['tracemalloc_peak_kb']:>9.0f}KB "
+          f"{result['output_bytes']:>9}B")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the document builders on synthetic payloads.")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file (e.g. a new baseline).")
+    parser.add_argument('--compare', metavar='BASELINE', help="Compare against a baseline JSON file and "
+                                                              "exit with 1 on regressions.")
+    parser.add_argument('-b', '--builders', nargs='+', choices=sorted(registry.BUILDERS),
+                        default=sorted(registry.BUILDERS))
+    parser.add_argument('--entries', nargs='+', type=int, default=list(ENTRY_COUNTS))
+    parser.add_argument('--skills', nargs='+', choices=SKILL_SHAPES, default=list(SKILL_SHAPES))
+    parser.add_argument('--photos', nargs='+', choices=sorted(PHOTO_SIZES), default=list(PHOTO_SIZES))
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="Timed renders per case (default: 3).")
+    parser.add_argument('--time-threshold', type=float, default=0.15,
+                        help="Allowed relative wall time increase (default: 0.15).")
+    parser.add_argument('--memory-threshold', type=float, default=0.15,
+                        help="Allowed relative tracemalloc peak increase (default: 0.15).")
+    parser.add_argument('--size-threshold', type=float, default=0.02,
+                        help="Allowed relative output size increase (default: 0.02).")
+    parser.add_argument('--no-fast-path', action='store_true', help="Render the ATS templates through python-docx.")
+    parser.add_argument('--embed-fonts', metavar='FAMILIES',
+                        help="Embed font subsets, e.g. 'Arial' or 'Arial=Liberation Sans' (default: "
+                             "RECEGEN_EMBED_FONTS).")
+    args = parser.parse_args(argv)
+
+    if args.no_fast_path:
+        fast_docx.ENABLED = False
+    if args.embed_fonts is not None:
+        fonts.FAMILIES = fonts.parse_families(args.embed_fonts)
+
+    photo_sizes = args.photos
+    if Image is None and any(p != 'none' for p in photo_sizes):
+        print("Pillow is not installed, skipping the photo cases", file=sys.stderr)
+        photo_sizes = ['none']
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    cases = iter_cases(args.builders, args.entries, args.skills, photo_sizes)
+    if baseline is not None:
+        # Only rerun what the baseline has
+        cases = (case for case in cases if case[0] in baseline)
+    results = run(cases, args.repeat, _print_result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+    if baseline is None:
+        failed = sum('error' in result for result in results.values())
+        if failed:
+            print(f"{failed} of {len(results)} case(s) failed")
+        return 1 if failed else 0
+    regressions = compare(baseline, results, args.time_threshold, args.memory_threshold, args.size_threshold)
+    for case_id, message in regressions:
+        print(f"REGRESSION {case_id}: {message}")
+    print(f"{len(regressions)} regression(s) in {len(results)} compared case(s)")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Render several templates from one payload into a single zip.
+
+The payload is validated and normalized once (see schema.py) and its photo
+decoded once; every builder then renders from the same model, within the
+render budgets (see governor.py, without the template fallback). The zip
+holds one DOCX per builder (under the builder's download name) and a
+manifest.json with the outcome of each, so one template failing doesn't lose
+the others.
+
+    python bundle.py data.json -o bundle.zip
+    python bundle.py data.json -o bundle.zip --builders ats-cv ats-resume
+    python bundle.py - < data.json > bundle.zip
+
+The server's /api/generate-bundle sends the whole bundle to one render
+worker, which calls render_bundle() (see render_worker.py).
+"""
+import sys
+import os
+import io
+import json
+import time
+import argparse
+
+import registry
+import schema
+import governor
+import timings
+from photos import decode_photo, report_error
+from render_utils import OUTPUT_DIR, load_json, deflate_member, write_zip
+
+BUNDLE_FILENAME = 'resume_bundle.zip'
+
+def prepare_payload(data):
+    """
+    Validate and normalize `data` once for all the builders (see schema.py),
+    decoding the photo so they share its bytes instead of each decoding the
+    data URL. Returns a schema.Resume.
+    """
+    resume = schema.parse(data)
+    if isinstance(resume.photo, str):
+        try:
+            resume = resume._replace(photo=decode_photo(resume.photo))
+        except ValueError as e:
+            report_error(e)
+    return resume
+
+def render_bundle(data, builders=None, stream=None):
+    """
+    Render `data` with each of `builders` (names, all by default) and write
+    the zip to `stream`, or return its bytes. Returns (zip bytes or None,
+    manifest entries).
+    """
+    names = builders or sorted(registry.BUILDERS)
+    resume = prepare_payload(data)
+    members = []
+    manifest = []
+    for name in names:
+        builder = registry.get_builder(name)
+        start = time.perf_counter()
+        try:
+            docx_bytes, degraded, _ = governor.render(builder, resume, fallback=False)
+        except Exception as e:
+            manifest.append({'builder': name, 'ok': False, 'error': f"{type(e).__name__}: {e}"})
+            continue
+        # DOCX files are compressed already, so they are stored as they are
+        members.append(deflate_member(builder.filename, docx_bytes, 0))
+        entry = {'builder': name, 'ok': True, 'filename': builder.filename, 'bytes': len(docx_bytes),
+                 'ms': round((time.perf_counter() - start) * 1000, 2)}
+        if degraded:
+            entry['degraded'] = degraded
+        manifest.append(entry)
+    members.append(deflate_member('manifest.json', json.dumps(manifest, indent=2).encode('utf-8'), 0))
+
+    with timings.phase('save'):
+        if stream is not None:
+            write_zip(stream, members)
+            return None, manifest
+        buffer = io.BytesIO()
+        write_zip(buffer, members)
+        return buffer.getvalue(), manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render several templates from one JSON payload into a zip.")
+    parser.add_argument('json_path', help="Path to the JSON data, or '-' to read it from stdin.")
+    parser.add_argument('-o', '--output', help="Output zip, or '-' for stdout. Defaults to stdout when reading "
+                                               "stdin, otherwise docx/" + BUNDLE_FILENAME + ".")
+    parser.add_argument('-b', '--builders', nargs='+', choices=sorted(registry.BUILDERS),
+                        help="Templates to include (default: all).")
+    args = parser.parse_args(argv)
+
+    output_path = args.output
+    if output_path is None:
+        output_path = '-' if args.json_path == '-' else os.path.join(OUTPUT_DIR, BUNDLE_FILENAME)
+
+    try:
+        data = prepare_payload(load_json(args.json_path))
+    except schema.SchemaError as e:
+        print(f"Invalid payload: {e}", file=sys.stderr)
+        return 1
+    if output_path == '-':
+        _, manifest = render_bundle(data, args.builders, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+    else:
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_path, 'wb') as f:
+            _, manifest = render_bundle(data, args.builders, f)
+
+    for entry in manifest:
+        status = f"{entry['bytes']} bytes" if entry['ok'] else f"failed: {entry['error']}"
+        print(f"{entry['builder']}: {status}", file=sys.stderr)
+    if output_path != '-':
+        print(f"Bundle generated successfully: {output_path}")
+    return 0 if all(entry['ok'] for entry in manifest) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,514 @@
+"""
+Direct OOXML writer for the single-column ATS templates.
+
+The ATS builders only use a small part of python-docx: paragraphs with a
+style, alignment, indent and spacing, runs with bold/italic/size/font/colour
+and the odd inline picture. FastTemplate renders a builder's own Sections
+against lightweight stand-ins for those objects, then joins precompiled XML
+snippets into `word/document.xml` and writes it into a package whose other
+members were serialized once per process and compressed once per
+compression level. Nothing goes
+through lxml per render.
+
+The output is byte-identical to rendering through python-docx and
+save_document(). Anything the stand-ins don't implement raises
+AttributeError rather than silently producing a different document. Set
+RECEGEN_FAST_PATH=0 to go through python-docx instead.
+"""
+import os
+import re
+import hashlib
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+from lxml import etree
+from docx.document import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.image.image import Image
+from docx.oxml.ns import qn
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PACKAGE_URI, PackURI
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.shared import Length
+
+import timings
+import fonts
+from prototypes import new_document
+from sections import block_element, insertion_index, data_slice
+import render_utils
+from render_utils import deflate_member, media_member, write_zip
+
+ENABLED = os.environ.get('RECEGEN_FAST_PATH', '1') != '0'
+
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+_RUN_BREAKS = re.compile('([\t\r\n])')
+
+_PICTURE_XML = (
+    '<w:drawing><wp:inline xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{shape_id}" name="Picture {shape_id}"/>'
+    '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+    '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<pic:pic><pic:nvPicPr><pic:cNvPr id="0" name="{filename}"/><pic:cNvPicPr/></pic:nvPicPr>'
+    '<pic:blipFill><a:blip r:embed="{rId}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+    '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"/></pic:spPr></pic:pic></a:graphicData></a:graphic>'
+    '</wp:inline></w:drawing>'
+)
+
+# Stands in for a Part in _ContentTypesItem.from_parts()
+_PartType = namedtuple('_PartType', ['partname', 'content_type'])
+
+def _check(value):
+    if _INVALID_XML_CHARS.search(value):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    return value
+
+def _text(value):
+    return escape(_check(value))
+
+def _attr(value):
+    return escape(_check(value), {'"': '&quot;'})
+
+def _twips(value):
+    return str(Length(value).twips)
+
+def _t(text):
+    space = ' xml:space="preserve"' if len(text.strip()) < len(text) else ''
+    return f'<w:t{space}>{_text(text)}</w:t>'
+
+def _run_content(text):
+    """
+    Same elements as python-docx's _RunContentAppender: tabs and line breaks
+    become <w:tab/> and <w:br/>, everything else goes into <w:t>.
+    """
+    pieces = []
+    if isinstance(text, str):
+        for piece in _RUN_BREAKS.split(text):
+            if piece == '\t':
+                pieces.append('<w:tab/>')
+            elif piece in ('\r', '\n'):
+                pieces.append('<w:br/>')
+            elif piece:
+                pieces.append(_t(piece))
+        return pieces
+
+    # python-docx iterates whatever it is given, item by item
+    buffer = []
+    for char in text:
+        if char == '\t' or char in '\r\n':
+            if buffer:
+                pieces.append(_t(''.join(buffer)))
+                buffer = []
+            pieces.append('<w:tab/>' if char == '\t' else '<w:br/>')
+        else:
+            buffer.append(char)
+    if buffer and ''.join(buffer):
+        pieces.append(_t(''.join(buffer)))
+    return pieces
+
+def _set_attribute(attributes, key, value):
+    # An existing attribute keeps its position, like in lxml
+    if value is None:
+        attributes.pop(key, None)
+    else:
+        attributes[key] = value
+
+def _formatting(key, owner):
+    """
+    A property stored in `owner`'s dict of values (`_rpr` or `_ppr`). Like
+    python-docx, setting any of them creates the properties element, even
+    when the value is None.
+    """
+    def get(self):
+        return getattr(self, owner).get(key)
+
+    def set(self, value):
+        properties = getattr(self, owner)
+        properties['exists'] = True
+        _set_attribute(properties, key, value)
+    return property(get, set)
+
+class _Color:
+    __slots__ = ('_font',)
+
+    def __init__(self, font):
+        self._font = font
+
+    @property
+    def rgb(self):
+        return self._font._rpr.get('color')
+
+    @rgb.setter
+    def rgb(self, value):
+        rpr = self._font._rpr
+        if value is None and 'color' not in rpr:
+            return
+        rpr['exists'] = True
+        _set_attribute(rpr, 'color', value)
+
+class _Font:
+    __slots__ = ('_rpr',)
+
+    def __init__(self, rpr):
+        self._rpr = rpr
+
+    name = _formatting('name', '_rpr')
+    size = _formatting('size', '_rpr')
+    bold = _formatting('bold', '_rpr')
+    italic = _formatting('italic', '_rpr')
+
+    @property
+    def color(self):
+        return _Color(self)
+
+class FastRun:
+    __slots__ = ('_paragraph', '_content', '_rpr')
+
+    def __init__(self, paragraph, text=None, style=None):
+        self._paragraph = paragraph
+        self._content = _run_content(text) if text else []
+        self._rpr = {}
+        if style:
+            self.style = style
+
+    style = _formatting('style', '_rpr')
+    bold = _formatting('bold', '_rpr')
+    italic = _formatting('italic', '_rpr')
+
+    @property
+    def font(self):
+        return _Font(self._rpr)
+
+    def add_picture(self, image_stream, width=None, height=None):
+        self._content.append(self._paragraph._document.add_image(image_stream, width, height))
+
+    def xml(self):
+        rpr = self._rpr
+        content = ''.join(self._content)
+        if not rpr:
+            return f'<w:r>{content}</w:r>' if content else '<w:r/>'
+
+        # Children in schema order
+        properties = []
+        style_id = self._paragraph._document.style_id(rpr['style'], WD_STYLE_TYPE.CHARACTER) if 'style' in rpr else None
+        if style_id is not None:
+            properties.append(f'<w:rStyle w:val="{_attr(style_id)}"/>')
+        if 'name' in rpr:
+            name = _attr(rpr['name'])
+            properties.append(f'<w:rFonts w:ascii="{name}" w:hAnsi="{name}"/>')
+        for key, tag in (('bold', 'b'), ('italic', 'i')):
+            if key in rpr:
+                properties.append(f'<w:{tag}/>' if rpr[key] else f'<w:{tag} w:val="0"/>')
+        if 'color' in rpr:
+            properties.append(f'<w:color w:val="{rpr["color"]}"/>')
+        if 'size' in rpr:
+            properties.append(f'<w:sz w:val="{int(Length(rpr["size"]).pt * 2)}"/>')
+        properties = ''.join(properties)
+        rpr_xml = f'<w:rPr>{properties}</w:rPr>' if properties else '<w:rPr/>'
+        return f'<w:r>{rpr_xml}{content}</w:r>'
+
+class _ParagraphFormat:
+    __slots__ = ('_ppr',)
+
+    def __init__(self, ppr):
+        self._ppr = ppr
+
+    alignment = _formatting('alignment', '_ppr')
+
+    def _child_attribute(child, key):
+        # w:spacing and w:ind appear once one of their attributes is set and
+        # stay, possibly empty, like python-docx's get_or_add_*()
+        def get(self):
+            return self._ppr.get(child, {}).get(key)
+
+        def set(self, value):
+            ppr = self._ppr
+            ppr['exists'] = True
+            if value is None and child not in ppr:
+                return
+            _set_attribute(ppr.setdefault(child, {}), key, value)
+        return property(get, set)
+
+    space_before = _child_attribute('spacing', 'before')
+    space_after = _child_attribute('spacing', 'after')
+    left_indent = _child_attribute('ind', 'left')
+    right_indent = _child_attribute('ind', 'right')
+    del _child_attribute
+
+class FastParagraph:
+    __slots__ = ('_document', '_runs', '_ppr')
+
+    def __init__(self, document, text='', style=None):
+        self._document = document
+        self._runs = []
+        self._ppr = {}
+        if text:
+            self.add_run(text)
+        if style is not None:
+            self.style = style
+
+    style = _formatting('style', '_ppr')
+    alignment = _formatting('alignment', '_ppr')
+
+    @property
+    def paragraph_format(self):
+        return _ParagraphFormat(self._ppr)
+
+    def add_run(self, text=None, style=None):
+        run = FastRun(self, text, style)
+        self._runs.append(run)
+        return run
+
+    def xml(self):
+        ppr = self._ppr
+        runs = ''.join(run.xml() for run in self._runs)
+        if not ppr:
+            return f'<w:p>{runs}</w:p>' if runs else '<w:p/>'
+
+        # Children in schema order
+        properties = []
+        style_id = self._document.style_id(ppr['style'], WD_STYLE_TYPE.PARAGRAPH) if 'style' in ppr else None
+        if style_id is not None:
+            properties.append(f'<w:pStyle w:val="{_attr(style_id)}"/>')
+        for child in ('spacing', 'ind'):
+            if child in ppr:
+                attributes = ''.join(f' w:{key}="{_twips(value)}"' for key, value in ppr[child].items())
+                properties.append(f'<w:{child}{attributes}/>')
+        if 'alignment' in ppr:
+            properties.append(f'<w:jc w:val="{WD_ALIGN_PARAGRAPH.to_xml(ppr["alignment"])}"/>')
+        properties = ''.join(properties)
+        ppr_xml = f'<w:pPr>{properties}</w:pPr>' if properties else '<w:pPr/>'
+        return f'<w:p>{ppr_xml}{runs}</w:p>'
+
+class FastCell:
+    """
+    Stand-in for a table cell: a container of paragraphs. A cell that
+    starts out empty in the template and stays empty gets the paragraph
+    OOXML requires.
+    """
+    __slots__ = ('_document', '_blocks', 'requires_paragraph')
+
+    def __init__(self, document, requires_paragraph=False):
+        self._document = document
+        self._blocks = []
+        self.requires_paragraph = requires_paragraph
+
+    def add_paragraph(self, text='', style=None):
+        paragraph = FastParagraph(self._document, text, style)
+        self._blocks.append(paragraph)
+        return paragraph
+
+    def xml(self):
+        if not self._blocks and self.requires_paragraph:
+            return '<w:p/>'
+        return ''.join(block.xml() for block in self._blocks)
+
+class FastBody(FastCell):
+    __slots__ = ()
+
+    def add_heading(self, text='', level=1):
+        if not 0 <= level <= 9:
+            raise ValueError("level must be in range 0-9, got %d" % level)
+        return self.add_paragraph(text, 'Title' if level == 0 else 'Heading %d' % level)
+
+class FastDocument:
+    """
+    Collects the content and pictures of one render.
+    """
+    def __init__(self, template):
+        self._template = template
+        self.containers = {key: FastBody(self) if slot == 'body' else FastCell(self, slot == 'empty-cell')
+                           for key, slot in template.slots.items()}
+        self.images = []
+        self._images_by_sha1 = {}
+        self._next_shape_id = template.next_shape_id
+
+    def style_id(self, name, style_type):
+        return self._template.style_id(name, style_type)
+
+    def add_image(self, image_stream, width, height):
+        image_stream.seek(0)
+        blob = image_stream.read()
+        sha1 = hashlib.sha1(blob).hexdigest()
+        image = Image.from_blob(blob)
+        if sha1 in self._images_by_sha1:
+            rId = self._images_by_sha1[sha1][0]
+        else:
+            rId = self._template.next_rId(len(self.images))
+            partname = PackURI('/word/media/image%d.%s' % (len(self.images) + 1, image.ext))
+            self._images_by_sha1[sha1] = (rId, partname)
+            self.images.append((rId, partname, image, sha1))
+        cx, cy = image.scaled_dimensions(width, height)
+        shape_id = self._next_shape_id
+        self._next_shape_id += 1
+        return _PICTURE_XML.format(cx=cx, cy=cy, shape_id=shape_id, filename=_attr(image.filename), rId=rId)
+
+# Placeholders in a template's member plan
+_DOCUMENT = object()
+_IMAGES = object()
+
+class FastTemplate:
+    """
+    A builder's template and Sections, prepared for direct XML output.
+    `containers(document)` returns the same mapping of container names to
+    the Document or its table cells that the builder passes to
+    render_sections().
+    """
+    def __init__(self, name, setup, sections, containers):
+        self.name = name
+        self.setup = setup
+        self.sections = sections
+        self.containers = containers
+        self._loaded = False
+
+    def _load(self):
+        document = new_document(self.name, self.setup)
+        part = document.part
+        self._styles = part.styles
+        self._style_ids = {}
+        self._rIds = set(part.rels)
+        self.next_shape_id = part.next_id
+
+        # Mark where each container's content goes, then cut the serialized
+        # document part at the marks
+        self.slots = {}
+        for key, container in self.containers(document).items():
+            parent = block_element(container)
+            if isinstance(container, Document):
+                self.slots[key] = 'body'
+            else:
+                self.slots[key] = 'cell' if parent.findall(qn('w:p')) else 'empty-cell'
+            parent.insert(insertion_index(parent), etree.Comment(f'slot:{key}'))
+        self._chunks = re.split(r'<!--slot:(.*?)-->', part.blob.decode('utf-8'))
+        self._document_partname = part.partname
+        self._document_rels = part.rels.xml.decode('utf-8')
+
+        # Images are related last from the document part, so in the package
+        # walk they follow everything reachable from it
+        package = part.package
+        parts = list(package.iter_parts())
+        reachable = self._reachable(part)
+        image_index = 1 + max(i for i, p in enumerate(parts) if p is part or p.partname in reachable)
+
+        # Every member but the document part, its rels and any images is the
+        # same in every render, so it's serialized once here and compressed
+        # once per compression level in _plan()
+        self._part_types = [_PartType(p.partname, p.content_type) for p in parts]
+        self._image_index = image_index
+        self._members = [(PACKAGE_URI.rels_uri.membername, package.rels.xml)]
+        for index, p in enumerate(parts):
+            if index == image_index:
+                self._members.append(_IMAGES)
+            if p is part:
+                self._members.append(_DOCUMENT)
+                continue
+            self._members.append((p.partname.membername, p.blob))
+            if len(p.rels):
+                self._members.append((p.partname.rels_uri.membername, p.rels.xml))
+        if image_index == len(parts):
+            self._members.append(_IMAGES)
+        self._plans = {}
+        self._content_types = {}
+        self._loaded = True
+
+    def _plan(self, level):
+        plan = self._plans.get(level)
+        if plan is None:
+            plan = self._plans[level] = [entry if entry is _DOCUMENT or entry is _IMAGES
+                                         else deflate_member(*entry, level) for entry in self._members]
+        return plan
+
+    @staticmethod
+    def _reachable(part):
+        seen = set()
+        stack = [part]
+        while stack:
+            for rel in stack.pop().rels.values():
+                if rel.is_external or rel.target_part.partname in seen:
+                    continue
+                seen.add(rel.target_part.partname)
+                stack.append(rel.target_part)
+        return seen
+
+    def style_id(self, name, style_type):
+        key = (name, style_type)
+        if key not in self._style_ids:
+            self._style_ids[key] = self._styles.get_style_id(name, style_type)
+        return self._style_ids[key]
+
+    def next_rId(self, taken):
+        """
+        The rId python-docx would give the document's next relationship
+        after `taken` images were related.
+        """
+        n = 0
+        while True:
+            n += 1
+            rId = 'rId%d' % n
+            if rId not in self._rIds:
+                if not taken:
+                    return rId
+                taken -= 1
+
+    def render(self, data, stream=None):
+        """
+        Render `data` like the builder would and return the DOCX bytes, or
+        write them to `stream` if one is given.
+        """
+        if not self._loaded:
+            self._load()
+        document = FastDocument(self)
+        for section in self.sections:
+            section.render(document.containers[section.container], data_slice(data, section.inputs))
+
+        chunks = list(self._chunks)
+        for i in range(1, len(chunks), 2):
+            chunks[i] = document.containers[chunks[i]].xml()
+
+        with timings.phase('save'):
+            level = render_utils.COMPRESSION_LEVEL
+            members = [self._content_types_member(document, level)]
+            for entry in self._plan(level):
+                if entry is _DOCUMENT:
+                    xml = ''.join(chunks).encode('utf-8')
+                    members.append(deflate_member(self._document_partname.membername, xml, level))
+                    members.append(self._document_rels_member(document, level))
+                elif entry is _IMAGES:
+                    members.extend(media_member(partname.membername, image.blob, sha1, level)
+                                   for _, partname, image, sha1 in document.images)
+                else:
+                    members.append(entry)
+            members = fonts.embed(members, level)
+
+            if stream is not None:
+                write_zip(stream, members)
+                return None
+            buffer = _Buffer()
+            write_zip(buffer, members)
+            return b''.join(buffer)
+
+    def _document_rels_member(self, document, level):
+        xml = self._document_rels
+        if document.images:
+            base_uri = self._document_partname.baseURI
+            relationships = ''.join(
+                f'<Relationship Id="{rId}" Type="{RT.IMAGE}" Target="{partname.relative_ref(base_uri)}"/>'
+                for rId, partname, _, _ in document.images)
+            xml = xml.replace('</Relationships>', relationships + '</Relationships>')
+        return deflate_member(self._document_partname.rels_uri.membername, xml.encode('utf-8'), level)
+
+    def _content_types_member(self, document, level):
+        images = tuple((str(partname), image.content_type) for _, partname, image, _ in document.images)
+        key = (images, level)
+        member = self._content_types.get(key)
+        if member is None:
+            part_types = self._part_types + [_PartType(PackURI(name), content_type) for name, content_type in images]
+            member = deflate_member('[Content_Types].xml', _ContentTypesItem.from_parts(part_types).blob, level)
+            self._content_types[key] = member
+        return member
+
+class _Buffer(list):
+    # Collects written chunks; cheaper than BytesIO for a handful of writes
+    write = list.append
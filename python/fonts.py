@@ -0,0 +1,350 @@
+"""
+Embed the fonts a document uses, subsetted to the characters it contains.
+
+The templates name their fonts (mostly Arial) but don't carry them, so a
+document looks like whatever the reader's machine substitutes. With
+RECEGEN_EMBED_FONTS set, every saved document gets the listed families
+embedded the way Word does with "Embed fonts in the file" and "Embed only
+the characters used in the document": each variant the document uses
+(regular, bold, italic, bold italic) is cut down with fontTools to the
+characters of its text, obfuscated into a word/fonts/*.odttf part and
+referenced from the font table.
+
+    RECEGEN_EMBED_FONTS=Arial                      Arial from the font directories
+    RECEGEN_EMBED_FONTS="Arial=Liberation Sans"    Liberation Sans, embedded as Arial
+    RECEGEN_FONT_DIR=/srv/fonts                    where to look (default: the system's)
+
+Subsetting a variant takes around 100ms, far more than the rest of a
+save, so the compressed parts are kept in an LRU keyed by font file and
+character set hash (RECEGEN_FONT_SUBSET_CACHE_SIZE entries): rendering the
+same document again - previews, retries, bundles of one payload - reuses
+them. Without fontTools, or when a family's files can't be found or don't
+allow embedding, documents are saved without it and a warning is printed
+once.
+"""
+import sys
+import os
+import re
+import uuid
+import zlib
+import hashlib
+import zipfile
+from io import BytesIO
+from collections import OrderedDict
+from xml.sax.saxutils import unescape
+
+try:
+    from fontTools import subset
+    from fontTools.ttLib import TTFont, TTLibError
+except ImportError:
+    subset = None
+
+from lxml import etree
+
+import timings
+import interrupts
+import render_utils
+
+def parse_families(spec):
+    """
+    {embedded name: family to look up} for a RECEGEN_EMBED_FONTS value.
+    """
+    families = OrderedDict()
+    for item in spec.split(','):
+        name, _, source = item.partition('=')
+        if name.strip():
+            families[name.strip()] = source.strip() or name.strip()
+    return families
+
+FAMILIES = parse_families(os.environ.get('RECEGEN_EMBED_FONTS', ''))
+FONT_DIRS = [path for path in os.environ.get('RECEGEN_FONT_DIR', '').split(os.pathsep) if path]
+CACHE_SIZE = int(os.environ.get('RECEGEN_FONT_SUBSET_CACHE_SIZE', 32))
+
+if not FONT_DIRS:
+    if sys.platform == 'win32':
+        FONT_DIRS = [os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts')]
+    elif sys.platform == 'darwin':
+        FONT_DIRS = ['/System/Library/Fonts', '/Library/Fonts', os.path.expanduser('~/Library/Fonts')]
+    else:
+        FONT_DIRS = ['/usr/share/fonts', '/usr/local/share/fonts', os.path.expanduser('~/.local/share/fonts'),
+                     os.path.expanduser('~/.fonts')]
+
+ODTTF_TYPE = 'application/vnd.openxmlformats-officedocument.obfuscatedFont'
+FONT_RELATIONSHIP = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/font'
+
+_W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+# Variant -> (bold, italic), and the font table element each is embedded with
+VARIANTS = OrderedDict([('regular', (False, False)), ('bold', (True, False)),
+                        ('italic', (False, True)), ('boldItalic', (True, True))])
+_EMBED_TAGS = {'regular': 'embedRegular', 'bold': 'embedBold', 'italic': 'embedItalic',
+               'boldItalic': 'embedBoldItalic'}
+
+# Settings that come before w:embedTrueTypeFonts in CT_Settings; Word
+# rejects the file if they are out of order
+_BEFORE_EMBED = {'writeProtection', 'view', 'zoom', 'removePersonalInformation', 'removeDateAndTime',
+                 'doNotDisplayPageBoundaries', 'displayBackgroundShape', 'printPostScriptOverText',
+                 'printFractionalCharacterWidth', 'printFormsData'}
+
+_TEXT = re.compile(rb'<w:t(?: [^>]*)?>([^<]*)</w:t>')
+_FONT_NAMES = re.compile(rb'w:(?:ascii|hAnsi|cs|eastAsia)(?:Theme)?="([^"]+)"')
+_THEME_FONTS = re.compile(rb'<a:(major|minor)Font>\s*<a:latin typeface="([^"]*)"')
+_BOLD = re.compile(rb'<w:b(?: w:val="(?:1|true|on)")?/>')
+_ITALIC = re.compile(rb'<w:i(?: w:val="(?:1|true|on)")?/>')
+_TEXT_PARTS = re.compile(r'word/(?:document|header\d*|footer\d*)\.xml$')
+
+_index = None
+_subsets = OrderedDict()
+_settings = {}
+_styles = {}
+_themes = {}
+_warned = set()
+hits = misses = 0
+
+def _warn(message):
+    if message not in _warned:
+        _warned.add(message)
+        print(f"Font embedding: {message}", file=sys.stderr)
+
+def font_index():
+    """
+    {(family, variant): path} of the TrueType fonts in FONT_DIRS, built on
+    first use. Families are the names Word groups styles under (name ID 1).
+    """
+    global _index
+    if _index is None:
+        index = {}
+        for directory in FONT_DIRS:
+            for root, dirs, files in os.walk(directory):
+                dirs.sort()
+                for filename in sorted(files):
+                    if not filename.lower().endswith(('.ttf', '.otf')):
+                        continue
+                    path = os.path.join(root, filename)
+                    try:
+                        font = TTFont(path, lazy=True)
+                        if 'glyf' not in font:
+                            continue  # CFF outlines can't be embedded in a DOCX
+                        family = font['name'].getDebugName(1)
+                        selection = font['OS/2'].fsSelection
+                    except (TTLibError, KeyError, OSError, AssertionError):
+                        continue
+                    variant = ('bold' if selection & 0x20 else 'regular') if not selection & 0x01 \
+                        else ('boldItalic' if selection & 0x20 else 'italic')
+                    if family:
+                        index.setdefault((family.lower(), variant), path)
+        _index = index
+    return _index
+
+def font_key(path, characters_hash):
+    """
+    The GUID a subset is obfuscated with, derived from what it contains so
+    identical documents stay byte-identical.
+    """
+    digest = hashlib.sha1(f"{path}\0{characters_hash}".encode('utf-8')).digest()
+    return '{' + str(uuid.UUID(bytes=digest[:16])).upper() + '}'
+
+def obfuscate(data, key):
+    """
+    ECMA-376 font obfuscation: the first 32 bytes are XORed with the GUID
+    `key`, read as bytes from its last hex pair to its first. Applying it
+    twice gives the font back.
+    """
+    key = bytes.fromhex(key.strip('{}').replace('-', ''))[::-1]
+    return bytes(byte ^ key[i % 16] for i, byte in enumerate(data[:32])) + data[32:]
+
+def subset_font(path, characters):
+    """
+    The TrueType bytes of the font at `path` cut down to `characters`.
+    """
+    font = TTFont(path, recalcTimestamp=False)
+    if font['OS/2'].fsType & 0x000F == 0x0002:
+        raise ValueError(f"{os.path.basename(path)} doesn't allow embedding")
+    options = subset.Options()
+    options.name_IDs = ['*']
+    options.name_languages = ['*']
+    options.notdef_outline = True
+    options.drop_tables += ['FFTM']  # FontForge's timestamps, which fontTools can't subset
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[ord(character) for character in characters])
+    subsetter.subset(font)
+    output = BytesIO()
+    font.save(output)
+    return output.getvalue()
+
+def subset_member(path, characters, level):
+    """
+    (font key, compressed .odttf member without a name) for the font at
+    `path` subsetted to `characters`, from the LRU when it was made before.
+    """
+    global hits, misses
+    characters_hash = hashlib.sha1(''.join(sorted(characters)).encode('utf-8', 'surrogatepass')).hexdigest()
+    cache_key = (path, characters_hash, level)
+    entry = _subsets.get(cache_key)
+    if entry is not None:
+        hits += 1
+        _subsets.move_to_end(cache_key)
+        return entry
+    misses += 1
+    with timings.phase('fonts'):
+        key = font_key(path, characters_hash)
+        data = obfuscate(subset_font(path, characters), key)
+        entry = (key, render_utils.deflate_member('', data, level))
+    with interrupts.deferred():
+        _subsets[cache_key] = entry
+        if len(_subsets) > CACHE_SIZE:
+            _subsets.popitem(last=False)
+    return entry
+
+def clear_cache():
+    global hits, misses
+    _subsets.clear()
+    hits = misses = 0
+
+def _inflate(member):
+    if member.method == zipfile.ZIP_STORED:
+        return member.data
+    return zlib.decompress(member.data, -15)
+
+def _style_usage(member):
+    # (font names, bold, italic) named in styles.xml, which rarely changes
+    key = (member.name, member.crc)
+    usage = _styles.get(key)
+    if usage is None:
+        xml = _inflate(member)
+        usage = _styles[key] = (set(_FONT_NAMES.findall(xml)), bool(_BOLD.search(xml)),
+                                bool(_ITALIC.search(xml)))
+    return usage
+
+def _theme_fonts(member):
+    # {b'majorHAnsi': typeface, ...} for the theme font references in styles
+    key = (member.name, member.crc)
+    fonts = _themes.get(key)
+    if fonts is None:
+        fonts = {}
+        for kind, typeface in _THEME_FONTS.findall(_inflate(member)):
+            for script in (b'Ascii', b'HAnsi', b'Bidi', b'EastAsia'):
+                fonts[kind + script] = typeface
+        _themes[key] = fonts
+    return fonts
+
+def _characters(xmls):
+    characters = {' '}
+    for xml in xmls:
+        for text in _TEXT.findall(xml):
+            characters.update(unescape(text.decode('utf-8'), {'&quot;': '"', '&apos;': "'"}))
+    return frozenset(characters)
+
+def _font_table(xml, embedded):
+    root = etree.fromstring(xml)
+    for name, variants in embedded.items():
+        font = next((f for f in root.iterfind(f'{{{_W}}}font') if f.get(f'{{{_W}}}name') == name), None)
+        if font is None:
+            font = etree.SubElement(root, f'{{{_W}}}font', {f'{{{_W}}}name': name})
+        for child in font:
+            if etree.QName(child).localname in _EMBED_TAGS.values():
+                font.remove(child)
+        for variant, (rId, key) in variants:
+            etree.SubElement(font, f'{{{_W}}}{_EMBED_TAGS[variant]}', {f'{{{_R}}}id': rId, f'{{{_W}}}fontKey': key})
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+def _settings_member(member, level):
+    key = (member.crc, level)
+    cached = _settings.get(key)
+    if cached is None:
+        root = etree.fromstring(_inflate(member))
+        names = [etree.QName(child).localname for child in root]
+        if 'embedTrueTypeFonts' not in names:
+            index = max((i + 1 for i, name in enumerate(names) if name in _BEFORE_EMBED), default=0)
+            root.insert(index, etree.Element(f'{{{_W}}}embedTrueTypeFonts'))
+            if 'saveSubsetFonts' not in names:
+                after = index + 1 + ('embedSystemFonts' in names)
+                root.insert(after, etree.Element(f'{{{_W}}}saveSubsetFonts'))
+        xml = etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+        cached = _settings[key] = render_utils.deflate_member(member.name, xml, level)
+    return cached
+
+def _content_types(xml):
+    if b'Extension="odttf"' in xml:
+        return xml
+    end = xml.index(b'>', xml.index(b'<Types')) + 1
+    return xml[:end] + f'<Default Extension="odttf" ContentType="{ODTTF_TYPE}"/>'.encode('utf-8') + xml[end:]
+
+def embed(members, level=None):
+    """
+    `members` of a DOCX package (see render_utils.write_zip()) with the
+    FAMILIES it uses embedded, or `members` as they are when there is
+    nothing to embed.
+    """
+    if not FAMILIES:
+        return members
+    if subset is None:
+        _warn("fontTools is not installed, saving without embedded fonts")
+        return members
+    level = render_utils.COMPRESSION_LEVEL if level is None else level
+    by_name = {member.name: member for member in members}
+    if 'word/fontTable.xml' not in by_name or 'word/settings.xml' not in by_name:
+        return members
+
+    texts = [_inflate(member) for member in members if _TEXT_PARTS.match(member.name)]
+    names, bold, italic = set(), False, False
+    for xml in texts:
+        names.update(_FONT_NAMES.findall(xml))
+        bold = bold or bool(_BOLD.search(xml))
+        italic = italic or bool(_ITALIC.search(xml))
+    if 'word/styles.xml' in by_name:
+        style_names, style_bold, style_italic = _style_usage(by_name['word/styles.xml'])
+        names |= style_names
+        bold, italic = bold or style_bold, italic or style_italic
+    if 'word/theme/theme1.xml' in by_name:
+        theme = _theme_fonts(by_name['word/theme/theme1.xml'])
+        names = {theme.get(name, name) for name in names}
+    used = [(variant, flags) for variant, flags in VARIANTS.items()
+            if (not flags[0] or bold) and (not flags[1] or italic)]
+
+    characters = None
+    index = font_index()
+    embedded = OrderedDict()
+    font_members = []
+    for name, family in FAMILIES.items():
+        if name.encode('utf-8') not in names:
+            continue
+        for variant, _ in used:
+            path = index.get((family.lower(), variant))
+            if path is None:
+                _warn(f"no {variant} font file for {family} in {os.pathsep.join(FONT_DIRS)}")
+                continue
+            if characters is None:
+                characters = _characters(texts)
+            try:
+                key, member = subset_member(path, characters, level)
+            except (ValueError, TTLibError, OSError) as e:
+                _warn(f"can't embed {path}: {e}")
+                continue
+            number = len(font_members) + 1
+            rId = f'rId{number}'
+            font_members.append(member._replace(name=f'word/fonts/font{number}.odttf'))
+            embedded.setdefault(name, []).append((variant, (rId, key)))
+    if not font_members:
+        return members
+
+    relationships = ''.join(f'<Relationship Id="rId{n}" Type="{FONT_RELATIONSHIP}" Target="fonts/font{n}.odttf"/>'
+                            for n in range(1, len(font_members) + 1))
+    rels = ('<?xml version=\'1.0\' encoding=\'UTF-8\' standalone=\'yes\'?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{relationships}</Relationships>').encode('utf-8')
+    result = []
+    for member in members:
+        if member.name == '[Content_Types].xml':
+            member = render_utils.deflate_member(member.name, _content_types(_inflate(member)), level)
+        elif member.name == 'word/settings.xml':
+            member = _settings_member(member, level)
+        elif member.name == 'word/_rels/fontTable.xml.rels':
+            continue  # replaced below; the templates don't have one
+        result.append(member)
+        if member.name == 'word/fontTable.xml':
+            result[-1] = render_utils.deflate_member(member.name, _font_table(_inflate(member), embedded), level)
+            result.append(render_utils.deflate_member('word/_rels/fontTable.xml.rels', rels, level))
+            result.extend(font_members)
+    return result
@@ -1,12 +1,16 @@
 import sys
-import json
 import os
-from docx import Document
 from docx.shared import Pt, Inches, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 
+import schema
+from prototypes import new_document
+from sections import Section, render_sections
+from styles import Style, CHARACTER, add_styles
+from render_utils import OUTPUT_DIR, load_json, save_document, write_output, run_cli
+
 def set_cell_background(cell, color_hex):
     """
     Set background color for a table cell.
@@ -20,13 +24,31 @@ def set_cell_background(cell, color_hex):
     
     cell_shading.set(qn('w:fill'), color_hex)
 
-def create_cv(json_path):
-    # Load data
-    with open(json_path, 'r') as f:
-        data = json.load(f)
-
-    document = Document()
-
+WHITE = RGBColor(255, 255, 255)
+SLATE_700 = RGBColor(51, 65, 85)
+
+# Named styles used by the content, see styles.py
+STYLES = [
+    # Sidebar
+    Style('Sidebar Text', size=Pt(10), bold=False, color=WHITE, alignment=WD_ALIGN_PARAGRAPH.LEFT),
+    Style('Sidebar Name', base='Sidebar Text', size=Pt(20), bold=True, alignment=WD_ALIGN_PARAGRAPH.CENTER),
+    Style('Sidebar Title', base='Sidebar Text', size=Pt(12), color=RGBColor(129, 140, 248), alignment=WD_ALIGN_PARAGRAPH.CENTER), # Indigo-400
+    Style('Sidebar Header', size=Pt(12), bold=True, color=RGBColor(148, 163, 184), space_before=Pt(12), space_after=Pt(4)), # Slate-400
+    # Main content
+    Style('Section Header', size=Pt(14), bold=True, color=RGBColor(15, 23, 42), space_before=Pt(12), space_after=Pt(6)), # Slate-900
+    Style('Summary', alignment=WD_ALIGN_PARAGRAPH.JUSTIFY),
+    Style('Job Title', size=Pt(12), bold=True, space_after=Pt(0)),
+    Style('Date', CHARACTER, size=Pt(10), bold=False, color=RGBColor(100, 116, 139)), # Slate-500
+    Style('Company', italic=True, color=SLATE_700, space_after=Pt(4)),
+    Style('Description', space_after=Pt(12)),
+    Style('Degree', size=Pt(12), bold=True, space_after=Pt(0)),
+    Style('School', italic=True, color=SLATE_700, space_after=Pt(12)),
+]
+
+def _setup_cv(document):
+    """
+    Fixed skeleton of the CV, built once per process by the prototype cache.
+    """
     # Set margins to 0 for full-width sidebar effect (simulated)
     sections = document.sections
     for section in sections:
@@ -44,143 +66,125 @@ def create_cv(json_path):
     table.columns[0].width = Inches(2.5) 
     table.columns[1].width = Inches(5.0)
 
-    # --- LEFT COLUMN (SIDEBAR) ---
-    left_cell = table.cell(0, 0)
-    set_cell_background(left_cell, "1E293B") # Slate-800 hex
-
-    # Helper to add white text to sidebar
-    def add_sidebar_text(text, size=10, bold=False, color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.LEFT):
-        p = left_cell.add_paragraph()
-        run = p.add_run(text)
-        run.font.size = Pt(size)
-        run.font.color.rgb = color
-        run.bold = bold
-        p.alignment = alignment
-        return p
-
-    def add_sidebar_header(text):
-        p = left_cell.add_paragraph()
-        p.paragraph_format.space_before = Pt(12)
-        p.paragraph_format.space_after = Pt(4)
-        run = p.add_run(text.upper())
-        run.font.size = Pt(12)
-        run.font.color.rgb = RGBColor(148, 163, 184) # Slate-400
-        run.bold = True
-        # Add bottom border simulation (using underscore or just spacing)
-        # For now, just spacing
-        return p
+    # Sidebar background
+    set_cell_background(table.cell(0, 0), "1E293B") # Slate-800 hex
+
+    add_styles(document, STYLES)
+
+# Helper to add white text to sidebar
+def add_sidebar_text(left_cell, text, style='Sidebar Text'):
+    return left_cell.add_paragraph(text, style)
+
+def add_sidebar_header(left_cell, text):
+    # Add bottom border simulation (using underscore or just spacing)
+    # For now, just spacing
+    return left_cell.add_paragraph(text.upper(), 'Sidebar Header')
+
+def add_sidebar_list(left_cell, title, items):
+    add_sidebar_header(left_cell, title)
+    items_list = items.split(',') if isinstance(items, str) else items
+    for item in items_list:
+        if item.strip():
+            add_sidebar_text(left_cell, f"• {item.strip()}")
 
+# Helper for main content
+def add_main_header(right_cell, text):
+    return right_cell.add_paragraph(text.upper(), 'Section Header')
+
+# --- LEFT COLUMN (SIDEBAR) ---
+
+def _render_name(left_cell, data):
     # Name & Title
-    add_sidebar_text(data.get('name', 'YOUR NAME').upper(), size=20, bold=True, alignment=WD_ALIGN_PARAGRAPH.CENTER)
-    add_sidebar_text(data.get('title', 'Professional Title'), size=12, color=RGBColor(129, 140, 248), alignment=WD_ALIGN_PARAGRAPH.CENTER) # Indigo-400
+    add_sidebar_text(left_cell, data.get('name', 'YOUR NAME').upper(), 'Sidebar Name')
+    add_sidebar_text(left_cell, data.get('title', 'Professional Title'), 'Sidebar Title')
     left_cell.add_paragraph() # Spacer
 
+def _render_contact(left_cell, data):
     # Contact
-    add_sidebar_header("Contact")
-    if 'phone' in data: add_sidebar_text(f"Phone: {data['phone']}")
-    if 'email' in data: add_sidebar_text(f"Email: {data['email']}")
-    if 'location' in data: add_sidebar_text(f"Loc: {data['location']}")
-    
-    # Skills
+    add_sidebar_header(left_cell, "Contact")
+    if 'phone' in data: add_sidebar_text(left_cell, f"Phone: {data['phone']}")
+    if 'email' in data: add_sidebar_text(left_cell, f"Email: {data['email']}")
+    if 'location' in data: add_sidebar_text(left_cell, f"Loc: {data['location']}")
+
+def _render_skills(left_cell, data):
     if 'skills' in data:
-        add_sidebar_header("Skills")
-        skills_list = data['skills'].split(',') if isinstance(data['skills'], str) else data['skills']
-        for skill in skills_list:
-            if skill.strip():
-                add_sidebar_text(f"• {skill.strip()}")
+        add_sidebar_list(left_cell, "Skills", data['skills'])
 
-    # Languages
+def _render_languages(left_cell, data):
     if 'languages' in data:
-        add_sidebar_header("Languages")
-        langs_list = data['languages'].split(',') if isinstance(data['languages'], str) else data['languages']
-        for lang in langs_list:
-            if lang.strip():
-                add_sidebar_text(f"• {lang.strip()}")
+        add_sidebar_list(left_cell, "Languages", data['languages'])
 
-    # Hobbies
+def _render_hobbies(left_cell, data):
     if 'hobbies' in data:
-        add_sidebar_header("Hobbies")
-        hobbies_list = data['hobbies'].split(',') if isinstance(data['hobbies'], str) else data['hobbies']
-        for hobby in hobbies_list:
-            if hobby.strip():
-                add_sidebar_text(f"• {hobby.strip()}")
-
+        add_sidebar_list(left_cell, "Hobbies", data['hobbies'])
 
-    # --- RIGHT COLUMN (MAIN CONTENT) ---
-    right_cell = table.cell(0, 1)
-    
-    # Helper for main content
-    def add_main_header(text):
-        p = right_cell.add_paragraph()
-        p.paragraph_format.space_before = Pt(12)
-        p.paragraph_format.space_after = Pt(6)
-        run = p.add_run(text.upper())
-        run.font.size = Pt(14)
-        run.font.color.rgb = RGBColor(15, 23, 42) # Slate-900
-        run.bold = True
-        return p
+# --- RIGHT COLUMN (MAIN CONTENT) ---
 
+def _render_profile(right_cell, data):
     # Profile
     if 'summary' in data:
-        add_main_header("Profile")
-        p = right_cell.add_paragraph(data['summary'])
-        p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+        add_main_header(right_cell, "Profile")
+        right_cell.add_paragraph(data['summary'], 'Summary')
 
+def _render_experience(right_cell, data):
     # Experience
     if 'experience' in data and len(data['experience']) > 0:
-        add_main_header("Work Experience")
+        add_main_header(right_cell, "Work Experience")
         for exp in data['experience']:
             # Title & Date
-            p = right_cell.add_paragraph()
-            p.paragraph_format.space_after = Pt(0)
-            title_run = p.add_run(exp.get('title', ''))
-            title_run.bold = True
-            title_run.font.size = Pt(12)
+            p = right_cell.add_paragraph(exp.get('title', ''), 'Job Title')
             
             # Date (Right aligned simulation using tabs or just appending)
             # Simple append for now
-            date_run = p.add_run(f"  |  {exp.get('date', '')}")
-            date_run.font.size = Pt(10)
-            date_run.font.color.rgb = RGBColor(100, 116, 139) # Slate-500
+            p.add_run(f"  |  {exp.get('date', '')}", 'Date')
 
             # Company
-            p_comp = right_cell.add_paragraph()
-            p_comp.paragraph_format.space_after = Pt(4)
-            comp_run = p_comp.add_run(exp.get('company', ''))
-            comp_run.italic = True
-            comp_run.font.color.rgb = RGBColor(51, 65, 85) # Slate-700
+            right_cell.add_paragraph(exp.get('company', ''), 'Company')
 
             # Description
-            p_desc = right_cell.add_paragraph(exp.get('description', ''))
-            p_desc.paragraph_format.space_after = Pt(12)
+            right_cell.add_paragraph(exp.get('description', ''), 'Description')
 
+def _render_education(right_cell, data):
     # Education
     if 'education' in data and len(data['education']) > 0:
-        add_main_header("Education")
+        add_main_header(right_cell, "Education")
         for edu in data['education']:
-            p = right_cell.add_paragraph()
-            p.paragraph_format.space_after = Pt(0)
-            deg_run = p.add_run(edu.get('degree', ''))
-            deg_run.bold = True
-            deg_run.font.size = Pt(12)
-
-            p_school = right_cell.add_paragraph()
-            p_school.paragraph_format.space_after = Pt(12)
-            school_run = p_school.add_run(f"{edu.get('school', '')} | {edu.get('year', '')}")
-            school_run.italic = True
-            school_run.font.color.rgb = RGBColor(51, 65, 85)
-
-    # Save the document
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docx')
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    output_path = os.path.join(output_dir, 'cv_output.docx')
-    document.save(output_path)
+            right_cell.add_paragraph(edu.get('degree', ''), 'Degree')
+            right_cell.add_paragraph(f"{edu.get('school', '')} | {edu.get('year', '')}", 'School')
+
+SECTIONS = [
+    Section('name', 'sidebar', ('name', 'title'), _render_name),
+    Section('contact', 'sidebar', ('phone', 'email', 'location'), _render_contact),
+    Section('skills', 'sidebar', ('skills',), _render_skills),
+    Section('languages', 'sidebar', ('languages',), _render_languages),
+    Section('hobbies', 'sidebar', ('hobbies',), _render_hobbies),
+    Section('profile', 'main', ('summary',), _render_profile),
+    Section('experience', 'main', ('experience',), _render_experience),
+    Section('education', 'main', ('education',), _render_education),
+]
+
+def _containers(document):
+    table = document.tables[0]
+    return {'sidebar': table.cell(0, 0), 'main': table.cell(0, 1)}
+
+def build_cv(data):
+    document = new_document('cv', _setup_cv)
+    render_sections(SECTIONS, _containers(document), data, 'cv')
+    return document
+
+def render_cv(data, stream=None):
+    """
+    Render the CV for `data` (a payload dict or a schema.Resume) and
+    return the DOCX bytes, or write them to `stream` if one is given.
+    """
+    data = schema.view(data, 'cv')
+    return save_document(build_cv(data), stream)
+
+def create_cv(json_path):
+    data = load_json(json_path)
+    output_path = os.path.join(OUTPUT_DIR, 'cv_output.docx')
+    write_output(render_cv, data, output_path)
     print(f"CV generated successfully: {output_path}")
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        create_cv(sys.argv[1])
-    else:
-        print("Error: No JSON file provided.")
+    sys.exit(run_cli(render_cv, 'cv_output.docx', 'CV', name='cv'))
@@ -0,0 +1,217 @@
+"""
+Per-render resource budgets with graceful degradation.
+
+A render worker handles one render at a time, so a single bad payload - a
+huge photo, a payload at every list limit - could otherwise take all of its
+CPU and memory until the pool's timeout kills the process. render() runs a
+builder under three ceilings:
+
+- CPU time (RECEGEN_RENDER_CPU_MS), enforced with an ITIMER_VIRTUAL timer
+- wall time (RECEGEN_RENDER_WALL_MS), enforced with an ITIMER_REAL timer
+- memory (RECEGEN_RENDER_MEMORY_MB above the worker's size when it starts;
+  see limit_memory()), enforced with RLIMIT_AS
+
+A render that goes over budget isn't failed. The payload is degraded one
+step and rendered again, with a fresh budget, until it fits:
+
+    photo-dropped       render without the photo
+    lists-truncated     keep the first entries of long lists, shorten long texts
+    template-fallback   render with the ATS resume, the simplest template
+
+Photos that are too large to decode cheaply (RECEGEN_MAX_PHOTO_MB, or more
+than MAX_PHOTO_PIXELS) are downscaled before the first attempt
+(photo-downscaled). The steps taken are returned with the document and the
+builder that rendered it, and the worker reports both to the server.
+
+The timers need signal.setitimer and the memory limit the resource module;
+where they are missing (Windows) renders run unbounded. A timer that runs out
+while a cache is being updated raises once the update is done (see
+interrupts.py), so the worker's caches stay consistent.
+"""
+import os
+import io
+import signal
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import registry
+import schema
+import interrupts
+from interrupts import BudgetExceeded
+from photos import decode_photo, downscale
+
+CPU_MS = int(os.environ.get('RECEGEN_RENDER_CPU_MS', 8000))
+WALL_MS = int(os.environ.get('RECEGEN_RENDER_WALL_MS', 10000))
+MEMORY_MB = int(os.environ.get('RECEGEN_RENDER_MEMORY_MB', 512))
+MAX_PHOTO_BYTES = int(float(os.environ.get('RECEGEN_MAX_PHOTO_MB', 8)) * 1024 * 1024)
+MAX_PHOTO_PIXELS = 40 * 1000 * 1000
+
+# Size photos are brought down to before rendering when they are too large;
+# still more than any template shows them at
+DOWNSCALED_PHOTO_PX = 1000
+
+# What lists-truncated keeps
+TRUNCATED_ITEMS = {'experience': 10, 'education': 5, 'skills': 30, 'languages': 10, 'hobbies': 10}
+TRUNCATED_TEXT = 1000
+
+FALLBACK_BUILDER = 'ats-resume'
+
+# Held back while a cache is being updated (see interrupts.py)
+def _raise_cpu(signum, frame):
+    interrupts.interrupt(BudgetExceeded('cpu'))
+
+def _raise_wall(signum, frame):
+    interrupts.interrupt(BudgetExceeded('wall'))
+
+@contextmanager
+def budget(cpu_ms=None, wall_ms=None):
+    """
+    Raise BudgetExceeded in the block once it has used `cpu_ms` of CPU or
+    `wall_ms` of wall time. Only usable from the main thread.
+    """
+    cpu_ms = CPU_MS if cpu_ms is None else cpu_ms
+    wall_ms = WALL_MS if wall_ms is None else wall_ms
+    if not hasattr(signal, 'setitimer'):
+        yield
+        return
+    previous = signal.signal(signal.SIGVTALRM, _raise_cpu), signal.signal(signal.SIGALRM, _raise_wall)
+    signal.setitimer(signal.ITIMER_VIRTUAL, cpu_ms / 1000)
+    signal.setitimer(signal.ITIMER_REAL, wall_ms / 1000)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGVTALRM, previous[0])
+        signal.signal(signal.SIGALRM, previous[1])
+
+def limit_memory(megabytes=None):
+    """
+    Cap the process' address space at its current size plus `megabytes`,
+    so an allocation past it raises MemoryError. Call once, after start-up.
+    Returns the limit in bytes, or None if it can't be set here.
+    """
+    megabytes = MEMORY_MB if megabytes is None else megabytes
+    if resource is None or megabytes <= 0:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        return None
+    limit = current + megabytes * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return limit
+
+# Degradation steps: each returns the degraded (resume, builder name), or
+# None when it wouldn't change anything
+
+def _drop_photo(resume, builder):
+    if resume.photo is None:
+        return None
+    return resume._replace(photo=None), builder
+
+def _truncate_lists(resume, builder):
+    changes = {}
+    for name, keep in TRUNCATED_ITEMS.items():
+        value = getattr(resume, name)
+        if value is None:
+            continue
+        items = value[:keep]
+        if name in ('experience', 'education'):
+            items = tuple(entry._replace(**{key: text[:TRUNCATED_TEXT] for key, text in entry._asdict().items()
+                                            if text is not None and len(text) > TRUNCATED_TEXT})
+                          for entry in items)
+        if items != value:
+            changes[name] = items
+    if resume.summary is not None and len(resume.summary) > TRUNCATED_TEXT:
+        changes['summary'] = resume.summary[:TRUNCATED_TEXT]
+    if not changes:
+        return None
+    return resume._replace(**changes), builder
+
+def _fall_back(resume, builder):
+    if builder == FALLBACK_BUILDER:
+        return None
+    return resume, FALLBACK_BUILDER
+
+STEPS = [
+    ('photo-dropped', _drop_photo),
+    ('lists-truncated', _truncate_lists),
+    ('template-fallback', _fall_back),
+]
+
+def _photo_too_large(image_data):
+    if len(image_data) > MAX_PHOTO_BYTES:
+        return True
+    if Image is None:
+        return False
+    try:
+        # Only reads the header
+        with Image.open(io.BytesIO(image_data)) as image:
+            return image.width * image.height > MAX_PHOTO_PIXELS
+    except Exception:
+        return False
+
+def preflight(resume):
+    """
+    Degrade what is certain to be over budget before rendering at all.
+    Returns (resume, steps taken).
+    """
+    if resume.photo is None:
+        return resume, []
+    try:
+        image_data = decode_photo(resume.photo)
+    except ValueError:
+        return resume, []  # the builders report undecodable photos
+    if not _photo_too_large(image_data):
+        return resume, []
+    if Image is not None:
+        try:
+            with budget():
+                smaller = downscale(image_data, DOWNSCALED_PHOTO_PX, draft=True)
+            if not _photo_too_large(smaller):
+                return resume._replace(photo=smaller), ['photo-downscaled']
+        except (BudgetExceeded, MemoryError, OSError, ValueError):
+            pass
+    return resume._replace(photo=None), ['photo-dropped']
+
+def render(builder, data, fallback=True):
+    """
+    Render `data` with `builder` (a registry.Builder) within the budgets,
+    degrading the payload as needed. Returns (DOCX bytes, steps taken, the
+    registry.Builder that rendered it), which after template-fallback isn't
+    `builder`; fallback=False skips that step (e.g. for a bundle, which has
+    the ATS resume already). Raises BudgetExceeded or MemoryError only when
+    even the last step is over budget.
+    """
+    resume, steps = preflight(schema.parse(data))
+    name = builder.name
+    remaining = [(step, degrade) for step, degrade in STEPS if fallback or degrade is not _fall_back]
+    while True:
+        try:
+            with budget():
+                rendered = registry.get_builder(name)
+                return rendered.render(resume), steps, rendered
+        except (BudgetExceeded, MemoryError):
+            while remaining:
+                step, degrade = remaining.pop(0)
+                degraded = degrade(resume, name)
+                if degraded is not None:
+                    resume, name = degraded
+                    steps.append(step)
+                    break
+            else:
+                raise
@@ -0,0 +1,59 @@
+"""
+Critical sections the render budgets can't interrupt.
+
+governor.py raises BudgetExceeded from signal handlers, so it can land
+between any two bytecodes of a render - including halfway through updating
+one of the caches that outlive it (photos.py, sections.py, render_utils.py,
+fonts.py), which would then stay inconsistent for every later render in the
+worker. Those updates run inside deferred(); an exception raised with
+interrupt() while one is running is held back and raised as the outermost
+block exits.
+
+    with interrupts.deferred():
+        _cache[key] = value
+        _cache_bytes += len(value)
+
+Signal handlers only run in the main thread, and so does everything here.
+BudgetExceeded lives here rather than in governor.py so the builders can
+tell it apart from their own errors without importing the governor.
+"""
+from contextlib import contextmanager
+
+class BudgetExceeded(Exception):
+    """
+    Raised inside a render that used up its CPU or wall time budget.
+    """
+    def __init__(self, resource_name):
+        super().__init__(f"render exceeded its {resource_name} budget")
+        self.resource = resource_name
+
+_depth = 0
+_pending = None
+
+@contextmanager
+def deferred():
+    """
+    Hold back interrupt()s until the block (and any it is nested in) exits.
+    Keep the block short: a budget can't stop a render while it runs.
+    """
+    global _depth, _pending
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        if _depth == 0 and _pending is not None:
+            exception, _pending = _pending, None
+            raise exception
+
+def interrupt(exception):
+    """
+    Raise `exception` now, or when the running deferred() block exits. For
+    signal handlers.
+    """
+    global _pending
+    if _depth:
+        if _pending is None:
+            _pending = exception
+        return
+    raise exception
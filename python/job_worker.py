@@ -0,0 +1,174 @@
+"""
+Render jobs from the server's spool directory.
+
+When the server runs with RENDER_JOB_QUEUE_DIR, jobs from POST /api/jobs are
+queued as files in that directory (see jobs.js) and any number of these
+workers - on the same host or on others that mount the directory - claim
+and render them. A job is claimed by renaming it from pending/ to claimed/,
+which only one worker can win; the result is left in done/ for the server.
+While a job renders the worker touches its claim every --heartbeat seconds,
+which must stay well under the server's claim timeout (5 minutes): the
+server puts back claims that stop being touched, as a dead worker's. Jobs
+whose files can't be read are moved to failed/ and reported as failed.
+
+    python job_worker.py /var/spool/recegen
+    python job_worker.py /var/spool/recegen --max-jobs 500 --poll 0.5
+
+Run the server with RENDER_JOB_CONCURRENCY=0 to leave all job rendering to
+the workers.
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import traceback
+from contextlib import contextmanager
+
+import registry
+import governor
+import timings
+
+# Seconds between touches of a claim being rendered
+HEARTBEAT_S = 30
+
+def _write_atomic(path, data):
+    # Renamed into place so the server never reads a partial file
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+class Spool:
+    def __init__(self, root):
+        self.pending = os.path.join(root, 'pending')
+        self.claimed = os.path.join(root, 'claimed')
+        self.done = os.path.join(root, 'done')
+        self.failed = os.path.join(root, 'failed')
+        for path in (self.pending, self.claimed, self.done, self.failed):
+            os.makedirs(path, exist_ok=True)
+
+    def claim(self):
+        """
+        Claim the oldest pending job and return (header, photo bytes or
+        None), or None if there is nothing to do.
+        """
+        for name in sorted(n for n in os.listdir(self.pending) if n.endswith('.json')):
+            claimed = os.path.join(self.claimed, name)
+            try:
+                os.rename(os.path.join(self.pending, name), claimed)
+            except FileNotFoundError:
+                continue  # another worker was first
+            job_id = name[:-len('.json')]
+            try:
+                # The claim's age tells the server whether this worker is still alive
+                os.utime(claimed)
+                with open(claimed) as f:
+                    header = json.load(f)
+                photo = None
+                if header.get('photo'):
+                    photo_name = f"{job_id}.photo"
+                    os.rename(os.path.join(self.pending, photo_name), os.path.join(self.claimed, photo_name))
+                    with open(os.path.join(self.claimed, photo_name), 'rb') as f:
+                        photo = f.read()
+            except (OSError, ValueError, AttributeError) as e:
+                self.set_aside(job_id, e)
+                continue
+            return header, photo
+        return None
+
+    def set_aside(self, job_id, error):
+        """
+        Move what is left of a job that can't be read to failed/ and leave a
+        failed result for the server, instead of it being claimed again.
+        """
+        for directory, suffix in ((self.claimed, '.json'), (self.claimed, '.photo'), (self.pending, '.photo')):
+            try:
+                os.rename(os.path.join(directory, job_id + suffix), os.path.join(self.failed, job_id + suffix))
+            except OSError:
+                pass
+        print(f"Job {job_id} moved to failed/: {error}", file=sys.stderr)
+        self.finish(job_id, {'id': job_id, 'ok': False, 'error': f"Unreadable job files: {error}"})
+
+    @contextmanager
+    def heartbeat(self, job_id, interval):
+        """
+        Touch the claim on `job_id` every `interval` seconds until the block
+        exits, so a long render isn't taken for a dead worker's and run twice.
+        """
+        path = os.path.join(self.claimed, f"{job_id}.json")
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    return
+
+        thread = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def finish(self, job_id, result, body=None):
+        if body is not None:
+            _write_atomic(os.path.join(self.done, f"{job_id}.docx"), body)
+        _write_atomic(os.path.join(self.done, f"{job_id}.json"), json.dumps(result).encode('utf-8'))
+        for suffix in ('.photo', '.json'):
+            try:
+                os.remove(os.path.join(self.claimed, job_id + suffix))
+            except FileNotFoundError:
+                pass
+
+def run_job(spool, header, photo, heartbeat=HEARTBEAT_S):
+    job_id = header['id']
+    data = header.get('data') or {}
+    if photo is not None:
+        data['photo'] = photo
+    try:
+        builder = registry.get_builder(header.get('builder'))
+        with spool.heartbeat(job_id, heartbeat), timings.record() as phases:
+            with timings.phase('build'):
+                docx_bytes, degraded, rendered = governor.render(builder, data)
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        spool.finish(job_id, {'id': job_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"})
+        return False
+    spool.finish(job_id, {'id': job_id, 'ok': True, 'builder': rendered.name, 'filename': rendered.filename,
+                          'size': len(docx_bytes),
+                          'degraded': degraded, 'timings': timings.rounded(phases)}, docx_bytes)
+    timings.emit({'type': 'timings', 'builder': builder.name, 'job': job_id,
+                  'phases': timings.rounded(phases), 'bytes': len(docx_bytes)})
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render jobs from the server's spool directory.")
+    parser.add_argument('spool', help="The server's RENDER_JOB_QUEUE_DIR.")
+    parser.add_argument('--poll', type=float, default=0.2, help="Seconds between looks at an empty queue (default: 0.2).")
+    parser.add_argument('--max-jobs', type=int, default=0, help="Exit after this many jobs (0 = never).")
+    parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_S,
+                        help=f"Seconds between touches of a claim while it renders (default: {HEARTBEAT_S}).")
+    args = parser.parse_args(argv)
+
+    spool = Spool(args.spool)
+    registry.warm_up()
+    governor.limit_memory()
+    jobs = 0
+    while not args.max_jobs or jobs < args.max_jobs:
+        claimed = spool.claim()
+        if claimed is None:
+            if args.once:
+                break
+            time.sleep(args.poll)
+            continue
+        run_job(spool, *claimed, heartbeat=args.heartbeat)
+        jobs += 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
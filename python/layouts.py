@@ -0,0 +1,394 @@
+"""
+The templates' layouts, for rendering without python-docx.
+
+A PageLayout is a template's definition as the builder uses it - its
+prototype setup, its Sections and the containers they render into - plus
+what the prototype says about the page: size and margins, the layout
+tables with their column widths and shading, and the effective formatting
+of every style. record() runs the builder's own section functions against
+light recording stand-ins for python-docx's containers, paragraphs, runs
+and tables, so whatever reads the recording (page_fit.py estimating pages,
+preview.py writing HTML) sees exactly what the DOCX would contain, without
+a template of its own that could drift from it.
+"""
+from collections import namedtuple
+
+from lxml import etree
+from docx.document import Document
+from docx.image.image import Image
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
+
+import schema
+import registry
+import resume_builder
+import ats_resume_builder
+import ats_cv_builder
+import generate_cv
+import modern_resume_builder
+from prototypes import new_document
+
+# Word's default left and right cell margins
+CELL_MARGIN_PT = 5.4
+
+# Resolved formatting
+
+Format = namedtuple('Format', ['font', 'size', 'bold', 'italic', 'color', 'before', 'after', 'line', 'line_rule',
+                               'indent', 'alignment'])
+
+def _on(element):
+    return element is not None and element.get(qn('w:val')) not in ('0', 'false', 'off')
+
+def _twips_pt(value):
+    return None if value is None else int(value) / 20
+
+class StyleSheet:
+    """
+    Effective paragraph and character formatting of a template's styles.
+    """
+    def __init__(self, document):
+        styles = document.styles.element
+        self._by_id = {style.get(qn('w:styleId')): style for style in styles.iterchildren(qn('w:style'))}
+        self._ids = {}
+        for style_id, style in self._by_id.items():
+            name = style.find(qn('w:name'))
+            self._ids[(style.get(qn('w:type')), name.get(qn('w:val')) if name is not None else style_id)] = style_id
+        self._theme = self._theme_fonts(document)
+        defaults = styles.find(qn('w:docDefaults'))
+        self.defaults = self._merge(Format(None, 10.0, False, False, None, 0.0, 0.0, 240, 'auto', 0.0, 'left'),
+                                    defaults.find(f"{qn('w:pPrDefault')}/{qn('w:pPr')}") if defaults is not None else None,
+                                    defaults.find(f"{qn('w:rPrDefault')}/{qn('w:rPr')}") if defaults is not None else None)
+        self._resolved = {}
+
+    @staticmethod
+    def _theme_fonts(document):
+        fonts = {}
+        for part in document.part.package.iter_parts():
+            if part.content_type.endswith('.theme+xml'):
+                theme = etree.fromstring(part.blob)
+                namespace = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+                for kind in ('major', 'minor'):
+                    latin = theme.find(f'.//{namespace}{kind}Font/{namespace}latin')
+                    if latin is not None:
+                        fonts[f'{kind}HAnsi'] = latin.get('typeface')
+        return fonts
+
+    def _merge(self, fmt, ppr, rpr):
+        changes = {}
+        if ppr is not None:
+            spacing = ppr.find(qn('w:spacing'))
+            if spacing is not None:
+                for key, attribute in (('before', 'w:before'), ('after', 'w:after')):
+                    if spacing.get(qn(attribute)) is not None:
+                        changes[key] = _twips_pt(spacing.get(qn(attribute)))
+                if spacing.get(qn('w:line')) is not None:
+                    changes['line'] = int(spacing.get(qn('w:line')))
+                    changes['line_rule'] = spacing.get(qn('w:lineRule'), 'auto')
+            indent = ppr.find(qn('w:ind'))
+            if indent is not None and indent.get(qn('w:left')) is not None:
+                changes['indent'] = _twips_pt(indent.get(qn('w:left')))
+            justification = ppr.find(qn('w:jc'))
+            if justification is not None:
+                changes['alignment'] = justification.get(qn('w:val'))
+        if rpr is not None:
+            fonts = rpr.find(qn('w:rFonts'))
+            if fonts is not None:
+                font = fonts.get(qn('w:ascii')) or self._theme.get(fonts.get(qn('w:asciiTheme')))
+                if font:
+                    changes['font'] = font
+            size = rpr.find(qn('w:sz'))
+            if size is not None:
+                changes['size'] = int(size.get(qn('w:val'))) / 2
+            for key in ('bold', 'italic'):
+                element = rpr.find(qn('w:b' if key == 'bold' else 'w:i'))
+                if element is not None:
+                    changes[key] = _on(element)
+            color = rpr.find(qn('w:color'))
+            if color is not None:
+                value = color.get(qn('w:val'))
+                changes['color'] = None if value in (None, 'auto') else value
+        return fmt._replace(**changes)
+
+    def _chain(self, style_id):
+        chain = []
+        while style_id in self._by_id and style_id not in chain:
+            chain.append(style_id)
+            based_on = self._by_id[style_id].find(qn('w:basedOn'))
+            style_id = based_on.get(qn('w:val')) if based_on is not None else None
+        return chain
+
+    def resolve(self, name, kind='paragraph', base=None):
+        """
+        The formatting of style `name` (None for the default paragraph
+        style) applied over `base`, by default the document defaults.
+        """
+        key = (name, kind, base)
+        if key not in self._resolved:
+            if name is None:
+                name = 'Normal' if kind == 'paragraph' else None
+            # Built-in styles are stored under their internal names ('heading 1')
+            style_id = self._ids.get((kind, BabelFish.ui2internal(name)), name)
+            fmt = base or self.defaults
+            for link in reversed(self._chain(style_id)):
+                style = self._by_id[link]
+                fmt = self._merge(fmt, style.find(qn('w:pPr')), style.find(qn('w:rPr')))
+            self._resolved[key] = fmt
+        return self._resolved[key]
+
+# Recording stand-ins for python-docx's containers, paragraphs, runs and
+# tables: enough of them for the builders' section functions
+
+# A picture's size in points and its image
+Picture = namedtuple('Picture', ['width', 'height', 'content_type', 'blob'])
+
+class Font:
+    __slots__ = ('size', 'name', 'bold', 'italic', 'color')
+
+    def __init__(self):
+        self.size = self.name = self.bold = self.italic = None
+        self.color = Color()
+
+class Color:
+    __slots__ = ('rgb',)
+
+    def __init__(self):
+        self.rgb = None
+
+class ParagraphFormat:
+    __slots__ = ('space_before', 'space_after', 'left_indent', 'alignment')
+
+    def __init__(self):
+        self.space_before = self.space_after = self.left_indent = self.alignment = None
+
+class Run:
+    __slots__ = ('text', 'style', 'font', 'picture')
+
+    def __init__(self, text, style):
+        self.text = text or ''
+        self.style = style
+        self.font = Font()
+        self.picture = None
+
+    @property
+    def bold(self):
+        return self.font.bold
+
+    @bold.setter
+    def bold(self, value):
+        self.font.bold = value
+
+    @property
+    def italic(self):
+        return self.font.italic
+
+    @italic.setter
+    def italic(self, value):
+        self.font.italic = value
+
+    def add_picture(self, image_stream, width=None, height=None):
+        image_stream.seek(0)
+        image = Image.from_blob(image_stream.read())
+        cx, cy = image.scaled_dimensions(width, height)
+        self.picture = Picture(cx / 12700, cy / 12700, image.content_type, image.blob)
+
+class Paragraph:
+    __slots__ = ('style', 'runs', 'paragraph_format')
+
+    def __init__(self, text='', style=None):
+        self.style = style
+        self.runs = []
+        self.paragraph_format = ParagraphFormat()
+        if text:
+            self.add_run(text)
+
+    @property
+    def alignment(self):
+        return self.paragraph_format.alignment
+
+    @alignment.setter
+    def alignment(self, value):
+        self.paragraph_format.alignment = value
+
+    @property
+    def text(self):
+        return ''.join(run.text for run in self.runs)
+
+    def add_run(self, text=None, style=None):
+        run = Run(text, style)
+        self.runs.append(run)
+        return run
+
+class Container:
+    """
+    The body or a table cell: paragraphs and tables in order.
+    """
+    __slots__ = ('blocks',)
+
+    def __init__(self, blocks=()):
+        self.blocks = list(blocks)
+
+    @property
+    def paragraphs(self):
+        return [block for block in self.blocks if isinstance(block, Paragraph)]
+
+    def add_paragraph(self, text='', style=None):
+        paragraph = Paragraph(text, style)
+        self.blocks.append(paragraph)
+        return paragraph
+
+    def add_heading(self, text='', level=1):
+        return self.add_paragraph(text, 'Title' if level == 0 else 'Heading %d' % level)
+
+    def add_table(self, rows, cols):
+        table = Table(rows, cols)
+        self.blocks.append(table)
+        return table
+
+class Cell(Container):
+    __slots__ = ()
+
+    @property
+    def text(self):
+        return '\n'.join(paragraph.text for paragraph in self.paragraphs)
+
+    @text.setter
+    def text(self, value):
+        self.blocks = [Paragraph(value)]
+
+class Row:
+    __slots__ = ('cells',)
+
+    def __init__(self, cols):
+        # A new cell holds one empty paragraph, as in Word
+        self.cells = [Cell([Paragraph()]) for _ in range(cols)]
+
+class Table:
+    __slots__ = ('rows', 'columns')
+
+    def __init__(self, rows, cols):
+        self.columns = cols
+        self.rows = [Row(cols) for _ in range(rows)]
+
+    def add_row(self):
+        row = Row(self.columns)
+        self.rows.append(row)
+        return row
+
+    def cell(self, row_idx, col_idx):
+        return self.rows[row_idx].cells[col_idx]
+
+# Page layouts
+
+# A cell of a layout table: the container rendered into it, its width in
+# points and its background colour (hex, or None)
+Region = namedtuple('Region', ['key', 'width', 'fill'])
+
+class PageLayout:
+    """
+    A template's page geometry and styles, read from its prototype once,
+    and the means to build its document. `build(data)` returns the
+    python-docx Document for a builder view of the payload.
+    """
+    def __init__(self, name, setup, sections, containers, build):
+        self.name = name
+        self.setup = setup
+        self.sections = sections
+        self.containers = containers
+        self.build = build
+        self._loaded = False
+
+    def _load(self):
+        document = new_document(self.name, self.setup)
+        self.styles = StyleSheet(document)
+        section = document.sections[0]
+        self.page_width = section.page_width.pt
+        self.margins = (section.top_margin.pt, section.right_margin.pt, section.bottom_margin.pt,
+                        section.left_margin.pt)
+        self.page_height = section.page_height.pt - section.top_margin.pt - section.bottom_margin.pt
+        self.body_width = self.page_width - section.left_margin.pt - section.right_margin.pt
+
+        # Where each container's blocks go: the body, or a cell of a layout
+        # table. Paragraphs already in the prototype stay in front.
+        self.body = 'body'
+        cells = {}
+        for key, container in self.containers(document).items():
+            if isinstance(container, Document):
+                self.body = key
+            else:
+                cells[container._tc] = key
+        # The prototype's body in order: ('paragraph', index into its static
+        # paragraphs) or ('table', index into self.tables)
+        self.order = []
+        self.tables = []
+        static_body = []
+        tables = iter(document.tables)
+        for element in document.element.body:
+            if element.tag == qn('w:p'):
+                self.order.append(('paragraph', len(static_body)))
+                static_body.append(element)
+            elif element.tag == qn('w:tbl'):
+                self.order.append(('table', len(self.tables)))
+                self.tables.append(self._table(next(tables), cells))
+        self.static = {self.body: [Paragraph(p.text, p.style.name) for p in document.paragraphs]}
+        for table in document.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    self.static[cells.get(cell._tc, cell._tc)] = [Paragraph(p.text, p.style.name)
+                                                                  for p in cell.paragraphs]
+        self.regions = [row for table in self.tables for row in table]
+        # Word always ends the body with a paragraph, after a final table too
+        body = document.element.body
+        self.trailing_paragraph = len(body) > 1 and body[-2].tag == qn('w:tbl')
+        self._loaded = True
+
+    @staticmethod
+    def _table(table, cells):
+        widths = [column.width.pt - 2 * CELL_MARGIN_PT for column in table.columns]
+        rows = []
+        for row in table.rows:
+            region = []
+            for cell, width in zip(row.cells, widths):
+                shading = cell._tc.tcPr.find(qn('w:shd')) if cell._tc.tcPr is not None else None
+                fill = shading.get(qn('w:fill')) if shading is not None else None
+                region.append(Region(cells.get(cell._tc, cell._tc), width, None if fill == 'auto' else fill))
+            rows.append(region)
+        return rows
+
+    def load(self):
+        if not self._loaded:
+            self._load()
+        return self
+
+    def record(self, data):
+        """
+        {container key: Container} with what the builder renders for
+        `data` (a payload dict or a schema.Resume), behind what the
+        prototype already holds.
+        """
+        self.load()
+        containers = {key: Container(self.static.get(key, ())) for key in self.static}
+        view = schema.view(data, self.name)
+        for section in self.sections:
+            section.render(containers[section.container], {key: view[key] for key in section.inputs if key in view})
+        return containers
+
+LAYOUTS = {
+    'resume': PageLayout('resume', None, resume_builder.SECTIONS, resume_builder._containers,
+                         resume_builder.build_resume),
+    'ats-resume': PageLayout('ats-resume', ats_resume_builder._setup_ats_resume, ats_resume_builder.SECTIONS,
+                             ats_resume_builder._containers, ats_resume_builder.build_ats_resume),
+    'ats-cv': PageLayout('ats-cv', ats_cv_builder._setup_ats_cv, ats_cv_builder.SECTIONS,
+                         ats_cv_builder._containers, ats_cv_builder.build_ats_cv),
+    'cv': PageLayout('cv', generate_cv._setup_cv, generate_cv.SECTIONS,
+                     generate_cv._containers, generate_cv.build_cv),
+    'modern-resume': PageLayout('modern-resume', modern_resume_builder._setup_modern_resume,
+                                modern_resume_builder.SECTIONS, modern_resume_builder._containers,
+                                modern_resume_builder.build_modern_resume),
+}
+
+def get_layout(name):
+    registry.get_builder(name)  # for the error message
+    try:
+        return LAYOUTS[name]
+    except KeyError:
+        raise ValueError(f"Builder '{name}' has no layout. Expected one of: {', '.join(sorted(LAYOUTS))}")
@@ -0,0 +1,439 @@
+"""
+Load-test the server's /api/generate-* endpoints.
+
+Requests go to all five generate endpoints, with payloads drawn from a mix
+of synthetic ones (see benchmark.make_payload) and the fixtures in the
+repository root. There are two arrival models:
+
+    closed   --concurrency clients, each sending its next request as soon
+             as the last one is answered (the default)
+    open     --rate requests per second with Poisson arrivals, at most
+             --concurrency in flight; latency counts from the scheduled
+             arrival, so a server that falls behind can't hide it
+
+Reported: throughput, p50/p95/p99 latency and error rate overall and per
+endpoint, and a timeline of completions, errors, p95 latency and server
+memory. Memory is read from the server's /metrics
+(process_resident_memory_bytes) and, with --server-pid, from /proc for the
+server and all its render workers. Results can be saved and compared, for
+instance across server configurations:
+
+    python load_test.py --duration 60 --concurrency 16 -o pool4.json --label "4 workers"
+    python load_test.py --rate 20 --concurrency 64 --requests 2000 -o rate20.json
+    python load_test.py --compare pool4.json pool8.json
+
+Payloads are made distinct per request (the name gets a sequence number) so
+the render cache doesn't answer them; --repeat-payloads sends them as drawn.
+Only the standard library is used: requests are plain HTTP/1.1 over asyncio
+streams, one connection each.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import benchmark
+
+ENDPOINTS = {
+    'resume': '/api/generate-resume',
+    'cv': '/api/generate-cv',
+    'ats-cv': '/api/generate-ats-cv',
+    'ats-resume': '/api/generate-ats-resume',
+    'modern-resume': '/api/generate-modern-resume',
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = [os.path.join(ROOT, 'test_payload.json'), os.path.join(ROOT, 'test_resume.json')]
+
+PERCENTILES = (50, 95, 99)
+
+# --- Payloads ---
+
+def payload_pool(entries, fixtures, fixture_share, size=64, seed=0):
+    """
+    (source, payload) pairs to draw from: `size` synthetic payloads with
+    `entries` experience/education entries and a mix of skill shapes,
+    and the `fixtures`, weighted to make up `fixture_share` of draws.
+    """
+    rng = random.Random(seed)
+    synthetic = [('synthetic', benchmark.make_payload(rng.choice(entries), rng.choice(benchmark.SKILL_SHAPES),
+                                                      seed=rng.randrange(1 << 30)))
+                 for _ in range(size)]
+    loaded = []
+    for path in fixtures:
+        with open(path, 'r') as f:
+            loaded.append((os.path.basename(path), json.load(f)))
+    if not loaded or fixture_share <= 0:
+        return synthetic
+    if fixture_share >= 1:
+        return loaded
+    # Repeat the fixtures until they are `fixture_share` of the pool
+    repeats = max(1, round(fixture_share * len(synthetic) / ((1 - fixture_share) * len(loaded))))
+    return synthetic + loaded * repeats
+
+# --- HTTP ---
+
+class HttpError(Exception):
+    pass
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                await reader.readline()
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+    return await reader.read()
+
+async def request(host, port, method, path, body=b'', content_type='application/json'):
+    """
+    One HTTP/1.1 request on its own connection. Returns (status, headers,
+    body).
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+            raise HttpError(f"bad status line {status_line[:80]!r}")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), headers, await _read_body(reader, headers)
+    finally:
+        writer.close()
+
+# --- Measuring ---
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of sorted `values`.
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+def summarize(records, elapsed):
+    """
+    Throughput, error rate and latency percentiles (ms) of `records`.
+    """
+    latencies = sorted(record['ms'] for record in records if record['ok'])
+    errors = sum(not record['ok'] for record in records)
+    statuses = {}
+    for record in records:
+        key = str(record['status'] or record['error'])
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        'requests': len(records),
+        'errors': errors,
+        'error_rate': round(errors / len(records), 4) if records else 0,
+        'throughput': round(len(records) / elapsed, 2) if elapsed else None,
+        'latency_ms': {f'p{p}': percentile(latencies, p) for p in PERCENTILES},
+        'statuses': statuses,
+    }
+
+def _tree_rss_kb(pid):
+    """
+    RSS of `pid` and all its descendants, from /proc (Linux only).
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+        stack.extend(children.get(current, ()))
+    return total
+
+def _parse_metrics(text, names):
+    values = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        name, _, value = line.rpartition(' ')
+        if name in names:
+            values[name] = float(value)
+    return values
+
+class Sampler:
+    """
+    Samples server memory and queue depth every `interval` seconds.
+    """
+    GAUGES = ('process_resident_memory_bytes', 'recegen_render_queue_depth', 'recegen_render_running')
+
+    def __init__(self, host, port, interval, server_pid=None):
+        self.host, self.port = host, port
+        self.interval = interval
+        self.server_pid = server_pid
+        self.samples = []
+
+    async def sample(self, start):
+        sample = {'t': round(time.monotonic() - start, 3)}
+        try:
+            status, _, body = await request(self.host, self.port, 'GET', '/metrics')
+            if status == 200:
+                gauges = _parse_metrics(body.decode('utf-8'), self.GAUGES)
+                if 'process_resident_memory_bytes' in gauges:
+                    sample['server_rss_kb'] = int(gauges['process_resident_memory_bytes'] // 1024)
+                if 'recegen_render_queue_depth' in gauges:
+                    sample['queue_depth'] = int(gauges['recegen_render_queue_depth'])
+                if 'recegen_render_running' in gauges:
+                    sample['running'] = int(gauges['recegen_render_running'])
+        except (OSError, HttpError, asyncio.IncompleteReadError):
+            pass
+        if self.server_pid:
+            sample['tree_rss_kb'] = _tree_rss_kb(self.server_pid)
+        self.samples.append(sample)
+
+    async def run(self, start, stop):
+        while not stop.is_set():
+            await self.sample(start)
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        await self.sample(start)
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        url = urlsplit(args.url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.rng = random.Random(args.seed)
+        self.pool = payload_pool(args.entries, args.fixtures, args.fixture_share, seed=args.seed)
+        self.sequence = 0
+        self.records = []
+
+    def next_request(self):
+        self.sequence += 1
+        endpoint = self.rng.choice(self.args.endpoints)
+        source, payload = self.rng.choice(self.pool)
+        if not self.args.repeat_payloads:
+            payload = {**payload, 'name': f"{payload.get('name', 'Load Test')} #{self.sequence}"}
+        return endpoint, source, json.dumps(payload).encode('utf-8')
+
+    async def send(self, endpoint, source, body, scheduled):
+        record = {'t': None, 'endpoint': endpoint, 'source': source, 'status': None, 'ok': False}
+        try:
+            status, headers, content = await request(self.host, self.port, 'POST', ENDPOINTS[endpoint], body)
+            record.update(status=status, ok=200 <= status < 300, bytes=len(content),
+                          cache=headers.get('x-render-cache'))
+        except (OSError, HttpError, asyncio.IncompleteReadError, ValueError) as e:
+            record['error'] = type(e).__name__
+        now = time.monotonic()
+        record['t'] = round(now - self.start, 3)
+        record['ms'] = round((now - scheduled) * 1000, 2)
+        self.records.append(record)
+
+    def done(self, sent):
+        args = self.args
+        if args.requests and sent >= args.requests:
+            return True
+        return bool(args.duration) and time.monotonic() - self.start >= args.duration
+
+    async def closed_loop(self):
+        sent = 0
+
+        async def client():
+            nonlocal sent
+            while not self.done(sent):
+                sent += 1
+                await self.send(*self.next_request(), time.monotonic())
+
+        await asyncio.gather(*(client() for _ in range(self.args.concurrency)))
+
+    async def open_loop(self):
+        slots = asyncio.Semaphore(self.args.concurrency)
+        tasks = set()
+        sent = 0
+        arrival = time.monotonic()
+
+        async def send(request_args, scheduled):
+            async with slots:
+                await self.send(*request_args, scheduled)
+
+        while not self.done(sent):
+            arrival += self.rng.expovariate(self.args.rate)
+            delay = arrival - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent += 1
+            task = asyncio.ensure_future(send(self.next_request(), arrival))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def run(self):
+        args = self.args
+        sampler = Sampler(self.host, self.port, args.sample_interval, args.server_pid)
+        stop = asyncio.Event()
+        self.start = time.monotonic()
+        sampling = asyncio.ensure_future(sampler.run(self.start, stop))
+        try:
+            await (self.open_loop() if args.rate else self.closed_loop())
+        finally:
+            elapsed = time.monotonic() - self.start
+            stop.set()
+            await sampling
+        return self.report(elapsed, sampler.samples)
+
+    def timeline(self):
+        buckets = {}
+        for record in self.records:
+            buckets.setdefault(int(record['t'] // self.args.sample_interval), []).append(record)
+        timeline = []
+        for index in sorted(buckets):
+            records = buckets[index]
+            latencies = sorted(record['ms'] for record in records if record['ok'])
+            timeline.append({'t': round(index * self.args.sample_interval, 3), 'completed': len(records),
+                             'errors': sum(not record['ok'] for record in records),
+                             'p95_ms': percentile(latencies, 95)})
+        return timeline
+
+    def report(self, elapsed, samples):
+        args = self.args
+        endpoints = {endpoint: summarize([r for r in self.records if r['endpoint'] == endpoint], elapsed)
+                     for endpoint in args.endpoints}
+        return {
+            'label': args.label,
+            'environment': {
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+            'config': {
+                'url': args.url, 'model': 'open' if args.rate else 'closed', 'rate': args.rate,
+                'concurrency': args.concurrency, 'duration': args.duration, 'requests': args.requests,
+                'endpoints': args.endpoints, 'entries': args.entries, 'fixture_share': args.fixture_share,
+                'repeat_payloads': args.repeat_payloads, 'seed': args.seed,
+            },
+            'elapsed_s': round(elapsed, 3),
+            'summary': summarize(self.records, elapsed),
+            'endpoints': endpoints,
+            'timeline': self.timeline(),
+            'samples': samples,
+        }
+
+# --- Output ---
+
+def _ms(value):
+    return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+
+def print_report(report):
+    summary = report['summary']
+    print(f"{summary['requests']} requests in {report['elapsed_s']:.1f}s: {summary['throughput']} req/s, "
+          f"{summary['errors']} errors ({summary['error_rate']:.1%})")
+    print(f"{'endpoint':<16}{'requests':>9}{'req/s':>9}{'errors':>8}" + ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+    rows = list(report['endpoints'].items()) + [('all', summary)]
+    for name, stats in rows:
+        print(f"{name:<16}{stats['requests']:>9}{stats['throughput'] or 0:>9.1f}{stats['errors']:>8}"
+              + ''.join(f"  {_ms(stats['latency_ms'][f'p{p}'])}" for p in PERCENTILES))
+    memory = [s for s in report['samples'] if 'server_rss_kb' in s or 'tree_rss_kb' in s]
+    if memory:
+        for key, label in (('server_rss_kb', 'server RSS'), ('tree_rss_kb', 'server + workers RSS')):
+            values = [s[key] for s in memory if key in s]
+            if values:
+                print(f"{label}: {values[0] / 1024:.0f} MB at start, {max(values) / 1024:.0f} MB peak, "
+                      f"{values[-1] / 1024:.0f} MB at end")
+
+def compare(paths):
+    """
+    Print the headline numbers of saved results side by side.
+    """
+    reports = []
+    for path in paths:
+        with open(path, 'r') as f:
+            reports.append(json.load(f))
+    names = [report.get('label') or os.path.basename(path) for report, path in zip(reports, paths)]
+    width = max(12, *(len(name) + 2 for name in names))
+    print(f"{'':<22}" + ''.join(f"{name:>{width}}" for name in names))
+
+    def row(label, values, unit=''):
+        print(f"{label:<22}" + ''.join(f"{'-' if value is None else f'{value:g}{unit}':>{width}}" for value in values))
+
+    row('requests', [r['summary']['requests'] for r in reports])
+    row('throughput', [r['summary']['throughput'] for r in reports], '/s')
+    row('error rate', [round(r['summary']['error_rate'] * 100, 2) for r in reports], '%')
+    for p in PERCENTILES:
+        row(f'p{p} latency', [r['summary']['latency_ms'][f'p{p}'] for r in reports], 'ms')
+    for key, label in (('server_rss_kb', 'peak server RSS'), ('tree_rss_kb', 'peak tree RSS')):
+        peaks = [max((s[key] for s in r['samples'] if key in s), default=None) for r in reports]
+        if any(peak is not None for peak in peaks):
+            row(label, [None if peak is None else round(peak / 1024) for peak in peaks], 'MB')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the /api/generate-* endpoints.")
+    parser.add_argument('--url', default='http://localhost:3000', help="Server URL (default: http://localhost:3000).")
+    parser.add_argument('-c', '--concurrency', type=int, default=8,
+                        help="Clients (closed model) or most requests in flight (open model); default 8.")
+    parser.add_argument('--rate', type=float, help="Requests per second, Poisson arrivals (open model).")
+    parser.add_argument('-d', '--duration', type=float, default=30, help="Seconds to run (default: 30, 0 = no limit).")
+    parser.add_argument('-n', '--requests', type=int, default=0, help="Stop after this many requests (0 = no limit).")
+    parser.add_argument('-e', '--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--entries', nargs='+', type=int, default=[0, 3, 10],
+                        help="Entry counts of synthetic payloads (default: 0 3 10).")
+    parser.add_argument('--fixtures', nargs='*', default=FIXTURES, help="Fixture payloads (default: the repo's).")
+    parser.add_argument('--fixture-share', type=float, default=0.25,
+                        help="Share of requests using a fixture (default: 0.25).")
+    parser.add_argument('--repeat-payloads', action='store_true',
+                        help="Send payloads as drawn, so the render cache can answer repeats.")
+    parser.add_argument('--server-pid', type=int, help="Also sample the RSS of this process and its workers.")
+    parser.add_argument('--sample-interval', type=float, default=1.0, help="Seconds between samples (default: 1).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', help="Name for these results in --compare.")
+    parser.add_argument('-o', '--output', help="Save the results to this JSON file.")
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS', help="Compare saved results and exit.")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+    if not args.duration and not args.requests:
+        parser.error("give --duration or --requests")
+
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 1 if report['summary']['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,37 @@
 import sys
-import json
 import os
-import base64
-import io
-from docx import Document
 from docx.shared import Pt, Inches, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import nsdecls
 from docx.oxml import parse_xml
 
-def generate_modern_resume(json_path):
-    # Load data
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+from photos import prepare_photo, report_error
+from interrupts import BudgetExceeded
+import schema
+from prototypes import new_document
+from sections import Section, render_sections
+from styles import Style, add_styles
+from render_utils import OUTPUT_DIR, load_json, save_document, write_output, run_cli
+
+# Named styles used by the content, see styles.py
+STYLES = [
+    # Sidebar
+    Style('Sidebar Header', size=Pt(14), bold=True, space_before=Pt(20)),
+    Style('Skill', size=Pt(10), bold=True, space_after=Pt(2)),
+    Style('Skill Bar', size=Pt(8)),
+    # Main content
+    Style('Name', size=Pt(28), bold=True, space_before=Pt(20)),
+    Style('Headline', size=Pt(12), color=RGBColor(100, 100, 100)),
+    Style('Section Header', size=Pt(16), bold=True, space_before=Pt(30)),
+    Style('Degree', size=Pt(11), bold=True, space_before=Pt(10)),
+    Style('Date', size=Pt(10), bold=True),
+    Style('Job Title', size=Pt(11), bold=True, space_before=Pt(15)),
+]
 
-    document = Document()
-    
+def _setup_modern_resume(document):
+    """
+    Margins, body text size and the two-column layout, built once per process.
+    """
     # Set narrow margins
     sections = document.sections
     for section in sections:
@@ -30,142 +46,127 @@ def generate_modern_resume(json_path):
     table.columns[0].width = Inches(2.5) # Sidebar
     table.columns[1].width = Inches(5.0) # Main Content
 
-    # --- Sidebar (Left Column) ---
-    sidebar_cell = table.cell(0, 0)
-    
     # Set Sidebar Background Color (Light Teal)
     shading_elm = parse_xml(r'<w:shd {} w:fill="E0F2F1"/>'.format(nsdecls('w')))
-    sidebar_cell._tc.get_or_add_tcPr().append(shading_elm)
+    table.cell(0, 0)._tc.get_or_add_tcPr().append(shading_elm)
+
+    # Body text
+    document.styles['Normal'].font.size = Pt(10)
+
+    add_styles(document, STYLES)
+
+# --- Sidebar (Left Column) ---
 
+def _render_photo(sidebar_cell, data):
     # Photo
     if 'photo' in data and data['photo']:
         try:
-            header, encoded = data['photo'].split(",", 1)
-            image_data = base64.b64decode(encoded)
-            image_stream = io.BytesIO(image_data)
-            
+            image_stream = prepare_photo(data['photo'], 1.5)
+
             p = sidebar_cell.add_paragraph()
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
             run = p.add_run()
             run.add_picture(image_stream, width=Inches(1.5))
+        except (BudgetExceeded, MemoryError):
+            # Left to governor.py, which drops the photo and says so
+            raise
         except Exception as e:
-            print(f"Error processing photo: {e}")
+            report_error(e)
+
+# Helper for the sidebar headings
+def add_sidebar_header(sidebar_cell, text):
+    return sidebar_cell.add_paragraph(text, 'Sidebar Header')
 
+def _render_profile(sidebar_cell, data):
     # Profile Section
     if 'objective' in data and data['objective']:
-        p = sidebar_cell.add_paragraph()
-        p.paragraph_format.space_before = Pt(20)
-        run = p.add_run("PROFILE")
-        run.bold = True
-        run.font.size = Pt(14)
-        
-        p = sidebar_cell.add_paragraph(data['objective'])
-        p.style.font.size = Pt(10)
+        add_sidebar_header(sidebar_cell, "PROFILE")
+        sidebar_cell.add_paragraph(data['objective'])
 
+def _render_contact(sidebar_cell, data):
     # Contact Section
-    p = sidebar_cell.add_paragraph()
-    p.paragraph_format.space_before = Pt(20)
-    run = p.add_run("CONTACT ME")
-    run.bold = True
-    run.font.size = Pt(14)
+    add_sidebar_header(sidebar_cell, "CONTACT ME")
 
     if 'address' in data and data['address']:
-        sidebar_cell.add_paragraph(data['address']).style.font.size = Pt(10)
+        sidebar_cell.add_paragraph(data['address'])
     if 'phone' in data and data['phone']:
-        sidebar_cell.add_paragraph(data['phone']).style.font.size = Pt(10)
+        sidebar_cell.add_paragraph(data['phone'])
     if 'email' in data and data['email']:
-        sidebar_cell.add_paragraph(data['email']).style.font.size = Pt(10)
+        sidebar_cell.add_paragraph(data['email'])
 
+def _render_skills(sidebar_cell, data):
     # Skills Section (Sidebar)
     if 'skills' in data and len(data['skills']) > 0:
-        p = sidebar_cell.add_paragraph()
-        p.paragraph_format.space_before = Pt(20)
-        run = p.add_run("MY PRO SKILL")
-        run.bold = True
-        run.font.size = Pt(14)
+        add_sidebar_header(sidebar_cell, "MY PRO SKILL")
 
         for skill in data['skills']:
-            p = sidebar_cell.add_paragraph()
-            p.paragraph_format.space_after = Pt(2)
-            run_name = p.add_run(skill.get('name', ''))
-            run_name.bold = True
-            run_name.font.size = Pt(10)
+            sidebar_cell.add_paragraph(skill.get('name', ''), 'Skill')
             
             # Simple text representation of bar
             level = int(skill.get('level', 50))
             blocks = int(level / 10)
             bar = "█" * blocks + "░" * (10 - blocks)
-            p_bar = sidebar_cell.add_paragraph(bar)
-            p_bar.style.font.size = Pt(8)
+            sidebar_cell.add_paragraph(bar, 'Skill Bar')
 
-    # --- Main Content (Right Column) ---
-    main_cell = table.cell(0, 1)
-    
+# --- Main Content (Right Column) ---
+
+def _render_name(main_cell, data):
     # Name & Title
-    p = main_cell.add_paragraph()
-    p.paragraph_format.space_before = Pt(20)
-    run_name = p.add_run(data.get('name', 'YOUR NAME').upper())
-    run_name.bold = True
-    run_name.font.size = Pt(28)
-    
-    p = main_cell.add_paragraph()
-    run_title = p.add_run(data.get('jobTitle', 'JOB TITLE').upper())
-    run_title.font.size = Pt(12)
-    run_title.font.color.rgb = RGBColor(100, 100, 100)
-    
+    main_cell.add_paragraph(data.get('name', 'YOUR NAME').upper(), 'Name')
+    main_cell.add_paragraph(data.get('jobTitle', 'JOB TITLE').upper(), 'Headline')
+
+def _render_education(main_cell, data):
     # Education
     if 'education' in data and len(data['education']) > 0:
-        p = main_cell.add_paragraph()
-        p.paragraph_format.space_before = Pt(30)
-        run = p.add_run("EDUCATION")
-        run.bold = True
-        run.font.size = Pt(16)
+        main_cell.add_paragraph("EDUCATION", 'Section Header')
         
         for edu in data['education']:
-            p = main_cell.add_paragraph()
-            p.paragraph_format.space_before = Pt(10)
-            run_degree = p.add_run(edu.get('degree', '').upper())
-            run_degree.bold = True
-            run_degree.font.size = Pt(11)
-            
-            p = main_cell.add_paragraph()
-            run_year = p.add_run(edu.get('year', ''))
-            run_year.bold = True
-            run_year.font.size = Pt(10)
-            
-            p = main_cell.add_paragraph(edu.get('school', ''))
-            p.style.font.size = Pt(10)
+            main_cell.add_paragraph(edu.get('degree', '').upper(), 'Degree')
+            main_cell.add_paragraph(edu.get('year', ''), 'Date')
+            main_cell.add_paragraph(edu.get('school', ''))
 
+def _render_experience(main_cell, data):
     # Experience
     if 'experience' in data and len(data['experience']) > 0:
-        p = main_cell.add_paragraph()
-        p.paragraph_format.space_before = Pt(30)
-        run = p.add_run("EXPERIENCE")
-        run.bold = True
-        run.font.size = Pt(16)
+        main_cell.add_paragraph("EXPERIENCE", 'Section Header')
         
         for exp in data['experience']:
-            p = main_cell.add_paragraph()
-            p.paragraph_format.space_before = Pt(15)
-            run_title = p.add_run(f"{exp.get('title', '').upper()} AT {exp.get('company', '').upper()}")
-            run_title.bold = True
-            run_title.font.size = Pt(11)
-            
-            p = main_cell.add_paragraph(exp.get('description', ''))
-            p.style.font.size = Pt(10)
+            main_cell.add_paragraph(f"{exp.get('title', '').upper()} AT {exp.get('company', '').upper()}", 'Job Title')
+            main_cell.add_paragraph(exp.get('description', ''))
 
+SECTIONS = [
+    # Pictures add a relationship to the document part, so they can't be reused
+    Section('photo', 'sidebar', ('photo',), _render_photo, cacheable=False),
+    Section('profile', 'sidebar', ('objective',), _render_profile),
+    Section('contact', 'sidebar', ('address', 'phone', 'email'), _render_contact),
+    Section('skills', 'sidebar', ('skills',), _render_skills),
+    Section('name', 'main', ('name', 'jobTitle'), _render_name),
+    Section('education', 'main', ('education',), _render_education),
+    Section('experience', 'main', ('experience',), _render_experience),
+]
 
-    # Save the document
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docx')
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    output_filename = os.path.join(output_dir, 'modern_resume.docx')
-    document.save(output_filename)
+def _containers(document):
+    table = document.tables[0]
+    return {'sidebar': table.cell(0, 0), 'main': table.cell(0, 1)}
+
+def build_modern_resume(data):
+    document = new_document('modern-resume', _setup_modern_resume)
+    render_sections(SECTIONS, _containers(document), data, 'modern-resume')
+    return document
+
+def render_modern_resume(data, stream=None):
+    """
+    Render the modern resume for `data` (a payload dict or a schema.Resume) and
+    return the DOCX bytes, or write them to `stream` if one is given.
+    """
+    data = schema.view(data, 'modern-resume')
+    return save_document(build_modern_resume(data), stream)
+
+def generate_modern_resume(json_path):
+    data = load_json(json_path)
+    output_filename = os.path.join(OUTPUT_DIR, 'modern_resume.docx')
+    write_output(render_modern_resume, data, output_filename)
     print(f"Modern Resume generated successfully: {output_filename}")
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        generate_modern_resume(sys.argv[1])
-    else:
-        print("Error: No JSON file provided.")
+    sys.exit(run_cli(render_modern_resume, 'modern_resume.docx', 'Modern Resume', name='modern-resume'))
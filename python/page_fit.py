@@ -0,0 +1,438 @@
+"""
+Fit a resume on a given number of pages without opening it in Word.
+
+The page count is estimated in memory: the builder's own Sections are
+rendered against recording stand-ins (see layouts.py), each
+paragraph is resolved against the template's styles (font, size, bold,
+spacing, line spacing) and wrapped into lines with per-font glyph-width
+tables at the column widths, margins and page size of the template's
+prototype. Estimating again at another font size or spacing is arithmetic
+on the cached word widths, so fitting is a binary search that never
+renders a document. When the estimate is over the target, in order:
+
+    spacing     paragraph spacing is scaled down (to MIN_SPACING_SCALE)
+    font        font sizes are scaled down as well (to MIN_FONT_SCALE)
+    truncation  the last entries of the least important lists are dropped
+
+and spacing and font are then grown back as far as the target allows. The
+document is rendered once, with the sizes and spacing set as direct
+formatting.
+
+    python page_fit.py data.json --builder cv -o cv.docx
+    python page_fit.py data.json --builder ats-resume --pages 2 --estimate
+
+Glyph widths are Arial's (regular and bold, from its metrics in 1/1000 em).
+Other fonts, like the templates' theme fonts Calibri and Cambria, are
+measured as Arial scaled by their average width. Characters outside the
+tables count as the width of a digit. It is an estimate: Word's kerning,
+hyphenation and widow control are not modelled, and a document just under
+the page limit may still spill over by a line.
+"""
+import os
+import re
+import sys
+import argparse
+from collections import namedtuple
+from functools import lru_cache
+
+from docx.document import Document
+from docx.shared import Pt
+
+import schema
+import registry
+from layouts import LAYOUTS, CELL_MARGIN_PT, Paragraph, Table, get_layout
+from render_utils import save_document, write_output, load_json
+
+MIN_SPACING_SCALE = float(os.environ.get('RECEGEN_FIT_MIN_SPACING', 0.25))
+MIN_FONT_SCALE = float(os.environ.get('RECEGEN_FIT_MIN_FONT', 0.8))
+SPACING_STEP = 0.05
+FONT_STEP = 0.025
+
+# Lists that may be shortened, least important first, and how many entries
+# are always kept
+TRUNCATION = [('hobbies', 0), ('languages', 1), ('experience', 1), ('education', 1), ('skills', 5)]
+
+# Advance widths in 1/1000 em of Arial's printable ASCII (32-126)
+_ARIAL_ASCII = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_ARIAL_BOLD_ASCII = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+# The few non-ASCII characters the templates write themselves; the skill
+# bar blocks come from a fallback font
+_ARIAL_EXTRA = {'•': 350, '–': 556, '—': 1000, '…': 1000, '█': 708, '░': 708}
+_ARIAL_EXTRA_BOLD = {**_ARIAL_EXTRA, '’': 278, '‘': 278, '“': 500, '”': 500}
+_ARIAL_EXTRA = {**_ARIAL_EXTRA, '’': 222, '‘': 222, '“': 333, '”': 333}
+
+GLYPH_WIDTHS = {
+    False: {**dict(zip(map(chr, range(32, 127)), _ARIAL_ASCII)), **_ARIAL_EXTRA},
+    True: {**dict(zip(map(chr, range(32, 127)), _ARIAL_BOLD_ASCII)), **_ARIAL_EXTRA_BOLD},
+}
+DEFAULT_GLYPH_WIDTH = 556
+
+# Average advance width relative to Arial, and single line height in em
+FONTS = {
+    'Arial': (1.0, 1.149),
+    'Calibri': (0.9, 1.221),
+    'Cambria': (0.96, 1.172),
+}
+DEFAULT_FONT = (1.0, 1.15)
+
+# Word's default tab stops
+TAB_PT = 36
+
+@lru_cache(maxsize=65536)
+def word_width(word, bold=False):
+    """
+    Width of `word` in Arial, in em.
+    """
+    widths = GLYPH_WIDTHS[bool(bold)]
+    return sum(widths.get(char, DEFAULT_GLYPH_WIDTH) for char in word) / 1000
+
+def _scaled(size, scale):
+    # Word sizes fonts in half points
+    return max(1.0, round(size * scale * 2) / 2)
+
+# Measured paragraphs
+
+_WORD, _SPACE, _TAB, _BREAK, _PICTURE = range(5)
+_PIECES = re.compile(r'( |\t|\r\n|\r|\n)')
+
+class _Measured:
+    """
+    A paragraph reduced to what its height depends on. Words are kept as
+    (width in em, font size) parts, so they can be re-measured at any scale.
+    """
+    __slots__ = ('items', 'sizes', 'mark', 'before', 'after', 'line', 'line_rule', 'indent', 'picture')
+
+    def __init__(self, paragraph, styles):
+        fmt = styles.resolve(paragraph.style)
+        direct = paragraph.paragraph_format
+        self.before = direct.space_before.pt if direct.space_before is not None else fmt.before
+        self.after = direct.space_after.pt if direct.space_after is not None else fmt.after
+        self.indent = direct.left_indent.pt if direct.left_indent is not None else fmt.indent
+        self.line, self.line_rule = fmt.line, fmt.line_rule
+        self.mark = (fmt.size, FONTS.get(fmt.font, DEFAULT_FONT)[1])
+        self.items = []
+        self.sizes = []
+        self.picture = None
+        for run in paragraph.runs:
+            run_fmt = styles.resolve(run.style, 'character', fmt) if run.style else fmt
+            size = run.font.size.pt if run.font.size is not None else run_fmt.size
+            bold = run.font.bold if run.font.bold is not None else run_fmt.bold
+            ratio, line_height = FONTS.get(run.font.name or run_fmt.font, DEFAULT_FONT)
+            if run.picture is not None:
+                self.picture = run.picture
+                self.items.append((_PICTURE, run.picture[0]))
+            if run.text:
+                self.sizes.append((size, line_height))
+            for piece in _PIECES.split(run.text):
+                if not piece:
+                    continue
+                if piece == ' ':
+                    self.items.append((_SPACE, ((word_width(' ', bold) * ratio, size),)))
+                elif piece == '\t':
+                    self.items.append((_TAB, None))
+                elif piece in ('\n', '\r', '\r\n'):
+                    self.items.append((_BREAK, None))
+                else:
+                    part = (word_width(piece, bold) * ratio, size)
+                    # A word that continues from the previous run
+                    if self.items and self.items[-1][0] == _WORD:
+                        self.items[-1] = (_WORD, self.items[-1][1] + (part,))
+                    else:
+                        self.items.append((_WORD, (part,)))
+
+    def height(self, width, font_scale=1.0, spacing_scale=1.0):
+        """
+        Height in points at `width` points of column.
+        """
+        available = max(width - self.indent, 1.0)
+        lines = 1
+        x = 0.0
+        for kind, parts in self.items:
+            if kind == _BREAK:
+                lines += 1
+                x = 0.0
+                continue
+            if kind == _TAB:
+                x = (x // TAB_PT + 1) * TAB_PT
+                if x > available:
+                    lines += 1
+                    x = 0.0
+                continue
+            if kind == _PICTURE:
+                w = parts
+            else:
+                w = sum(em * _scaled(size, font_scale) for em, size in parts)
+            if kind == _SPACE:
+                x += w
+                continue
+            if x > 0 and x + w > available:
+                lines += 1
+                x = 0.0
+            if w > available:
+                extra = int(w // available)
+                lines += extra
+                w -= extra * available
+            x += w
+
+        if self.sizes:
+            natural = max(_scaled(size, font_scale) * line_height for size, line_height in self.sizes)
+        else:
+            natural = self.mark[0] * self.mark[1]  # an empty paragraph keeps its mark's size
+        if self.line_rule == 'exact':
+            line = self.line / 20
+        elif self.line_rule == 'atLeast':
+            line = max(natural, self.line / 20)
+        else:
+            line = natural * self.line / 240
+        height = lines * line
+        if self.picture is not None:
+            height += max(0.0, self.picture[1] - line)
+        return height + (self.before + self.after) * spacing_scale
+
+class _MeasuredTable:
+    """
+    A table added by a section, with columns of equal width like
+    python-docx gives them. Each row is as high as its highest cell.
+    """
+    __slots__ = ('rows',)
+
+    def __init__(self, table, styles):
+        self.rows = [[[_measure_block(block, styles) for block in cell.blocks or [Paragraph()]]
+                      for cell in row.cells] for row in table.rows]
+
+    def height(self, width, font_scale=1.0, spacing_scale=1.0):
+        total = 0.0
+        for cells in self.rows:
+            cell_width = width / len(cells) - 2 * CELL_MARGIN_PT
+            total += max(sum(block.height(cell_width, font_scale, spacing_scale) for block in blocks)
+                         for blocks in cells)
+        return total
+
+def _measure_block(block, styles):
+    return _MeasuredTable(block, styles) if isinstance(block, Table) else _Measured(block, styles)
+
+def measure(layout, resume):
+    """
+    A Measure of `resume` (a schema.Resume or a payload dict) in `layout`
+    (a layouts.PageLayout).
+    """
+    measured = {}
+    for key, container in layout.record(resume).items():
+        blocks = container.blocks or [Paragraph()]  # a cell keeps one paragraph
+        measured[key] = [_measure_block(block, layout.styles) for block in blocks]
+    if layout.trailing_paragraph:
+        measured[layout.body] = measured[layout.body] + [_Measured(Paragraph(), layout.styles)]
+    return Measure(layout, measured)
+
+class Measure:
+    """
+    The measured blocks of one payload, for estimates at any scale.
+    """
+    def __init__(self, layout, measured):
+        self.layout = layout
+        self.measured = measured
+
+    def height(self, font_scale=1.0, spacing_scale=1.0):
+        def column(key, width):
+            return sum(block.height(width, font_scale, spacing_scale) for block in self.measured[key])
+
+        layout = self.layout
+        total = column(layout.body, layout.body_width)
+        for region in layout.regions:
+            total += max(column(cell.key, cell.width) for cell in region)
+        return total
+
+    def pages(self, font_scale=1.0, spacing_scale=1.0):
+        return max(1, -int(-self.height(font_scale, spacing_scale) // self.layout.page_height))
+
+# Fitting
+
+# `truncated` maps list names to the number of entries dropped
+Fit = namedtuple('Fit', ['resume', 'font_scale', 'spacing_scale', 'truncated', 'pages'])
+
+def _largest(count, fits):
+    """
+    The largest i in range(count) for which fits(i) holds, fits being
+    monotonic (true up to some i), or None.
+    """
+    low, high = 0, count - 1
+    if not fits(low):
+        return None
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def _steps(minimum, step):
+    count = int(round((1 - minimum) / step)) + 1
+    return [minimum + i * step for i in range(count)]
+
+_SPACINGS = _steps(MIN_SPACING_SCALE, SPACING_STEP)
+_FONTS = _steps(MIN_FONT_SCALE, FONT_STEP)
+
+def _scales(estimate, pages):
+    """
+    The largest (font scale, spacing scale) that fits `pages`, preferring
+    to keep the font size, or None if even the smallest doesn't fit.
+    """
+    if estimate.pages(1.0, 1.0) <= pages:
+        return 1.0, 1.0
+    spacing = _largest(len(_SPACINGS), lambda i: estimate.pages(1.0, _SPACINGS[i]) <= pages)
+    if spacing is not None:
+        return 1.0, _SPACINGS[spacing]
+    font = _largest(len(_FONTS), lambda i: estimate.pages(_FONTS[i], MIN_SPACING_SCALE) <= pages)
+    if font is None:
+        return None
+    # The smaller font may leave room for more spacing than the minimum
+    spacing = _largest(len(_SPACINGS), lambda i: estimate.pages(_FONTS[font], _SPACINGS[i]) <= pages)
+    return _FONTS[font], _SPACINGS[spacing]
+
+def fit(builder, data, pages=1):
+    """
+    How to fit `data` on `pages` pages with `builder` (a name): a Fit with
+    the possibly shortened schema.Resume to render and the scales to
+    render it at. Fit.pages is the estimate for it, which is still over
+    `pages` when the payload can't be shortened far enough.
+    """
+    layout = get_layout(builder)
+    resume = schema.parse(data)
+    estimate = measure(layout, resume)
+    scales = _scales(estimate, pages)
+    truncated = {}
+    if scales is None:
+        rendered = {key for section in layout.sections for key in section.inputs}
+        for name, keep in TRUNCATION:
+            entries = getattr(resume, name)
+            if name not in rendered or not entries or len(entries) <= keep:
+                continue
+            most = len(entries) - keep
+            shorter = lambda count: resume._replace(**{name: entries[:len(entries) - count]})
+            over = lambda m: m.pages(MIN_FONT_SCALE, MIN_SPACING_SCALE) > pages
+            shortest = measure(layout, shorter(most))
+            if over(shortest) and shortest.height(MIN_FONT_SCALE, MIN_SPACING_SCALE) \
+                    >= estimate.height(MIN_FONT_SCALE, MIN_SPACING_SCALE):
+                continue  # no help, e.g. the other column is the longer one
+            # The fewest entries dropped that fit is one more than the most that
+            # don't; when none fit, as many as may be
+            count = min(_largest(most + 1, lambda count: over(measure(layout, shorter(count)))) + 1, most)
+            resume = shorter(count)
+            truncated[name] = count
+            estimate = measure(layout, resume)
+            scales = _scales(estimate, pages)
+            if scales is not None:
+                break
+    font_scale, spacing_scale = scales or (MIN_FONT_SCALE, MIN_SPACING_SCALE)
+    return Fit(resume, font_scale, spacing_scale, truncated, estimate.pages(font_scale, spacing_scale))
+
+def _paragraphs(containers):
+    # Every paragraph of the containers, in the tables sections added too
+    cells = {container._tc for container in containers if not isinstance(container, Document)}
+    for container in containers:
+        yield from container.paragraphs
+        for table in container.tables:
+            tcs = {cell._tc: cell for cell in table._cells}
+            if cells.isdisjoint(tcs):
+                for cell in tcs.values():
+                    yield from cell.paragraphs
+
+def _apply_scales(document, layout, font_scale, spacing_scale):
+    """
+    Set the scaled sizes and spacing as direct formatting on every
+    paragraph and run of the rendered `document`.
+    """
+    styles = layout.styles
+    for paragraph in _paragraphs(list(layout.containers(document).values())):
+        fmt = styles.resolve(paragraph.style.name if paragraph.style is not None else None)
+        paragraph_format = paragraph.paragraph_format
+        if spacing_scale != 1.0:
+            before = paragraph_format.space_before.pt if paragraph_format.space_before is not None else fmt.before
+            after = paragraph_format.space_after.pt if paragraph_format.space_after is not None else fmt.after
+            paragraph_format.space_before = Pt(before * spacing_scale)
+            paragraph_format.space_after = Pt(after * spacing_scale)
+        if font_scale == 1.0:
+            continue
+        for run in paragraph.runs:
+            if run.font.size is not None:
+                size = run.font.size.pt
+            elif run.style is not None and run.style.type is not None and run.style.name != 'Default Paragraph Font':
+                size = styles.resolve(run.style.name, 'character', fmt).size
+            else:
+                size = fmt.size
+            run.font.size = Pt(_scaled(size, font_scale))
+
+def render(builder, data, pages=1, stream=None):
+    """
+    Render `data` with `builder` (a name) fitted on `pages` pages. Returns
+    (DOCX bytes, or None when written to `stream`, and the Fit).
+    """
+    result = fit(builder, data, pages)
+    if result.font_scale == 1.0 and result.spacing_scale == 1.0:
+        return registry.get_builder(builder).render(result.resume, stream), result
+    layout = get_layout(builder)
+    document = layout.build(schema.view(result.resume, builder))
+    _apply_scales(document, layout, result.font_scale, result.spacing_scale)
+    return save_document(document, stream), result
+
+def describe(result):
+    """
+    One line on what fitting did.
+    """
+    changes = []
+    if result.spacing_scale != 1.0:
+        changes.append(f"spacing at {result.spacing_scale:.0%}")
+    if result.font_scale != 1.0:
+        changes.append(f"fonts at {result.font_scale:.1%}")
+    changes.extend(f"last {count} {name} entries dropped" for name, count in result.truncated.items())
+    return f"{result.pages} page(s) estimated" + (f" with {', '.join(changes)}" if changes else "")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a resume/CV fitted on a number of pages.")
+    parser.add_argument('data', help="Payload JSON.")
+    parser.add_argument('-b', '--builder', required=True, choices=sorted(LAYOUTS))
+    parser.add_argument('-p', '--pages', type=int, default=1, help="Target page count (default: 1).")
+    parser.add_argument('-o', '--output', help="Output path (default: the builder's file name).")
+    parser.add_argument('--estimate', action='store_true', help="Only print the estimate, as rendered and fitted.")
+    args = parser.parse_args(argv)
+
+    data = load_json(args.data)
+    layout = get_layout(args.builder)
+    try:
+        unfitted = measure(layout, schema.parse(data)).pages()
+    except schema.SchemaError as e:
+        print(f"Invalid payload: {e}", file=sys.stderr)
+        return 1
+    print(f"As rendered: {unfitted} page(s) estimated")
+    if args.estimate:
+        print(f"Fitted: {describe(fit(args.builder, data, args.pages))}")
+        return 0
+
+    output = args.output or registry.get_builder(args.builder).filename
+    fitted = {}
+
+    def render_fitted(payload, stream=None):
+        docx_bytes, fitted['result'] = render(args.builder, payload, args.pages, stream)
+        return docx_bytes
+
+    write_output(render_fitted, data, output)
+    print(f"Fitted: {describe(fitted['result'])}, written to {output}")
+    return 0 if fitted['result'].pages <= args.pages else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Photo pipeline shared by the builders that embed a picture.
+
+Photos arrive as `data:image/...;base64,` strings, often straight from a
+phone camera, but are shown at 1.2-1.5 inches. prepare_photo() decodes a
+photo once, downsamples it to the display width at DPI dots per inch and
+re-encodes it compactly. Results are kept in an in-memory LRU keyed by a
+hash of the image bytes and the target size (so a data URL and an upload of
+the same image share an entry), and optionally on disk in
+RECEGEN_PHOTO_CACHE_DIR so all workers share them.
+
+Downscaling needs Pillow; without it photos are only decoded and cached.
+"""
+import os
+import io
+import base64
+import hashlib
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+import timings
+import interrupts
+
+DPI = int(os.environ.get('RECEGEN_PHOTO_DPI', 200))
+JPEG_QUALITY = 85
+MAX_CACHE_BYTES = int(os.environ.get('RECEGEN_PHOTO_CACHE_MB', 32)) * 1024 * 1024
+DISK_CACHE_DIR = os.environ.get('RECEGEN_PHOTO_CACHE_DIR')
+
+_cache = OrderedDict()
+_cache_bytes = 0
+
+def decode_photo(photo):
+    """
+    Return the raw image bytes for a data URL, a bare base64 string or bytes.
+    """
+    if isinstance(photo, (bytes, bytearray, memoryview)):
+        return bytes(photo)
+    if photo.startswith('data:'):
+        photo = photo.split(",", 1)[1]
+    return base64.b64decode(photo)
+
+def photo_key(image_data, width_px):
+    """
+    Cache key for the image bytes `image_data` rendered `width_px` wide.
+    """
+    return f"{hashlib.sha256(image_data).hexdigest()}-{width_px}"
+
+def downscale(image_data, width_px, draft=False):
+    """
+    Shrink `image_data` to at most `width_px` wide and re-encode it. Returns
+    the original bytes if Pillow is missing or the result wouldn't be smaller.
+    With `draft`, JPEGs are decoded at a reduced scale, which is much faster
+    and lighter for very large photos but not quite as sharp.
+    """
+    if Image is None:
+        return image_data
+    with Image.open(io.BytesIO(image_data)) as image:
+        if draft:
+            image.draft('RGB', (width_px, width_px))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width_px:
+            height_px = max(1, round(image.height * width_px / image.width))
+            image = image.resize((width_px, height_px), Image.LANCZOS)
+
+        output = io.BytesIO()
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        if has_alpha:
+            image.save(output, format='PNG', optimize=True, dpi=(DPI, DPI))
+        else:
+            image.convert('RGB').save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True, dpi=(DPI, DPI))
+    processed = output.getvalue()
+    return processed if len(processed) < len(image_data) else image_data
+
+def _remember(key, value):
+    global _cache_bytes
+    if len(value) > MAX_CACHE_BYTES:
+        return
+    with interrupts.deferred():
+        _cache[key] = value
+        _cache_bytes += len(value)
+        while _cache_bytes > MAX_CACHE_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+def _disk_path(key):
+    return os.path.join(DISK_CACHE_DIR, key[:2], key + '.img')
+
+def _read_disk(key):
+    if not DISK_CACHE_DIR:
+        return None
+    try:
+        with open(_disk_path(key), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_disk(key, value):
+    if not DISK_CACHE_DIR:
+        return
+    path = _disk_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent workers never read half a file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+def prepare_photo(photo, width_inches):
+    """
+    Return a stream with `photo` ready to embed at `width_inches`,
+    downscaling it only on the first request for that image and size.
+    """
+    width_px = max(1, round(width_inches * DPI))
+    with timings.phase('photo'):
+        image_data = decode_photo(photo)
+        key = photo_key(image_data, width_px)
+
+    value = _cache.get(key)
+    if value is not None:
+        _cache.move_to_end(key)
+        return io.BytesIO(value)
+
+    with timings.phase('photo'):
+        value = _read_disk(key)
+        if value is None:
+            value = downscale(image_data, width_px)
+            _write_disk(key, value)
+    _remember(key, value)
+    return io.BytesIO(value)
+
+def report_error(error):
+    """
+    Report a photo that couldn't be embedded, on the RECEGEN_TIMINGS side
+    channel; the builders render on without it.
+    """
+    timings.emit({'type': 'photo-error', 'error': f"{type(error).__name__}: {error}"})
+
+def clear_cache():
+    global _cache_bytes
+    _cache.clear()
+    _cache_bytes = 0
@@ -0,0 +1,208 @@
+"""
+HTML previews of the templates, from the same layouts as the DOCX.
+
+render_html() runs the builder's own Sections against the recording
+stand-ins of layouts.py and writes what they recorded as an HTML fragment:
+the page at its width and margins, the layout tables at their column
+widths and shading, and every paragraph and run with its styles resolved
+the way Word resolves them (font, size, bold, italic, colour, spacing,
+indent, alignment). Nothing goes through python-docx or a zip, so a
+preview takes about a millisecond and can follow every keystroke; the DOCX
+only has to be rendered when it is downloaded.
+
+    python preview.py data.json --builder cv -o cv.html
+    python preview.py data.json --builder ats-resume --page > preview.html
+
+The fragment is styled inline inside a single <div class="recegen-page">,
+so it can be dropped into any page. It isn't paginated: the page grows
+with the content (page_fit.py estimates where it would break).
+"""
+import sys
+import base64
+import argparse
+from html import escape
+from functools import lru_cache
+
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+import schema
+import timings
+from layouts import LAYOUTS, CELL_MARGIN_PT, Paragraph, Table, get_layout
+from render_utils import load_json
+
+# Word's default tab stops, and the CSS families fonts fall back to
+TAB_PT = 36
+GENERIC_FAMILIES = {'Cambria': 'serif', 'Times New Roman': 'serif', 'Georgia': 'serif', 'Courier': 'monospace',
+                    'Courier New': 'monospace'}
+
+_ALIGNMENTS = {'left': 'left', 'start': 'left', 'center': 'center', 'right': 'right', 'end': 'right',
+               'both': 'justify', 'distribute': 'justify'}
+_DIRECT_ALIGNMENTS = {WD_ALIGN_PARAGRAPH.LEFT: 'left', WD_ALIGN_PARAGRAPH.CENTER: 'center',
+                      WD_ALIGN_PARAGRAPH.RIGHT: 'right', WD_ALIGN_PARAGRAPH.JUSTIFY: 'both'}
+
+def _pt(value):
+    return f'{value:g}pt'
+
+def _font_css(fmt):
+    declarations = []
+    if fmt.font:
+        declarations.append(f"font-family:'{fmt.font}',{GENERIC_FAMILIES.get(fmt.font, 'sans-serif')}")
+    declarations.append(f'font-size:{_pt(fmt.size)}')
+    declarations.append(f"font-weight:{'bold' if fmt.bold else 'normal'}")
+    declarations.append(f"font-style:{'italic' if fmt.italic else 'normal'}")
+    declarations.append(f"color:#{fmt.color or '000'}")
+    return declarations
+
+@lru_cache(maxsize=1024)
+def _paragraph_css(fmt):
+    if fmt.line_rule == 'auto':
+        line = 'normal' if fmt.line == 240 else f'{fmt.line / 240 * 1.15:.3g}'
+    else:
+        line = _pt(fmt.line / 20)
+    return ';'.join(['margin:0', f'padding:{_pt(fmt.before)} 0 {_pt(fmt.after)} {_pt(fmt.indent)}',
+                     f'line-height:{line}', f"text-align:{_ALIGNMENTS.get(fmt.alignment, 'left')}"]
+                    + _font_css(fmt))
+
+@lru_cache(maxsize=1024)
+def _run_css(fmt, paragraph_fmt):
+    # Only what differs from the paragraph
+    inherited = set(_font_css(paragraph_fmt))
+    return ';'.join(declaration for declaration in _font_css(fmt) if declaration not in inherited)
+
+def _paragraph_format(paragraph, styles):
+    fmt = styles.resolve(paragraph.style)
+    direct = paragraph.paragraph_format
+    changes = {}
+    if direct.space_before is not None:
+        changes['before'] = direct.space_before.pt
+    if direct.space_after is not None:
+        changes['after'] = direct.space_after.pt
+    if direct.left_indent is not None:
+        changes['indent'] = direct.left_indent.pt
+    if direct.alignment is not None:
+        changes['alignment'] = _DIRECT_ALIGNMENTS.get(direct.alignment, 'left')
+    return fmt._replace(**changes) if changes else fmt
+
+def _run_format(run, fmt, styles):
+    run_fmt = styles.resolve(run.style, 'character', fmt) if run.style else fmt
+    font = run.font
+    changes = {}
+    if font.size is not None:
+        changes['size'] = font.size.pt
+    if font.name is not None:
+        changes['font'] = font.name
+    if font.bold is not None:
+        changes['bold'] = font.bold
+    if font.italic is not None:
+        changes['italic'] = font.italic
+    if font.color.rgb is not None:
+        changes['color'] = str(font.color.rgb)
+    return run_fmt._replace(**changes) if changes else run_fmt
+
+def _write_paragraph(out, paragraph, styles):
+    fmt = _paragraph_format(paragraph, styles)
+    out.append(f'<p style="{_paragraph_css(fmt)}">')
+    empty = True
+    for run in paragraph.runs:
+        if run.picture is not None:
+            picture = run.picture
+            out.append(f'<img src="data:{picture.content_type};base64,{base64.b64encode(picture.blob).decode("ascii")}" '
+                       f'style="width:{_pt(picture.width)};height:{_pt(picture.height)};vertical-align:bottom" alt="">')
+            empty = False
+        if not run.text:
+            continue
+        text = escape(run.text.replace('\r\n', '\n').replace('\r', '\n'), quote=False)
+        css = _run_css(_run_format(run, fmt, styles), fmt)
+        out.append(f'<span style="{css}">{text}</span>' if css else text)
+        empty = False
+    # An empty paragraph still takes a line in Word
+    out.append('<br></p>' if empty else '</p>')
+
+def _write_blocks(out, blocks, styles):
+    for block in blocks or [Paragraph()]:
+        if isinstance(block, Table):
+            out.append('<table style="width:100%;border-collapse:collapse;table-layout:fixed">')
+            for row in block.rows:
+                out.append('<tr>')
+                for cell in row.cells:
+                    out.append(f'<td style="padding:0 {_pt(CELL_MARGIN_PT)};vertical-align:top">')
+                    _write_blocks(out, cell.blocks, styles)
+                    out.append('</td>')
+                out.append('</tr>')
+            out.append('</table>')
+        else:
+            _write_paragraph(out, block, styles)
+
+def _write_layout_table(out, rows, containers, styles):
+    out.append('<table style="border-collapse:collapse;table-layout:fixed">')
+    for region in rows:
+        out.append('<tr>')
+        for cell in region:
+            background = f';background:#{cell.fill}' if cell.fill else ''
+            out.append(f'<td style="width:{_pt(cell.width)};padding:0 {_pt(CELL_MARGIN_PT)};'
+                       f'vertical-align:top{background}">')
+            _write_blocks(out, containers[cell.key].blocks, styles)
+            out.append('</td>')
+        out.append('</tr>')
+    out.append('</table>')
+
+def render_html(builder, data):
+    """
+    The HTML preview of `data` (a payload dict or a schema.Resume) as
+    `builder` (a name) lays it out.
+    """
+    layout = get_layout(builder)
+    with timings.phase('build'):
+        containers = layout.record(data)
+    with timings.phase('save'):
+        styles = layout.styles
+        top, right, bottom, left = layout.margins
+        out = [f'<div class="recegen-page" data-builder="{builder}" style="box-sizing:border-box;'
+               f'width:{_pt(layout.page_width)};padding:{_pt(top)} {_pt(right)} {_pt(bottom)} {_pt(left)};'
+               f'background:#fff;white-space:pre-wrap;tab-size:{_pt(TAB_PT)};overflow-wrap:break-word">']
+        body = containers[layout.body].blocks
+        static = 0
+        for kind, index in layout.order:
+            if kind == 'table':
+                _write_layout_table(out, layout.tables[index], containers, styles)
+            else:
+                _write_paragraph(out, body[index], styles)
+                static += 1
+        # What the sections added comes after everything in the prototype
+        if len(body) > static:
+            _write_blocks(out, body[static:], styles)
+        out.append('</div>')
+        return ''.join(out)
+
+def render_page(builder, data):
+    """
+    render_html() as a standalone HTML document.
+    """
+    return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Preview</title></head>'
+            '<body style="margin:0;padding:24px;background:#e5e7eb">'
+            f'{render_html(builder, data)}</body></html>\n')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the HTML preview of a resume/CV.")
+    parser.add_argument('data', help="Payload JSON, or '-' for stdin.")
+    parser.add_argument('-b', '--builder', required=True, choices=sorted(LAYOUTS))
+    parser.add_argument('-o', '--output', default='-', help="Output path (default: stdout).")
+    parser.add_argument('--page', action='store_true', help="Write a standalone HTML page instead of a fragment.")
+    args = parser.parse_args(argv)
+
+    try:
+        data = schema.parse(load_json(args.data))
+    except schema.SchemaError as e:
+        print(f"Invalid payload: {e}", file=sys.stderr)
+        return 1
+    html = (render_page if args.page else render_html)(args.builder, data)
+    if args.output == '-':
+        sys.stdout.write(html)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(html)
+        print(f"Preview written to {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Merge render profiles into hot-function tables per builder.
+
+Takes the files written by profiling.py - from `--profile` on a builder CLI
+or from the server's sampled profiles (RENDER_PROFILE_EVERY) - and prints,
+for every builder, the functions that took the most time across all of its
+profiles.
+
+    python profile_report.py /tmp/recegen-profiles
+    python profile_report.py /tmp/recegen-profiles --builder cv --sort cumulative --top 40
+    python profile_report.py /tmp/recegen-profiles --collapsed flames/
+
+--collapsed also merges the sampled stacks into one <builder>.collapsed file
+per builder, ready for flamegraph.pl or speedscope.
+"""
+import sys
+import os
+import json
+import pstats
+import argparse
+from collections import Counter, defaultdict
+
+from profiling import PROFILE_SUFFIXES
+
+# The profiler's own frames (signal handler, wrappers) aren't interesting
+_IGNORED_FILES = ('profiling.py',)
+
+def find_profiles(paths):
+    """
+    Return {stem: meta} for every .prof file under `paths` (files or
+    directories); meta comes from the stem's .json, or is empty.
+    """
+    stems = []
+    for path in paths:
+        if os.path.isdir(path):
+            stems.extend(os.path.join(path, name[:-len('.prof')]) for name in sorted(os.listdir(path))
+                         if name.endswith('.prof'))
+        elif path.endswith('.prof'):
+            stems.append(path[:-len('.prof')])
+        else:
+            stem, suffix = os.path.splitext(path)
+            if suffix in PROFILE_SUFFIXES:
+                stems.append(stem)
+
+    profiles = {}
+    for stem in stems:
+        if not os.path.exists(stem + '.prof'):
+            continue
+        try:
+            with open(stem + '.json') as f:
+                profiles[stem] = json.load(f)
+        except (OSError, ValueError):
+            profiles[stem] = {}
+    return profiles
+
+def group_by_builder(profiles):
+    groups = defaultdict(list)
+    for stem, meta in profiles.items():
+        groups[meta.get('builder', 'unknown')].append(stem)
+    return dict(groups)
+
+def hot_functions(stems, sort='tottime', top=25):
+    """
+    Merge the cProfile stats of `stems` and return (total seconds, rows),
+    rows being (calls, tottime, cumtime, function) for the `top` functions.
+    """
+    stats = pstats.Stats(*(stem + '.prof' for stem in stems))
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        if os.path.basename(filename) in _IGNORED_FILES:
+            continue
+        if filename == '~':
+            function = name
+        else:
+            function = f"{name} ({os.path.basename(filename)}:{line})"
+        rows.append((calls, tottime, cumtime, function))
+    key = 2 if sort == 'cumulative' else 1
+    rows.sort(key=lambda row: row[key], reverse=True)
+    return stats.total_tt, rows[:top]
+
+def merge_collapsed(stems):
+    stacks = Counter()
+    for stem in stems:
+        try:
+            with open(stem + '.collapsed') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack and count.isdigit():
+                        stacks[stack] += int(count)
+        except OSError:
+            pass
+    return stacks
+
+def _phase_summary(stems, profiles):
+    totals = Counter()
+    for stem in stems:
+        totals.update(profiles[stem].get('phases', {}))
+    if not totals:
+        return ''
+    return ', '.join(f"{phase} {ms / len(stems):.1f}ms" for phase, ms in totals.items())
+
+def print_report(profiles, sort, top, out=sys.stdout):
+    for builder, stems in sorted(group_by_builder(profiles).items()):
+        total, rows = hot_functions(stems, sort, top)
+        print(f"== {builder}: {len(stems)} profile(s), {total * 1000 / len(stems):.1f}ms profiled per render", file=out)
+        phases = _phase_summary(stems, profiles)
+        if phases:
+            print(f"   mean phases: {phases}", file=out)
+        print(f"{'calls':>10} {'tottime':>10} {'cumtime':>10} {'%':>6}  function", file=out)
+        for calls, tottime, cumtime, function in rows:
+            share = tottime / total * 100 if total else 0
+            print(f"{calls:>10} {tottime * 1000:>9.1f}ms {cumtime * 1000:>8.1f}ms {share:>5.1f}%  {function}", file=out)
+        print(file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge render profiles into hot-function tables per builder.")
+    parser.add_argument('paths', nargs='+', help="Profile directories or files.")
+    parser.add_argument('-b', '--builder', action='append', help="Only report this builder (repeatable).")
+    parser.add_argument('-s', '--sort', choices=['tottime', 'cumulative'], default='tottime',
+                        help="Rank by time in the function itself or including callees (default: tottime).")
+    parser.add_argument('-n', '--top', type=int, default=25, help="Functions per builder (default: 25).")
+    parser.add_argument('--collapsed', metavar='DIR', help="Also write merged <builder>.collapsed stacks to DIR.")
+    args = parser.parse_args(argv)
+
+    profiles = find_profiles(args.paths)
+    if args.builder:
+        profiles = {stem: meta for stem, meta in profiles.items() if meta.get('builder') in args.builder}
+    if not profiles:
+        print("No profiles found", file=sys.stderr)
+        return 1
+
+    print_report(profiles, args.sort, args.top)
+
+    if args.collapsed:
+        os.makedirs(args.collapsed, exist_ok=True)
+        for builder, stems in group_by_builder(profiles).items():
+            stacks = merge_collapsed(stems)
+            if not stacks:
+                continue
+            path = os.path.join(args.collapsed, f"{builder}.collapsed")
+            with open(path, 'w') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+            print(f"Wrote {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
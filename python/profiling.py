@@ -0,0 +1,126 @@
+"""
+Profiling for single renders.
+
+profile_render() runs a render under cProfile and, where the platform has
+interval timers (POSIX, main thread), a stack sampler at the same time. It
+writes three files with a common stem:
+
+    <stem>.prof        cProfile stats, for pstats, snakeviz or profile_report.py
+    <stem>.collapsed   sampled stacks in collapsed format ("a;b;c 12"), for
+                       flamegraph.pl or speedscope
+    <stem>.json        the builder, phase timings and output size
+
+The builders write them next to the document with --profile, and
+render_worker.py writes them for sampled jobs into a directory that
+prune() keeps to the newest few. profile_report.py merges them.
+"""
+import os
+import json
+import time
+import signal
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+# 1ms of CPU time between stack samples
+SAMPLE_INTERVAL = float(os.environ.get('RECEGEN_PROFILE_INTERVAL_MS', 1)) / 1000
+
+PROFILE_SUFFIXES = ('.prof', '.collapsed', '.json')
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """
+    Counts the Python stacks seen on every SIGPROF while running. Signals
+    are only delivered to the main thread, so it does nothing elsewhere.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._previous = None
+
+    @staticmethod
+    def available():
+        return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+    def _sample(self, signum, frame):
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(labels))] += 1
+
+    def __enter__(self):
+        if self.available():
+            self._previous = signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._previous is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous)
+            self._previous = None
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+def profile_render(render, stem, describe=None):
+    """
+    Call `render()` under the profilers, write the profile files for `stem`
+    and return render()'s result. `describe(result)` returns what else to
+    store in <stem>.json (builder, timings...).
+    """
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    with StackSampler() as sampler:
+        profiler.enable()
+        try:
+            result = render()
+        finally:
+            profiler.disable()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    directory = os.path.dirname(stem)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(stem + '.prof')
+    if sampler.stacks:
+        with open(stem + '.collapsed', 'w') as f:
+            f.write(sampler.collapsed())
+    with open(stem + '.json', 'w') as f:
+        json.dump({
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'elapsed_ms': round(elapsed_ms, 3),
+            'samples': sum(sampler.stacks.values()),
+            **(describe(result) if describe else {}),
+        }, f, indent=2)
+    return result
+
+def profile_stem(directory, builder):
+    """
+    A unique stem in `directory` for a sampled profile of `builder`. Stems
+    sort by time, which prune() relies on.
+    """
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    return os.path.join(directory, f"{stamp}-{os.getpid()}-{builder}")
+
+def prune(directory, keep):
+    """
+    Delete all but the newest `keep` profiles in `directory`. Several
+    workers may prune at once, so files that are already gone are fine.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    stems = sorted({name[:-len(suffix)] for name in names for suffix in PROFILE_SUFFIXES
+                    if name.endswith(suffix)})
+    for stem in stems[:max(0, len(stems) - keep)]:
+        for suffix in PROFILE_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, stem + suffix))
+            except OSError:
+                pass
@@ -0,0 +1,86 @@
+import copy
+
+from docx import Document
+from docx.parts.document import DocumentPart
+
+from render_utils import stamp_core_properties
+
+# Parts that are cloned per document; everything else is shared with the
+# prototype. Builders must therefore not modify styles, numbering, theme etc.
+# once a prototype has been set up - do that in the template's setup function.
+_PER_DOCUMENT_CONTENT_TYPES = {
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml',
+    'application/vnd.openxmlformats-package.core-properties+xml',
+}
+
+_prototypes = {}
+
+class _ClonedDocumentPart(DocumentPart):
+    """
+    Document part of a document cloned from a prototype. python-docx resolves
+    a style name by scanning every style in the styles part, on each
+    paragraph and run; clones share their prototype's styles part, which
+    doesn't change after setup, so the lookups are cached per prototype.
+    """
+    def get_style_id(self, style_or_name, style_type):
+        if not isinstance(style_or_name, str):
+            return super().get_style_id(style_or_name, style_type)
+        key = (style_or_name, style_type)
+        style_ids = self._style_ids
+        if key not in style_ids:
+            style_ids[key] = super().get_style_id(style_or_name, style_type)
+        return style_ids[key]
+
+def _shared_parts_memo(prototype):
+    """
+    Build a deepcopy memo that maps every read-only part to itself, so
+    copying the document only copies the main document part and the
+    package graph around it.
+    """
+    memo = {}
+    for part in prototype.part.package.iter_parts():
+        if part.content_type not in _PER_DOCUMENT_CONTENT_TYPES:
+            memo[id(part)] = part
+    return memo
+
+def get_prototype(name, setup=None):
+    """
+    Return the cached prototype Document for template `name`, building it
+    with Document() and `setup(document)` on first use.
+    """
+    entry = _prototypes.get(name)
+    if entry is None:
+        prototype = Document()
+        stamp_core_properties(prototype)
+        if setup is not None:
+            setup(prototype)
+        entry = _prototypes[name] = (prototype, _shared_parts_memo(prototype), {}, {})
+    return entry[0]
+
+def new_document(name, setup=None):
+    """
+    Return a fresh Document for template `name`, cloned from its prototype.
+
+    `setup` builds the fixed skeleton of the template (margins, styles,
+    layout tables) and only runs once per process; each call afterwards
+    deep-copies the prototype's XML instead of unzipping and parsing the
+    default template again.
+    """
+    prototype = get_prototype(name, setup)
+    _, memo, style_ids, packed_members = _prototypes[name]
+    # Copy the part rather than the Document proxy: proxies cache
+    # sub-elements (the body), which lxml would copy as detached trees.
+    part = copy.deepcopy(prototype.part, dict(memo))
+    part.__dict__.pop('inline_shapes', None)
+    part.__class__ = _ClonedDocumentPart
+    part._style_ids = style_ids
+    # Lets write_package() reuse the shared parts' compressed bytes
+    part._shared_parts = memo
+    part._packed_members = packed_members
+    return part.document
+
+def clear():
+    """
+    Drop all cached prototypes, e.g. after changing a setup function.
+    """
+    _prototypes.clear()
@@ -0,0 +1,36 @@
+from collections import namedtuple
+
+from resume_builder import render_resume
+from generate_cv import render_cv
+from ats_cv_builder import render_ats_cv
+from ats_resume_builder import render_ats_resume
+from modern_resume_builder import render_modern_resume
+
+# `render(data, stream=None)` returns DOCX bytes, `filename` is the download name
+Builder = namedtuple('Builder', ['name', 'render', 'filename'])
+
+# Keyed by the suffix of the matching /api/generate-* route in server.js
+BUILDERS = {
+    'resume': Builder('resume', render_resume, 'resume_output.docx'),
+    'cv': Builder('cv', render_cv, 'cv_output.docx'),
+    'ats-cv': Builder('ats-cv', render_ats_cv, 'ats_cv_output.docx'),
+    'ats-resume': Builder('ats-resume', render_ats_resume, 'ats_resume_output.docx'),
+    'modern-resume': Builder('modern-resume', render_modern_resume, 'modern_resume.docx'),
+}
+
+def get_builder(name):
+    """
+    Look up a builder by name, raising a readable error for unknown names.
+    """
+    try:
+        return BUILDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown builder '{name}'. Expected one of: {', '.join(sorted(BUILDERS))}")
+
+def warm_up():
+    """
+    Render an empty payload with every builder so the template prototypes
+    and python-docx's lazily loaded modules are ready before the first job.
+    """
+    for builder in BUILDERS.values():
+        builder.render({})
@@ -0,0 +1,281 @@
+import sys
+import os
+import io
+import json
+import zlib
+import struct
+import hashlib
+import zipfile
+import argparse
+from collections import namedtuple, OrderedDict
+from datetime import datetime, timezone
+
+from docx.opc.packuri import PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+
+import schema
+import timings
+import interrupts
+import profiling
+import fonts
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docx')
+
+DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Fixed stamps so identical input always gives byte-identical output
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+CORE_PROPERTIES_DATE = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+def load_json(source):
+    """
+    Load a payload from a JSON file path, or from stdin when `source` is '-'.
+    """
+    with timings.phase('load'):
+        if source == '-':
+            return json.load(sys.stdin)
+        with open(source, 'r') as f:
+            return json.load(f)
+
+def stamp_core_properties(document):
+    """
+    Pin the document properties that would otherwise vary between renders.
+    """
+    properties = document.core_properties
+    properties.created = CORE_PROPERTIES_DATE
+    properties.modified = CORE_PROPERTIES_DATE
+    properties.last_modified_by = ''
+    properties.revision = 1
+
+# Zip compression level for saved documents: 0 stores members uncompressed,
+# 1 is fastest and 9 smallest. The default (-1) is zlib's level 6.
+COMPRESSION_LEVEL = int(os.environ.get('RECEGEN_COMPRESSION_LEVEL', zlib.Z_DEFAULT_COMPRESSION))
+
+# A zip member that is already compressed and can be written any number of times
+ZipMember = namedtuple('ZipMember', ['name', 'crc', 'size', 'data', 'method'], defaults=(zipfile.ZIP_DEFLATED,))
+
+_DOS_TIME = ZIP_DATE_TIME[3] << 11 | ZIP_DATE_TIME[4] << 5 | ZIP_DATE_TIME[5] // 2
+_DOS_DATE = (ZIP_DATE_TIME[0] - 1980) << 9 | ZIP_DATE_TIME[1] << 5 | ZIP_DATE_TIME[2]
+_ZIP_VERSION = 20
+_ZIP_CREATE_SYSTEM = 0 if os.name == 'nt' else 3
+
+_MEDIA_CACHE_SIZE = 32
+_media_members = OrderedDict()
+
+def deflate_member(name, data, level=None):
+    """
+    Compress `data` for write_zip() at `level` (COMPRESSION_LEVEL by
+    default), exactly as zipfile would. Level 0 stores it as it is.
+    """
+    level = COMPRESSION_LEVEL if level is None else level
+    if level == 0:
+        return ZipMember(name, zlib.crc32(data), len(data), bytes(data), zipfile.ZIP_STORED)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return ZipMember(name, zlib.crc32(data), len(data), compressor.compress(data) + compressor.flush())
+
+def media_member(name, data, key=None, level=None):
+    """
+    deflate_member() for images and other media, which usually repeat
+    between renders (the same photo) and are slow to compress. Kept in a
+    small LRU keyed by `key` (a content hash, computed if not given).
+    """
+    level = COMPRESSION_LEVEL if level is None else level
+    key = (key or hashlib.sha1(data).hexdigest(), level)
+    member = _media_members.get(key)
+    if member is None:
+        member = deflate_member('', data, level)
+        with interrupts.deferred():
+            _media_members[key] = member
+            if len(_media_members) > _MEDIA_CACHE_SIZE:
+                _media_members.popitem(last=False)
+    else:
+        _media_members.move_to_end(key)
+    return member._replace(name=name)
+
+def clear_media_cache():
+    _media_members.clear()
+
+def write_zip(stream, members):
+    """
+    Write compressed `members` as a zip archive. The bytes match what
+    zipfile produces for the same members, but nothing is compressed here,
+    so members that never change only have to be compressed once.
+    """
+    offset = 0
+    central_directory = []
+    for member in members:
+        name = member.name.encode('utf-8')
+        flags = 0 if member.name.isascii() else 0x800
+        stream.write(struct.pack('<4s2B4HL2L2H', b'PK\x03\x04', _ZIP_VERSION, 0, flags, member.method,
+                                 _DOS_TIME, _DOS_DATE, member.crc, len(member.data), member.size, len(name), 0))
+        stream.write(name)
+        stream.write(member.data)
+        central_directory.append(struct.pack('<4s4B4HL2L5H2L', b'PK\x01\x02', _ZIP_VERSION, _ZIP_CREATE_SYSTEM,
+                                             _ZIP_VERSION, 0, flags, member.method, _DOS_TIME, _DOS_DATE,
+                                             member.crc, len(member.data), member.size, len(name), 0, 0, 0, 0,
+                                             0o600 << 16, offset) + name)
+        offset += 30 + len(name) + len(member.data)
+    directory = b''.join(central_directory)
+    stream.write(directory)
+    stream.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(members), len(members), len(directory), offset, 0))
+
+def _part_members(part, level):
+    if part.content_type.startswith('image/'):
+        members = [media_member(part.partname.membername, part.blob, level=level)]
+    else:
+        members = [deflate_member(part.partname.membername, part.blob, level)]
+    if len(part.rels):
+        members.append(deflate_member(part.partname.rels_uri.membername, part.rels.xml, level))
+    return members
+
+def write_package(document, stream, level=None):
+    """
+    Same layout as python-docx's Document.save(), but every zip member gets
+    a fixed timestamp so the output only depends on the content.
+
+    Documents cloned from a template prototype (see prototypes.py) share
+    most parts with it - styles, theme, settings, numbering, fonts - and
+    those are compressed once per prototype and copied into every package
+    as they are. Only the document part, content types, rels and media are
+    compressed on each save. Fonts are embedded as configured in fonts.py.
+    """
+    level = COMPRESSION_LEVEL if level is None else level
+    document_part = document.part
+    shared = getattr(document_part, '_shared_parts', {})
+    packed = getattr(document_part, '_packed_members', {})
+    package = document_part.package
+    parts = list(package.iter_parts())
+
+    members = [deflate_member('[Content_Types].xml', _ContentTypesItem.from_parts(parts).blob, level),
+               deflate_member(PACKAGE_URI.rels_uri.membername, package.rels.xml, level)]
+    for part in parts:
+        if shared.get(id(part)) is not part:
+            members.extend(_part_members(part, level))
+            continue
+        key = (part.partname, level)
+        if key not in packed:
+            packed[key] = _part_members(part, level)
+        members.extend(packed[key])
+    write_zip(stream, fonts.embed(members, level))
+
+def save_document(document, stream=None):
+    """
+    Serialize `document` into `stream`, or return the DOCX bytes if no
+    stream is given. Output is deterministic for identical documents.
+    """
+    with timings.phase('save'):
+        if stream is not None:
+            write_package(document, stream)
+            return None
+        buffer = io.BytesIO()
+        write_package(document, buffer)
+        return buffer.getvalue()
+
+class _CountingWriter:
+    """
+    Counts the bytes written to a pipe. Like the pipe itself it can't
+    tell() or seek(), so zipfile writes to it the same way.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+def write_output(render, data, output_path):
+    """
+    Render `data` straight into `output_path` ('-' for stdout) and return
+    the number of bytes written.
+    """
+    if output_path == '-':
+        stdout = sys.stdout.buffer
+        if stdout.seekable():
+            # Redirected to a file: leave zipfile free to seek
+            start = stdout.tell()
+            render(data, stdout)
+            stdout.flush()
+            return stdout.tell() - start
+        stream = _CountingWriter(stdout)
+        render(data, stream)
+        stdout.flush()
+        return stream.written
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(output_path, 'wb') as f:
+        render(data, f)
+        return f.tell()
+
+def run_cli(render, default_filename, label, argv=None, name=None):
+    """
+    Shared command line entry point for the builders.
+
+        python resume_builder.py data.json            -> docx/<default_filename>
+        python resume_builder.py data.json -o out.docx
+        python resume_builder.py - < data.json > out.docx
+        python resume_builder.py data.json --profile  -> also docx/<name>.prof, .collapsed, .json
+        python ats_cv_builder.py data.json --photo me.jpg
+
+    Phase timings of the render are written to the timings side channel
+    under `name`, the builder's registry name (see timings.py). Returns the
+    exit status: 1 when there is no payload or it is invalid.
+    """
+    startup_ms = timings.process_uptime_ms()
+    parser = argparse.ArgumentParser(description=f"Generate a {label} DOCX from JSON data.")
+    parser.add_argument('json_path', nargs='?', help="Path to the JSON data, or '-' to read it from stdin.")
+    parser.add_argument('-o', '--output', help="Output path, or '-' for stdout. Defaults to stdout when "
+                                               "reading stdin, otherwise docx/" + default_filename + ".")
+    parser.add_argument('--compression-level', type=int, choices=range(-1, 10), metavar='LEVEL',
+                        help="Zip compression: 0 stores, 1 is fastest, 9 smallest (default: "
+                             "RECEGEN_COMPRESSION_LEVEL, or zlib's default).")
+    parser.add_argument('--photo', help="Image file to use as the photo, instead of a data URL in the JSON.")
+    parser.add_argument('--profile', action='store_true', help="Profile the render and write cProfile stats, "
+                                                               "collapsed stacks and timings next to the output.")
+    args = parser.parse_args(argv)
+
+    if not args.json_path:
+        print("Error: No JSON file provided.")
+        return 1
+    if args.compression_level is not None:
+        global COMPRESSION_LEVEL
+        COMPRESSION_LEVEL = args.compression_level
+
+    output_path = args.output
+    if output_path is None:
+        output_path = '-' if args.json_path == '-' else os.path.join(OUTPUT_DIR, default_filename)
+
+    def build():
+        with timings.phase('build'):
+            return write_output(render, data, output_path)
+
+    with timings.record() as phases:
+        if startup_ms is not None:
+            timings.add('startup', startup_ms)
+        data = load_json(args.json_path)
+        if args.photo:
+            with open(args.photo, 'rb') as f:
+                data['photo'] = f.read()
+        try:
+            data = schema.parse(data)
+        except schema.SchemaError as e:
+            print(f"Invalid payload: {e}", file=sys.stderr)
+            return 1
+        if args.profile:
+            # Output on stdout keeps its profile where the document would have gone
+            document_path = os.path.join(OUTPUT_DIR, default_filename) if output_path == '-' else output_path
+            stem = os.path.splitext(document_path)[0]
+            size = profiling.profile_render(build, stem, lambda size: {
+                'builder': name or label, 'phases': timings.rounded(phases), 'bytes': size})
+        else:
+            size = build()
+    timings.emit({'type': 'timings', 'builder': name or label, 'phases': timings.rounded(phases), 'bytes': size})
+    if output_path != '-':
+        print(f"{label} generated successfully: {output_path}")
+    if args.profile:
+        print(f"Profile written to {stem}.prof", file=sys.stderr)
+    return 0
@@ -0,0 +1,212 @@
+"""
+Long-lived render worker.
+
+Imports every builder once and then serves jobs over stdin/stdout, so the
+server doesn't pay for interpreter start-up and python-docx imports on every
+request. It is normally started by render_pool.js, but can be driven by
+anything that speaks the framing below.
+
+Framing: every frame is a 4-byte big-endian length followed by that many
+bytes. A message is two frames: a UTF-8 JSON header and a (possibly empty)
+binary body.
+
+    -> {"id": 1, "type": "render", "builder": "resume", "data": {...}}
+    <- {"id": 1, "ok": true, "builder": "resume", "filename": "resume_output.docx",
+        "size": 40210, "timings": {"load": 0.2, "build": 30.1, "save": 7.9}} + DOCX bytes
+
+A render with "photo": true carries the photo's raw bytes as its body; they
+replace data["photo"], so uploads never go through base64. A render with
+"profile": true is run under the profilers when the worker
+was started with --profile-dir; the reply then names the profile files'
+stem in "profile" (see profiling.py). Renders run within CPU, wall time
+and memory budgets; one that had to be degraded to fit lists the steps
+taken in "degraded" (see governor.py). "builder" and "filename" name the
+template that rendered, which after a template-fallback isn't the one asked
+for.
+
+    -> {"id": 2, "type": "preview", "builder": "cv", "data": {...}}
+    <- {"id": 2, "ok": true, "size": 5016, "timings": {...}} + UTF-8 HTML
+
+A preview renders the same layout as an HTML fragment instead of a DOCX
+(see preview.py), fast enough to follow an editor's keystrokes.
+
+    -> {"id": 3, "type": "bundle", "builders": ["cv", "ats-cv"], "data": {...}}
+    <- {"id": 3, "ok": true, "filename": "resume_bundle.zip", "size": 81234,
+        "manifest": [...], "timings": {...}} + zip bytes
+
+A bundle renders several templates from one payload in a single job, so its
+photo is decoded once for all of them (see bundle.py); "builders" defaults to
+all of them.
+
+    -> {"id": 4, "type": "ping"}
+    <- {"id": 4, "ok": true, "type": "pong", "jobs": 1}
+
+On start-up the worker sends {"type": "ready", "startup_ms": ..., ...} before
+reading any job. Timings are per-phase milliseconds, see timings.py.
+"""
+import sys
+import os
+import json
+import struct
+import argparse
+import traceback
+
+import registry
+import governor
+import preview
+import bundle
+import timings
+import profiling
+
+_LENGTH = struct.Struct('>I')
+
+def read_frame(stream):
+    """
+    Read one length-prefixed frame. Returns None on a clean EOF.
+    """
+    prefix = stream.read(_LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) < _LENGTH.size:
+        raise EOFError("Truncated frame length")
+    (length,) = _LENGTH.unpack(prefix)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise EOFError("Truncated frame payload")
+    return payload
+
+def read_message(stream):
+    header = read_frame(stream)
+    if header is None:
+        return None
+    body = read_frame(stream)
+    if body is None:
+        raise EOFError("Message header without body frame")
+    with timings.phase('load'):
+        return json.loads(header), body
+
+def write_message(stream, header, body=b''):
+    encoded = json.dumps(header).encode('utf-8')
+    stream.write(_LENGTH.pack(len(encoded)))
+    stream.write(encoded)
+    stream.write(_LENGTH.pack(len(body)))
+    stream.write(body)
+    stream.flush()
+
+def run_render(header, body=b''):
+    builder = registry.get_builder(header.get('builder'))
+    data = header.get('data') or {}
+    if header.get('photo') and body:
+        data['photo'] = body
+    with timings.phase('build'):
+        docx_bytes, degraded, rendered = governor.render(builder, data)
+    result = {'builder': rendered.name, 'filename': rendered.filename, 'size': len(docx_bytes)}
+    if degraded:
+        result['degraded'] = degraded
+    return result, docx_bytes
+
+def run_preview(header, body=b''):
+    builder = registry.get_builder(header.get('builder'))
+    data = header.get('data') or {}
+    if header.get('photo') and body:
+        data['photo'] = body
+    html = preview.render_html(builder.name, data).encode('utf-8')
+    return {'size': len(html)}, html
+
+def run_bundle(header, body=b''):
+    data = header.get('data') or {}
+    if header.get('photo') and body:
+        data['photo'] = body
+    with timings.phase('build'):
+        zip_bytes, manifest = bundle.render_bundle(data, header.get('builders'))
+    return {'filename': bundle.BUNDLE_FILENAME, 'size': len(zip_bytes), 'manifest': manifest}, zip_bytes
+
+def run_profiled(header, body, profile_dir, keep, phases):
+    """
+    run_render() under the profilers, keeping only the newest `keep`
+    profiles in `profile_dir`.
+    """
+    builder = registry.get_builder(header.get('builder')).name
+    stem = profiling.profile_stem(profile_dir, builder)
+    result, docx_bytes = profiling.profile_render(lambda: run_render(header, body), stem, lambda rendered: {
+        'builder': builder, 'phases': timings.rounded(phases), 'bytes': rendered[0]['size']})
+    profiling.prune(profile_dir, keep)
+    return {**result, 'profile': os.path.basename(stem)}, docx_bytes
+
+def serve(stdin, stdout, max_jobs=0, profile_dir=None, profile_keep=50):
+    """
+    Serve jobs until stdin closes, a shutdown message arrives, or `max_jobs`
+    renders have been completed (0 means no limit). Jobs marked for
+    profiling write their profiles to `profile_dir`.
+    """
+    startup_ms = timings.process_uptime_ms()
+    write_message(stdout, {'type': 'ready', 'pid': os.getpid(), 'builders': sorted(registry.BUILDERS),
+                           'startup_ms': None if startup_ms is None else round(startup_ms, 3)})
+
+    jobs = 0
+    while True:
+        # Waiting for input isn't a phase, so only decoding the message counts
+        with timings.record() as phases:
+            message = read_message(stdin)
+        if message is None:
+            break
+        header, body = message
+        kind = header.get('type', 'render')
+        reply = {'id': header.get('id'), 'ok': True}
+
+        if kind == 'ping':
+            reply.update({'type': 'pong', 'jobs': jobs})
+            write_message(stdout, reply)
+            continue
+
+        if kind == 'shutdown':
+            reply['type'] = 'bye'
+            write_message(stdout, reply)
+            break
+
+        result_body = b''
+        try:
+            if kind not in ('render', 'preview', 'bundle'):
+                raise ValueError(f"Unknown message type '{kind}'")
+            with timings.record(phases):
+                if kind == 'preview':
+                    result, result_body = run_preview(header, body)
+                elif kind == 'bundle':
+                    result, result_body = run_bundle(header, body)
+                elif header.get('profile') and profile_dir:
+                    result, result_body = run_profiled(header, body, profile_dir, profile_keep, phases)
+                else:
+                    result, result_body = run_render(header, body)
+            reply.update(result)
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            reply.update({'ok': False, 'error': f"{type(e).__name__}: {e}"})
+        reply['timings'] = timings.rounded(phases)
+        jobs += 1
+
+        if max_jobs and jobs >= max_jobs:
+            reply['recycle'] = True
+        write_message(stdout, reply, result_body)
+        if reply.get('recycle'):
+            break
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve render jobs over framed stdin/stdout.")
+    parser.add_argument('--max-jobs', type=int, default=0,
+                        help="Exit after this many renders so the pool can start a fresh process (0 = never).")
+    parser.add_argument('--profile-dir', help="Write profiles of jobs marked for profiling to this directory.")
+    parser.add_argument('--profile-keep', type=int, default=50,
+                        help="Number of profiles to keep in --profile-dir (default: 50).")
+    args = parser.parse_args(argv)
+
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    # Builders print progress lines; keep them off the framed channel
+    sys.stdout = sys.stderr
+
+    registry.warm_up()
+    governor.limit_memory()
+    serve(stdin, stdout, max_jobs=args.max_jobs, profile_dir=args.profile_dir, profile_keep=args.profile_keep)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,13 @@
 import sys
-import json
 import os
-from docx import Document
 from docx.shared import Pt
 
-def generate_resume(json_path):
-    # Load data
-    with open(json_path, 'r') as f:
-        data = json.load(f)
-
-    document = Document()
+import schema
+from prototypes import new_document
+from sections import Section, render_sections
+from render_utils import OUTPUT_DIR, load_json, save_document, write_output, run_cli
 
+def _render_header(document, data):
     # Main Header
     document.add_heading(data.get('name', 'Your Name'), 0)
 
@@ -21,11 +18,13 @@ def generate_resume(json_path):
     if 'email' in data: document.add_paragraph(f"Email: {data['email']}")
     if 'linkedin' in data: document.add_paragraph(f"LinkedIn: {data['linkedin']}")
 
+def _render_objective(document, data):
     # Career Objective
     if 'objective' in data:
         document.add_heading('Career Objective', level=1)
         document.add_paragraph(data['objective'])
 
+def _render_experience(document, data):
     # Experience
     if 'experience' in data and len(data['experience']) > 0:
         document.add_heading('Experience', level=1)
@@ -36,6 +35,7 @@ def generate_resume(json_path):
             p.add_run(f" ({exp.get('date', '')})")
             document.add_paragraph(exp.get('description', ''))
 
+def _render_education(document, data):
     # Academic Details
     if 'education' in data and len(data['education']) > 0:
         document.add_heading('Academic Details', level=1)
@@ -51,22 +51,41 @@ def generate_resume(json_path):
             row_cells[1].text = edu.get('school', '')
             row_cells[2].text = edu.get('year', '')
 
+def _render_skills(document, data):
     # Skills
     if 'skills' in data:
         document.add_heading('Skills', level=1)
         document.add_paragraph(data['skills'])
 
-    # Save the document
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docx')
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    output_filename = os.path.join(output_dir, 'resume_output.docx')
-    document.save(output_filename)
+SECTIONS = [
+    Section('header', 'body', ('name', 'address', 'phone', 'email', 'linkedin'), _render_header),
+    Section('objective', 'body', ('objective',), _render_objective),
+    Section('experience', 'body', ('experience',), _render_experience),
+    Section('education', 'body', ('education',), _render_education),
+    Section('skills', 'body', ('skills',), _render_skills),
+]
+
+def _containers(document):
+    return {'body': document}
+
+def build_resume(data):
+    document = new_document('resume')
+    render_sections(SECTIONS, _containers(document), data, 'resume')
+    return document
+
+def render_resume(data, stream=None):
+    """
+    Render the resume for `data` (a payload dict or a schema.Resume) and
+    return the DOCX bytes, or write them to `stream` if one is given.
+    """
+    data = schema.view(data, 'resume')
+    return save_document(build_resume(data), stream)
+
+def generate_resume(json_path):
+    data = load_json(json_path)
+    output_filename = os.path.join(OUTPUT_DIR, 'resume_output.docx')
+    write_output(render_resume, data, output_filename)
     print(f"Resume generated successfully: {output_filename}")
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        generate_resume(sys.argv[1])
-    else:
-        print("Error: No JSON file provided.")
+    sys.exit(run_cli(render_resume, 'resume_output.docx', 'Resume', name='resume'))
@@ -0,0 +1,230 @@
+"""
+Payload validation and normalization ahead of rendering.
+
+The builders grew up reading the payload in different shapes: skills as a
+comma separated string (resume, cv, the ATS templates) or as {name, level}
+objects (modern resume), the headline as `title` or `jobTitle`, the summary
+as `summary` or `objective`, the address as `address` or `location`.
+parse() turns a payload in any of those shapes into one Resume, checking
+types and size limits on the way, and view() hands each builder the dict it
+reads. The builders' render functions take either.
+
+    resume = schema.parse(data)           # SchemaError if invalid
+    schema.view(resume, 'modern-resume')  # {'jobTitle': ..., 'skills': [{...}]}
+    schema.to_payload(resume)             # the normalized JSON form
+
+The field table is compiled once into one check per field, so a parse is a
+single pass over the payload. schema.js applies the same table in the
+server, which rejects bad payloads before they reach a worker and sends the
+workers only the normalized form.
+"""
+import numbers
+from collections import namedtuple
+
+# Field kinds
+TEXT = 'text'          # a string (numbers are accepted and turned into strings)
+LIST = 'list'          # a comma separated string or a list of strings
+SKILLS = 'skills'      # LIST, or a list of {name, level}
+ENTRIES = 'entries'    # a list of objects with TEXT fields
+PHOTO = 'photo'        # a data URL, base64 string or the image bytes
+
+# `limit` is the longest string for TEXT, LIST and SKILLS items and entry
+# fields, `items` the most list entries. The limits only stop abuse: long
+# payloads are the governor's and page_fit's to shorten, not the schema's. Aliases are other names builders
+# use for the field; the field's own name wins if both are given.
+Field = namedtuple('Field', ['name', 'kind', 'limit', 'items', 'aliases', 'fields'],
+                   defaults=(None, (), ()))
+
+SHORT_TEXT = 200
+LONG_TEXT = 50000
+DEFAULT_SKILL_LEVEL = 50
+
+FIELDS = [
+    Field('name', TEXT, SHORT_TEXT),
+    Field('title', TEXT, SHORT_TEXT, aliases=('jobTitle',)),
+    Field('email', TEXT, 320),
+    Field('phone', TEXT, 50),
+    Field('address', TEXT, 500, aliases=('location',)),
+    Field('linkedin', TEXT, 500),
+    Field('summary', TEXT, LONG_TEXT, aliases=('objective',)),
+    Field('skills', SKILLS, 100, items=2000),
+    Field('languages', LIST, 100, items=500),
+    Field('hobbies', LIST, 100, items=500),
+    Field('experience', ENTRIES, LONG_TEXT, items=5000, fields=('title', 'company', 'date', 'description')),
+    Field('education', ENTRIES, LONG_TEXT, items=5000, fields=('degree', 'school', 'year')),
+    Field('photo', PHOTO, None),
+]
+
+# Absent fields are None
+Resume = namedtuple('Resume', [field.name for field in FIELDS], defaults=(None,) * len(FIELDS))
+Skill = namedtuple('Skill', ['name', 'level'])
+Experience = namedtuple('Experience', ['title', 'company', 'date', 'description'], defaults=(None,) * 4)
+Education = namedtuple('Education', ['degree', 'school', 'year'], defaults=(None,) * 3)
+
+_ENTRY_TYPES = {'experience': Experience, 'education': Education}
+
+# Names each builder reads the renamed fields under, and the skills shape
+_VIEW_NAMES = {
+    'cv': {'address': 'location'},
+    'modern-resume': {'title': 'jobTitle', 'summary': 'objective'},
+}
+_DEFAULT_VIEW_NAMES = {'summary': 'objective'}
+_SKILL_OBJECT_BUILDERS = {'modern-resume'}
+
+class SchemaError(ValueError):
+    """
+    A payload that can't be rendered. `path` names the offending field,
+    e.g. 'experience[2].title'.
+    """
+    def __init__(self, path, message):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+
+# Compiled checks: each takes (value, path) and returns the normalized value
+
+def _text_check(limit):
+    def check(value, path):
+        if isinstance(value, str):
+            pass
+        elif isinstance(value, numbers.Real) and not isinstance(value, bool):
+            value = str(value)
+        else:
+            raise SchemaError(path, f"expected a string, got {type(value).__name__}")
+        if len(value) > limit:
+            raise SchemaError(path, f"longer than {limit} characters")
+        return value
+    return check
+
+def _items(value, path, items):
+    if isinstance(value, str):
+        value = value.split(',')
+    elif not isinstance(value, list):
+        raise SchemaError(path, f"expected a list or a comma separated string, got {type(value).__name__}")
+    if len(value) > items:
+        raise SchemaError(path, f"more than {items} entries")
+    return value
+
+def _list_check(field):
+    text = _text_check(field.limit)
+
+    def check(value, path):
+        result = []
+        for index, item in enumerate(_items(value, path, field.items)):
+            item = text(item, f"{path}[{index}]").strip()
+            if item:
+                result.append(item)
+        return tuple(result)
+    return check
+
+def _level(value, path):
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            raise SchemaError(path, "expected a number")
+    elif not isinstance(value, numbers.Real) or isinstance(value, bool):
+        raise SchemaError(path, "expected a number")
+    if not 0 <= value <= 100:
+        raise SchemaError(path, "expected a level from 0 to 100")
+    return int(value)
+
+def _skills_check(field):
+    text = _text_check(field.limit)
+
+    def check(value, path):
+        result = []
+        for index, item in enumerate(_items(value, path, field.items)):
+            item_path = f"{path}[{index}]"
+            if isinstance(item, dict):
+                name = text(item.get('name', ''), f"{item_path}.name").strip()
+                level = item.get('level')
+                level = DEFAULT_SKILL_LEVEL if level is None else _level(level, f"{item_path}.level")
+            else:
+                name, level = text(item, item_path).strip(), DEFAULT_SKILL_LEVEL
+            if name:
+                result.append(Skill(name, level))
+        return tuple(result)
+    return check
+
+def _entries_check(field):
+    entry_type = _ENTRY_TYPES[field.name]
+    text = _text_check(field.limit)
+
+    def check(value, path):
+        if not isinstance(value, list):
+            raise SchemaError(path, f"expected a list, got {type(value).__name__}")
+        if len(value) > field.items:
+            raise SchemaError(path, f"more than {field.items} entries")
+        result = []
+        for index, entry in enumerate(value):
+            if not isinstance(entry, dict):
+                raise SchemaError(f"{path}[{index}]", f"expected an object, got {type(entry).__name__}")
+            result.append(entry_type(**{key: text(entry[key], f"{path}[{index}].{key}")
+                                        for key in field.fields if entry.get(key) is not None}))
+        return tuple(result)
+    return check
+
+def _photo_check(value, path):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value) or None
+    if not isinstance(value, str):
+        raise SchemaError(path, f"expected a data URL, got {type(value).__name__}")
+    return value or None
+
+_COMPILERS = {
+    TEXT: lambda field: _text_check(field.limit),
+    LIST: _list_check,
+    SKILLS: _skills_check,
+    ENTRIES: _entries_check,
+    PHOTO: lambda field: _photo_check,
+}
+
+# (field name, names to look for in order, check)
+_CHECKS = [(field.name, (field.name,) + field.aliases, _COMPILERS[field.kind](field)) for field in FIELDS]
+
+def parse(data):
+    """
+    Validate `data` (a payload dict) and return it as a Resume. Unknown
+    keys are dropped. Raises SchemaError.
+    """
+    if isinstance(data, Resume):
+        return data
+    if not isinstance(data, dict):
+        raise SchemaError('payload', f"expected an object, got {type(data).__name__}")
+    values = {}
+    for name, keys, check in _CHECKS:
+        for key in keys:
+            value = data.get(key)
+            if value is not None:
+                values[name] = check(value, key)
+                break
+    return Resume(**values)
+
+def _as_dict(resume, names, skill_objects):
+    payload = {}
+    for name, value in zip(Resume._fields, resume):
+        if value is None:
+            continue
+        if name == 'skills':
+            value = [skill._asdict() for skill in value] if skill_objects else ', '.join(skill.name for skill in value)
+        elif name in _ENTRY_TYPES:
+            value = [{key: item for key, item in entry._asdict().items() if item is not None} for entry in value]
+        elif isinstance(value, tuple):
+            value = list(value)
+        payload[names.get(name, name)] = value
+    return payload
+
+def view(data, builder):
+    """
+    The payload dict `builder` reads, from a Resume or a raw payload.
+    Absent fields stay absent so the builders' `'key' in data` checks
+    keep working.
+    """
+    return _as_dict(parse(data), _VIEW_NAMES.get(builder, _DEFAULT_VIEW_NAMES), builder in _SKILL_OBJECT_BUILDERS)
+
+def to_payload(data):
+    """
+    The normalized JSON form of `data` (a Resume or a raw payload), as
+    schema.js sends it to the workers. Skills are {name, level} objects.
+    """
+    return _as_dict(parse(data), {}, True)
@@ -0,0 +1,107 @@
+"""
+Section-level rendering with a fragment cache.
+
+Each builder describes its document as a list of Sections: header/contact,
+summary, experience, education, skills, sidebar blocks... A section declares
+the payload keys it reads and renders only from that slice of the data, so
+its output can be cached by a hash of the slice. When a live edit session
+re-renders after changing one experience entry, only the experience section
+is rebuilt; every other section's XML is copied from the cache and spliced
+into the freshly cloned template body.
+
+Sections that add relationships to the document (pictures) can't be reused
+in another document and are marked cacheable=False.
+"""
+import os
+import copy
+import json
+import hashlib
+from collections import OrderedDict, namedtuple
+
+from docx.document import Document
+from docx.oxml.ns import qn
+
+import interrupts
+
+# `container` names an entry of the containers dict passed to render_sections,
+# `inputs` are the payload keys the section reads.
+Section = namedtuple('Section', ['name', 'container', 'inputs', 'render', 'cacheable'], defaults=(True,))
+
+MAX_FRAGMENTS = int(os.environ.get('RECEGEN_SECTION_CACHE_SIZE', 2048))
+
+_fragments = OrderedDict()
+stats = {'hits': 0, 'misses': 0}
+
+def data_slice(data, inputs):
+    """
+    The part of `data` a section may read. Missing keys stay missing so
+    `'key' in data` checks keep working.
+    """
+    return {key: data[key] for key in inputs if key in data}
+
+def slice_digest(data):
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+def block_element(container):
+    """
+    The XML element new blocks of `container` (a Document or a table cell)
+    are appended to.
+    """
+    if isinstance(container, Document):
+        return container.element.body
+    return container._element
+
+def insertion_index(parent):
+    # Body content goes in front of the final section properties
+    sect_pr = parent.find(qn('w:sectPr'))
+    return parent.index(sect_pr) if sect_pr is not None else len(parent)
+
+def _remember(key, elements):
+    with interrupts.deferred():
+        _fragments[key] = elements
+        if len(_fragments) > MAX_FRAGMENTS:
+            _fragments.popitem(last=False)
+
+def render_section(section, container, data, cache_prefix):
+    parent = block_element(container)
+    section_data = data_slice(data, section.inputs)
+
+    key = None
+    if section.cacheable:
+        key = (cache_prefix, section.name, slice_digest(section_data))
+        cached = _fragments.get(key)
+        if cached is not None:
+            _fragments.move_to_end(key)
+            stats['hits'] += 1
+            index = insertion_index(parent)
+            for offset, element in enumerate(cached):
+                parent.insert(index + offset, copy.deepcopy(element))
+            return
+
+    start = insertion_index(parent)
+    count = len(parent)
+    section.render(container, section_data)
+    if key is not None:
+        stats['misses'] += 1
+        new_elements = parent[start:start + len(parent) - count]
+        _remember(key, [copy.deepcopy(el) for el in new_elements])
+
+def render_sections(sections, containers, data, cache_prefix):
+    """
+    Render `sections` in order into `containers`, reusing cached fragments
+    for sections whose input slice hasn't changed. `cache_prefix` keeps
+    the builders' fragments apart.
+    """
+    for section in sections:
+        render_section(section, containers[section.container], data, cache_prefix)
+
+def ensure_paragraph(cell):
+    """
+    A table cell must end up with at least one paragraph.
+    """
+    if not cell._element.findall(qn('w:p')):
+        cell.add_paragraph()
+
+def clear_cache():
+    _fragments.clear()
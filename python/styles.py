@@ -0,0 +1,57 @@
+"""
+Named styles for the templates.
+
+Each template declares the styles its content uses (section header, job
+title, company, date, sidebar text...) as a list of Style entries. The
+setup function adds them to the styles part once, when the prototype is
+built, and content refers to them by name instead of formatting every run
+directly, so document.xml carries a style reference rather than a copy of
+the same run properties for every entry.
+"""
+from collections import namedtuple
+
+from docx.enum.style import WD_STYLE_TYPE
+
+PARAGRAPH = WD_STYLE_TYPE.PARAGRAPH
+CHARACTER = WD_STYLE_TYPE.CHARACTER
+
+# Fields left as None are inherited from `base`. Paragraph styles are based
+# on Normal unless another base is given; the paragraph fields
+# (space_before, space_after, left_indent, alignment) only apply to them.
+Style = namedtuple('Style', ['name', 'type', 'base', 'font', 'size', 'bold', 'italic', 'color',
+                             'space_before', 'space_after', 'left_indent', 'alignment'],
+                   defaults=(PARAGRAPH,) + (None,) * 10)
+
+def add_styles(document, styles):
+    """
+    Add `styles` (a list of Style) to `document`'s styles part.
+    """
+    for spec in styles:
+        style = document.styles.add_style(spec.name, spec.type)
+        base = spec.base or ('Normal' if spec.type == PARAGRAPH else None)
+        if base:
+            style.base_style = document.styles[base]
+
+        font = style.font
+        if spec.font is not None:
+            font.name = spec.font
+        if spec.size is not None:
+            font.size = spec.size
+        if spec.bold is not None:
+            font.bold = spec.bold
+        if spec.italic is not None:
+            font.italic = spec.italic
+        if spec.color is not None:
+            font.color.rgb = spec.color
+
+        if spec.type != PARAGRAPH:
+            continue
+        paragraph_format = style.paragraph_format
+        if spec.space_before is not None:
+            paragraph_format.space_before = spec.space_before
+        if spec.space_after is not None:
+            paragraph_format.space_after = spec.space_after
+        if spec.left_indent is not None:
+            paragraph_format.left_indent = spec.left_indent
+        if spec.alignment is not None:
+            paragraph_format.alignment = spec.alignment
@@ -0,0 +1,123 @@
+"""
+Per-phase render timings.
+
+A render is split into phases:
+
+    startup   interpreter start until the CLI begins (CLI only)
+    load      decoding the JSON payload
+    photo     decoding and downscaling photos
+    build     building the document
+    save      serializing and compressing the package
+
+Phases are exclusive: time spent in a phase opened inside another one (a
+photo decoded while the document is built) only counts for the inner one.
+Nothing is recorded unless a record() is open, so the builders can be used
+as before without paying for it.
+
+The CLI writes one JSON line per render to a side channel, chosen with
+RECEGEN_TIMINGS: 'stderr' (the default), 'off', a file descriptor number
+or a file path to append to.
+
+    {"type": "timings", "builder": "cv", "phases": {"startup": 41.2, "load": 0.3,
+     "build": 35.1, "photo": 12.0, "save": 8.4}, "bytes": 40210}
+
+Durations are milliseconds. render_worker.py sends the same phases in the
+reply header instead, where render_pool.js picks them up.
+"""
+import sys
+import os
+import json
+import time
+from contextlib import contextmanager
+
+# Open phases of the current record, innermost last, as [name, started]
+_stack = None
+_phases = None
+
+@contextmanager
+def record(phases=None):
+    """
+    Collect the phases run inside the block into the yielded dict
+    (phase -> milliseconds). Pass the dict of an earlier record to add to it.
+    """
+    global _stack, _phases
+    outer = _stack, _phases
+    _stack, _phases = [], {} if phases is None else phases
+    phases = _phases
+    try:
+        yield phases
+    finally:
+        _stack, _phases = outer
+
+def _credit(entry, now):
+    name, started = entry
+    _phases[name] = _phases.get(name, 0.0) + (now - started) * 1000
+
+@contextmanager
+def phase(name):
+    """
+    Time the block as phase `name` of the current record, if there is one.
+    """
+    if _phases is None:
+        yield
+        return
+    stack = _stack
+    now = time.perf_counter()
+    if stack:
+        # Pause the enclosing phase
+        _credit(stack[-1], now)
+    entry = [name, now]
+    stack.append(entry)
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        _credit(stack.pop(), now)
+        if stack:
+            stack[-1][1] = now
+
+def add(name, milliseconds):
+    """
+    Add a phase measured elsewhere (e.g. before the record was opened).
+    """
+    if _phases is not None:
+        _phases[name] = _phases.get(name, 0.0) + milliseconds
+
+def rounded(phases):
+    return {name: round(ms, 3) for name, ms in phases.items()}
+
+def process_uptime_ms():
+    """
+    Milliseconds since this process started, or None where that isn't
+    available (only Linux exposes it without extra dependencies).
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime) in clock ticks since boot; the name in
+            # field 2 can contain spaces, so split after its closing paren
+            started = int(f.read().rsplit(')', 1)[1].split()[19]) / os.sysconf('SC_CLK_TCK')
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, (uptime - started) * 1000)
+
+def emit(event):
+    """
+    Write `event` as one JSON line to the side channel set by RECEGEN_TIMINGS.
+    """
+    target = os.environ.get('RECEGEN_TIMINGS', 'stderr')
+    if target == 'off':
+        return
+    line = json.dumps(event, separators=(', ', ': ')) + '\n'
+    try:
+        if target == 'stderr':
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        elif target.isdigit():
+            os.write(int(target), line.encode('utf-8'))
+        else:
+            with open(target, 'a') as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Could not write timings to {target}: {e}", file=sys.stderr)
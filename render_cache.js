@@ -0,0 +1,128 @@
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+
+// JSON with object keys sorted at every level, so key order in the request
+// doesn't change the cache key.
+const canonicalJson = (value) => {
+    if (Array.isArray(value)) return `[${value.map(canonicalJson).join(',')}]`;
+    if (value && typeof value === 'object') {
+        const keys = Object.keys(value).filter((k) => value[k] !== undefined).sort();
+        return `{${keys.map((k) => `${JSON.stringify(k)}:${canonicalJson(value[k])}`).join(',')}}`;
+    }
+    return JSON.stringify(value === undefined ? null : value);
+};
+
+// Hash of the Python render code: any change to a builder or a shared module
+// gives every cache key a new version.
+const renderCodeVersion = (pythonDir = path.join(__dirname, 'python')) => {
+    const hash = crypto.createHash('sha1');
+    for (const name of fs.readdirSync(pythonDir).filter((n) => n.endsWith('.py')).sort()) {
+        hash.update(name);
+        hash.update(fs.readFileSync(path.join(pythonDir, name)));
+    }
+    return hash.digest('hex').slice(0, 12);
+};
+
+// Byte-bounded LRU of rendered documents, keyed by (builder, payload, code
+// version). Identical renders that are already running are shared instead
+// of being started again.
+class RenderCache {
+    constructor({ maxBytes = 64 * 1024 * 1024, version = renderCodeVersion() } = {}) {
+        this.maxBytes = maxBytes;
+        this.version = version;
+        this.entries = new Map();
+        this.bytes = 0;
+        this.inflight = new Map();
+        this.counters = { hits: 0, misses: 0, coalesced: 0, evictions: 0 };
+    }
+
+    // `photo` is an uploaded photo Buffer sent alongside the payload, if any
+    keyFor(builder, data, photo = null) {
+        const hash = crypto.createHash('sha256')
+            .update(`${builder}\0${this.version}\0`)
+            .update(canonicalJson(data));
+        if (photo) hash.update('\0photo\0').update(photo);
+        return hash.digest('hex');
+    }
+
+    etagFor(key) {
+        return `"${key.slice(0, 32)}"`;
+    }
+
+    get(key) {
+        const body = this.entries.get(key);
+        if (body === undefined) return undefined;
+        // Move to the most recently used end
+        this.entries.delete(key);
+        this.entries.set(key, body);
+        return body;
+    }
+
+    set(key, body) {
+        if (body.length > this.maxBytes) return;
+        if (this.entries.has(key)) this.bytes -= this.entries.get(key).length;
+        this.entries.set(key, body);
+        this.bytes += body.length;
+        for (const [oldKey, oldBody] of this.entries) {
+            if (this.bytes <= this.maxBytes) break;
+            this.entries.delete(oldKey);
+            this.bytes -= oldBody.length;
+            this.counters.evictions++;
+        }
+    }
+
+    // Resolves with { body, cache: 'hit' | 'miss' | 'coalesced' }. `render`
+    // receives an AbortSignal that only fires once every waiting request has
+    // gone away. It resolves with the body, or with { body, cacheable,
+    // ...details } to keep a result out of the cache (e.g. a degraded render)
+    // and pass details on to every request waiting for it.
+    fetch(key, render, { signal } = {}) {
+        const cached = this.get(key);
+        if (cached !== undefined) {
+            this.counters.hits++;
+            return Promise.resolve({ body: cached, cache: 'hit' });
+        }
+
+        let entry = this.inflight.get(key);
+        let status = 'coalesced';
+        if (entry) {
+            this.counters.coalesced++;
+        } else {
+            status = 'miss';
+            this.counters.misses++;
+            const controller = new AbortController();
+            entry = { controller, waiters: 0 };
+            entry.promise = render(controller.signal)
+                .then((result) => {
+                    const { body, cacheable = true, ...details } = Buffer.isBuffer(result) ? { body: result } : result;
+                    if (cacheable) this.set(key, body);
+                    return { body, details };
+                })
+                .finally(() => this.inflight.delete(key));
+            this.inflight.set(key, entry);
+        }
+
+        entry.waiters++;
+        if (signal) {
+            signal.addEventListener('abort', () => {
+                entry.waiters--;
+                if (entry.waiters === 0) entry.controller.abort();
+            }, { once: true });
+        }
+        return entry.promise.then(({ body, details }) => ({ ...details, body, cache: status }));
+    }
+
+    stats() {
+        return {
+            entries: this.entries.size,
+            bytes: this.bytes,
+            maxBytes: this.maxBytes,
+            inflight: this.inflight.size,
+            version: this.version,
+            ...this.counters,
+        };
+    }
+}
+
+module.exports = { RenderCache, canonicalJson, renderCodeVersion };
@@ -0,0 +1,282 @@
+const { spawn } = require('child_process');
+const path = require('path');
+
+// Frames are a 4-byte big-endian length followed by the payload; a message is
+// a JSON header frame plus a binary body frame (see python/render_worker.py).
+// The body is written as its own chunk so large bodies (photos) aren't copied.
+const encodeFrames = (header, body = Buffer.alloc(0)) => {
+    const headerBuf = Buffer.from(JSON.stringify(header), 'utf8');
+    const prefix = Buffer.alloc(8 + headerBuf.length);
+    prefix.writeUInt32BE(headerBuf.length, 0);
+    headerBuf.copy(prefix, 4);
+    prefix.writeUInt32BE(body.length, 4 + headerBuf.length);
+    return [prefix, body];
+};
+
+const encodeMessage = (header, body) => Buffer.concat(encodeFrames(header, body));
+
+class MessageReader {
+    constructor(onMessage) {
+        this.onMessage = onMessage;
+        this.buffer = Buffer.alloc(0);
+        this.header = null;
+    }
+
+    push(chunk) {
+        this.buffer = this.buffer.length ? Buffer.concat([this.buffer, chunk]) : chunk;
+        while (this.buffer.length >= 4) {
+            const length = this.buffer.readUInt32BE(0);
+            if (this.buffer.length < 4 + length) break;
+            const frame = this.buffer.subarray(4, 4 + length);
+            this.buffer = this.buffer.subarray(4 + length);
+            if (this.header === null) {
+                this.header = JSON.parse(frame.toString('utf8'));
+            } else {
+                const header = this.header;
+                this.header = null;
+                // Copy so a kept body doesn't pin the whole read buffer
+                this.onMessage(header, Buffer.from(frame));
+            }
+        }
+    }
+}
+
+class RenderWorker {
+    constructor(pool, id) {
+        this.pool = pool;
+        this.id = id;
+        this.ready = false;
+        this.busy = false;
+        this.retiring = false;
+        this.jobs = 0;
+        this.pending = new Map();
+        this.nextMessageId = 1;
+
+        const { python, script, maxJobsPerWorker, profileEvery, profileDir, profileKeep } = pool.options;
+        const args = [script, '--max-jobs', String(maxJobsPerWorker)];
+        if (profileEvery > 0) args.push('--profile-dir', profileDir, '--profile-keep', String(profileKeep));
+        this.process = spawn(python, args, { cwd: path.dirname(script), stdio: ['pipe', 'pipe', 'pipe'] });
+
+        const reader = new MessageReader((header, body) => this.handleMessage(header, body));
+        this.process.stdout.on('data', (chunk) => reader.push(chunk));
+        this.process.stderr.on('data', (data) => {
+            console.error(`[render worker ${this.id}] ${data.toString().trimEnd()}`);
+        });
+        this.process.stdin.on('error', (err) => {
+            console.error(`[render worker ${this.id}] stdin error: ${err.message}`);
+        });
+        this.process.on('error', (err) => {
+            console.error(`[render worker ${this.id}] failed to start: ${err.message}`);
+            this.handleExit(null);
+        });
+        this.process.on('exit', (code) => this.handleExit(code));
+    }
+
+    send(header, body) {
+        const id = this.nextMessageId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            for (const chunk of encodeFrames({ ...header, id }, body)) {
+                if (chunk.length) this.process.stdin.write(chunk);
+            }
+        });
+    }
+
+    handleMessage(header, body) {
+        if (header.type === 'ready') {
+            this.ready = true;
+            if (this.pool.options.onWorkerReady) this.pool.options.onWorkerReady(this, header);
+            this.pool.workerIdle(this);
+            return;
+        }
+        const waiter = this.pending.get(header.id);
+        if (!waiter) return;
+        this.pending.delete(header.id);
+        if (header.recycle) this.retiring = true;
+        waiter.resolve({ header, body });
+    }
+
+    ping(timeoutMs) {
+        let timer;
+        const timeout = new Promise((_, reject) => {
+            timer = setTimeout(() => reject(new Error('Health check timed out')), timeoutMs);
+        });
+        return Promise.race([this.send({ type: 'ping' }), timeout]).finally(() => clearTimeout(timer));
+    }
+
+    kill() {
+        this.retiring = true;
+        this.process.kill();
+    }
+
+    handleExit(code) {
+        if (this.exited) return;
+        this.exited = true;
+        for (const waiter of this.pending.values()) {
+            waiter.reject(new Error(`Render worker exited (code ${code})`));
+        }
+        this.pending.clear();
+        this.pool.workerExited(this, code);
+    }
+}
+
+class RenderPool {
+    constructor(options = {}) {
+        this.options = {
+            size: 2,
+            maxJobsPerWorker: 200,
+            healthCheckInterval: 10000,
+            healthCheckTimeout: 5000,
+            python: 'python',
+            script: path.join(__dirname, 'python', 'render_worker.py'),
+            maxAffinityKeys: 10000,
+            // Called with (worker, readyHeader) when a worker has started
+            onWorkerReady: null,
+            // Profile every Nth render (0 = never), keeping the newest
+            // `profileKeep` profiles in `profileDir`
+            profileEvery: 0,
+            profileDir: null,
+            profileKeep: 50,
+            ...options,
+        };
+        this.workers = new Set();
+        this.idle = [];
+        this.queue = [];
+        // Affinity key -> worker that last ran it, oldest first
+        this.affinity = new Map();
+        this.nextWorkerId = 1;
+        this.dispatched = 0;
+        this.stopped = false;
+    }
+
+    start() {
+        for (let i = 0; i < this.options.size; i++) this.spawnWorker();
+        this.healthTimer = setInterval(() => this.checkHealth(), this.options.healthCheckInterval);
+        this.healthTimer.unref();
+        return this;
+    }
+
+    stop() {
+        this.stopped = true;
+        clearInterval(this.healthTimer);
+        for (const worker of this.workers) worker.kill();
+        for (const job of this.queue) job.reject(new Error('Render pool stopped'));
+        this.queue = [];
+    }
+
+    spawnWorker() {
+        const worker = new RenderWorker(this, this.nextWorkerId++);
+        this.workers.add(worker);
+    }
+
+    // Resolves with { header, body } from the worker; rejects if the worker
+    // reports an error, dies mid-job or runs past `timeoutMs`. Jobs with the
+    // same `affinity` key go to the worker that ran the last one when it is
+    // idle, so its section cache can be reused. A `photo` Buffer goes to the
+    // worker as the message body instead of a data URL inside `data`. A
+    // `type` of 'preview' asks for the HTML preview instead of the DOCX, and
+    // 'bundle' for a zip of the `builders` (see python/render_worker.py).
+    render(builder, data, { timeoutMs = 0, affinity = null, photo = null, type = 'render', builders = null } = {}) {
+        return new Promise((resolve, reject) => {
+            this.queue.push({ builder, data, timeoutMs, affinity, photo, type, builders, resolve, reject });
+            this.dispatch();
+        });
+    }
+
+    takeIdleWorker(affinity) {
+        const preferred = affinity && this.affinity.get(affinity);
+        const index = preferred ? this.idle.indexOf(preferred) : -1;
+        const worker = index === -1 ? this.idle.shift() : this.idle.splice(index, 1)[0];
+        if (affinity) {
+            this.affinity.delete(affinity);
+            this.affinity.set(affinity, worker);
+            if (this.affinity.size > this.options.maxAffinityKeys) {
+                this.affinity.delete(this.affinity.keys().next().value);
+            }
+        }
+        return worker;
+    }
+
+    dispatch() {
+        while (this.queue.length && this.idle.length) {
+            const job = this.queue.shift();
+            this.runJob(this.takeIdleWorker(job.affinity), job);
+        }
+    }
+
+    runJob(worker, job) {
+        worker.busy = true;
+        worker.jobs++;
+        let timer = null;
+        if (job.timeoutMs > 0) {
+            timer = setTimeout(() => {
+                // A stuck render can't be interrupted over the pipe, so the
+                // worker is replaced; its pending promise rejects on exit.
+                console.error(`Render worker ${worker.id} exceeded ${job.timeoutMs}ms, killing it`);
+                const err = new Error(`Render timed out after ${job.timeoutMs}ms`);
+                err.code = 'RENDER_TIMEOUT';
+                job.reject(err);
+                worker.kill();
+            }, job.timeoutMs);
+        }
+        const { profileEvery } = this.options;
+        const profile = job.type === 'render' && profileEvery > 0 && this.dispatched++ % profileEvery === 0;
+        const header = { type: job.type, builder: job.builder, data: job.data, profile };
+        if (job.photo) header.photo = true;
+        if (job.builders) header.builders = job.builders;
+        worker.send(header, job.photo || undefined)
+            .then(({ header, body }) => {
+                if (header.ok) {
+                    job.resolve({ header, body });
+                } else {
+                    job.reject(new Error(header.error || 'Render failed'));
+                }
+            }, job.reject)
+            .finally(() => {
+                clearTimeout(timer);
+                worker.busy = false;
+                if (!worker.retiring) this.workerIdle(worker);
+            });
+    }
+
+    workerIdle(worker) {
+        if (worker.exited || worker.retiring || this.idle.includes(worker)) return;
+        this.idle.push(worker);
+        this.dispatch();
+    }
+
+    workerExited(worker, code) {
+        this.workers.delete(worker);
+        this.idle = this.idle.filter((w) => w !== worker);
+        for (const [key, owner] of this.affinity) {
+            if (owner === worker) this.affinity.delete(key);
+        }
+        if (this.stopped) return;
+        if (!worker.retiring) {
+            console.error(`Render worker ${worker.id} exited unexpectedly (code ${code}), replacing it`);
+        }
+        // Back off briefly if the interpreter can't start at all
+        setTimeout(() => {
+            if (!this.stopped) this.spawnWorker();
+        }, worker.ready ? 0 : 1000);
+    }
+
+    checkHealth() {
+        for (const worker of this.idle.slice()) {
+            worker.ping(this.options.healthCheckTimeout).catch((err) => {
+                console.error(`Render worker ${worker.id} failed health check: ${err.message}`);
+                worker.kill();
+            });
+        }
+    }
+
+    stats() {
+        return {
+            workers: this.workers.size,
+            idle: this.idle.length,
+            queued: this.queue.length,
+        };
+    }
+}
+
+module.exports = { RenderPool, encodeMessage, encodeFrames, MessageReader };
@@ -0,0 +1,179 @@
+// Bounded admission in front of the render pool: a single FIFO queue with a
+// hard size limit, a global concurrency cap, per-builder concurrency caps and
+// deadlines for both queue wait and render time.
+
+class SchedulerError extends Error {
+    constructor(message, status, code) {
+        super(message);
+        this.status = status;
+        this.code = code;
+    }
+}
+
+// Keeps the most recent samples so percentiles track current load.
+class RecentSamples {
+    constructor(limit = 1000) {
+        this.limit = limit;
+        this.samples = [];
+        this.next = 0;
+    }
+
+    add(value) {
+        if (this.samples.length < this.limit) {
+            this.samples.push(value);
+        } else {
+            this.samples[this.next] = value;
+            this.next = (this.next + 1) % this.limit;
+        }
+    }
+
+    summary() {
+        if (!this.samples.length) return { count: 0 };
+        const sorted = this.samples.slice().sort((a, b) => a - b);
+        const at = (q) => sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))];
+        return { count: sorted.length, p50: at(0.5), p95: at(0.95), p99: at(0.99), max: sorted[sorted.length - 1] };
+    }
+}
+
+// Parses "cv=1,modern-resume=2" into { cv: 1, 'modern-resume': 2 }.
+const parseLimits = (spec) => {
+    const limits = {};
+    for (const part of (spec || '').split(',')) {
+        const [name, value] = part.split('=').map((s) => s.trim());
+        if (name && parseInt(value, 10) > 0) limits[name] = parseInt(value, 10);
+    }
+    return limits;
+};
+
+class RenderScheduler {
+    constructor(pool, options = {}) {
+        this.pool = pool;
+        this.options = {
+            maxConcurrent: pool.options.size,
+            maxQueue: 100,
+            builderLimits: {},
+            queueTimeoutMs: 30000,
+            renderTimeoutMs: 60000,
+            ...options,
+        };
+        this.queue = [];
+        this.running = 0;
+        this.runningByBuilder = {};
+        this.counters = { accepted: 0, completed: 0, failed: 0, rejectedQueueFull: 0, queueTimeouts: 0, renderTimeouts: 0, cancelled: 0 };
+        this.waitTimes = new RecentSamples();
+        this.renderTimes = new RecentSamples();
+    }
+
+    builderLimit(builder) {
+        return this.options.builderLimits[builder] || this.options.maxConcurrent;
+    }
+
+    // Returns a promise for the pool result, with `waitMs` (time spent in
+    // this queue) added. Rejects straight away with a SchedulerError (status
+    // 429) when the queue is full, and with 503 when a deadline passes.
+    // Aborting `signal` drops a job that hasn't started yet. `affinity` is
+    // handed to the pool to keep related renders on one worker, and `photo`
+    // (a Buffer) is sent to the worker as raw bytes next to the payload.
+    // `type` and `builders` are passed through to the pool ('render',
+    // 'preview', or 'bundle' with the list of builders to bundle).
+    submit(builder, data, { signal, affinity = null, photo = null, type = 'render', builders = null } = {}) {
+        if (this.queue.length >= this.options.maxQueue) {
+            this.counters.rejectedQueueFull++;
+            return Promise.reject(new SchedulerError('Render queue is full, please retry shortly', 429, 'QUEUE_FULL'));
+        }
+        this.counters.accepted++;
+
+        return new Promise((resolve, reject) => {
+            const job = { builder, data, affinity, photo, type, builders, resolve, reject, enqueuedAt: Date.now() };
+
+            job.timer = setTimeout(() => {
+                this.remove(job);
+                this.counters.queueTimeouts++;
+                reject(new SchedulerError(`Waited more than ${this.options.queueTimeoutMs}ms for a render slot`, 503, 'QUEUE_TIMEOUT'));
+            }, this.options.queueTimeoutMs);
+
+            if (signal) {
+                signal.addEventListener('abort', () => {
+                    if (this.remove(job)) {
+                        this.counters.cancelled++;
+                        reject(new SchedulerError('Request cancelled', 499, 'CANCELLED'));
+                    }
+                }, { once: true });
+            }
+
+            this.queue.push(job);
+            this.dispatch();
+        });
+    }
+
+    remove(job) {
+        const index = this.queue.indexOf(job);
+        if (index === -1) return false;
+        this.queue.splice(index, 1);
+        clearTimeout(job.timer);
+        return true;
+    }
+
+    dispatch() {
+        // Skip past jobs whose builder is at its limit so one slow template
+        // can't block the others.
+        for (let i = 0; i < this.queue.length && this.running < this.options.maxConcurrent;) {
+            const job = this.queue[i];
+            if ((this.runningByBuilder[job.builder] || 0) >= this.builderLimit(job.builder)) {
+                i++;
+                continue;
+            }
+            this.queue.splice(i, 1);
+            clearTimeout(job.timer);
+            this.start(job);
+        }
+    }
+
+    start(job) {
+        const startedAt = Date.now();
+        const waitMs = startedAt - job.enqueuedAt;
+        this.waitTimes.add(waitMs);
+        this.running++;
+        this.runningByBuilder[job.builder] = (this.runningByBuilder[job.builder] || 0) + 1;
+
+        const { renderTimeoutMs } = this.options;
+        this.pool.render(job.builder, job.data, { timeoutMs: renderTimeoutMs, affinity: job.affinity, photo: job.photo, type: job.type, builders: job.builders })
+            .then((result) => {
+                this.counters.completed++;
+                job.resolve({ ...result, waitMs });
+            }, (err) => {
+                if (err.code === 'RENDER_TIMEOUT') {
+                    this.counters.renderTimeouts++;
+                    job.reject(new SchedulerError(err.message, 503, err.code));
+                } else {
+                    this.counters.failed++;
+                    job.reject(err);
+                }
+            })
+            .finally(() => {
+                this.renderTimes.add(Date.now() - startedAt);
+                this.running--;
+                this.runningByBuilder[job.builder]--;
+                this.dispatch();
+            });
+    }
+
+    stats() {
+        const queuedByBuilder = {};
+        for (const job of this.queue) queuedByBuilder[job.builder] = (queuedByBuilder[job.builder] || 0) + 1;
+        return {
+            queueDepth: this.queue.length,
+            maxQueue: this.options.maxQueue,
+            running: this.running,
+            maxConcurrent: this.options.maxConcurrent,
+            runningByBuilder: { ...this.runningByBuilder },
+            queuedByBuilder,
+            counters: { ...this.counters },
+            waitMs: this.waitTimes.summary(),
+            renderMs: this.renderTimes.summary(),
+            pool: this.pool.stats(),
+        };
+    }
+}
+
+module.exports = { RenderScheduler, SchedulerError, RecentSamples, parseLimits };
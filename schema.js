@@ -0,0 +1,167 @@
+// Payload validation and normalization for the render endpoints. The same
+// field table as python/schema.py: payloads in any of the shapes the builders
+// accept (skills as text or {name, level}, title/jobTitle, summary/objective,
+// address/location) become one normalized payload before they are cached or
+// queued, and payloads that are malformed or too large are rejected here
+// instead of in a worker.
+
+// `limit` is the longest string for text, list and skill items and entry
+// fields, `items` the most list entries. Aliases are other names builders use
+// for the field; the field's own name wins if both are given. The limits only
+// stop abuse: long payloads are the governor's and page_fit's to shorten.
+const SHORT_TEXT = 200;
+const LONG_TEXT = 50000;
+const DEFAULT_SKILL_LEVEL = 50;
+
+const FIELDS = [
+    { name: 'name', kind: 'text', limit: SHORT_TEXT },
+    { name: 'title', kind: 'text', limit: SHORT_TEXT, aliases: ['jobTitle'] },
+    { name: 'email', kind: 'text', limit: 320 },
+    { name: 'phone', kind: 'text', limit: 50 },
+    { name: 'address', kind: 'text', limit: 500, aliases: ['location'] },
+    { name: 'linkedin', kind: 'text', limit: 500 },
+    { name: 'summary', kind: 'text', limit: LONG_TEXT, aliases: ['objective'] },
+    { name: 'skills', kind: 'skills', limit: 100, items: 2000 },
+    { name: 'languages', kind: 'list', limit: 100, items: 500 },
+    { name: 'hobbies', kind: 'list', limit: 100, items: 500 },
+    { name: 'experience', kind: 'entries', limit: LONG_TEXT, items: 5000, fields: ['title', 'company', 'date', 'description'] },
+    { name: 'education', kind: 'entries', limit: LONG_TEXT, items: 5000, fields: ['degree', 'school', 'year'] },
+    { name: 'photo', kind: 'photo' },
+];
+
+// `status` is 400 for malformed payloads and 413 for ones over a limit
+class SchemaError extends Error {
+    constructor(path, message, status = 400) {
+        super(`${path}: ${message}`);
+        this.path = path;
+        this.status = status;
+    }
+}
+
+const typeName = (value) => (Array.isArray(value) ? 'list' : typeof value);
+
+// Compiled checks: each takes (value, path) and returns the normalized value
+
+const textCheck = (limit) => (value, path) => {
+    if (typeof value === 'number' && Number.isFinite(value)) {
+        value = String(value);
+    } else if (typeof value !== 'string') {
+        throw new SchemaError(path, `expected a string, got ${typeName(value)}`);
+    }
+    if (value.length > limit) throw new SchemaError(path, `longer than ${limit} characters`, 413);
+    return value;
+};
+
+const listItems = (value, path, items) => {
+    if (typeof value === 'string') {
+        value = value.split(',');
+    } else if (!Array.isArray(value)) {
+        throw new SchemaError(path, `expected a list or a comma separated string, got ${typeName(value)}`);
+    }
+    if (value.length > items) throw new SchemaError(path, `more than ${items} entries`, 413);
+    return value;
+};
+
+const listCheck = (field) => {
+    const text = textCheck(field.limit);
+    return (value, path) => listItems(value, path, field.items)
+        .map((item, index) => text(item, `${path}[${index}]`).trim())
+        .filter((item) => item);
+};
+
+const skillLevel = (value, path) => {
+    const level = typeof value === 'string' && value.trim() ? Number(value) : value;
+    if (typeof level !== 'number' || !Number.isFinite(level)) throw new SchemaError(path, 'expected a number');
+    if (level < 0 || level > 100) throw new SchemaError(path, 'expected a level from 0 to 100');
+    return Math.trunc(level);
+};
+
+const skillsCheck = (field) => {
+    const text = textCheck(field.limit);
+    return (value, path) => {
+        const skills = [];
+        listItems(value, path, field.items).forEach((item, index) => {
+            const itemPath = `${path}[${index}]`;
+            let name;
+            let level = DEFAULT_SKILL_LEVEL;
+            if (item && typeof item === 'object' && !Array.isArray(item)) {
+                name = text(item.name ?? '', `${itemPath}.name`).trim();
+                if (item.level != null) level = skillLevel(item.level, `${itemPath}.level`);
+            } else {
+                name = text(item, itemPath).trim();
+            }
+            if (name) skills.push({ name, level });
+        });
+        return skills;
+    };
+};
+
+const entriesCheck = (field) => {
+    const text = textCheck(field.limit);
+    return (value, path) => {
+        if (!Array.isArray(value)) throw new SchemaError(path, `expected a list, got ${typeName(value)}`);
+        if (value.length > field.items) throw new SchemaError(path, `more than ${field.items} entries`, 413);
+        return value.map((entry, index) => {
+            if (!entry || typeof entry !== 'object' || Array.isArray(entry)) {
+                throw new SchemaError(`${path}[${index}]`, `expected an object, got ${typeName(entry)}`);
+            }
+            const normalized = {};
+            for (const key of field.fields) {
+                if (entry[key] != null) normalized[key] = text(entry[key], `${path}[${index}].${key}`);
+            }
+            return normalized;
+        });
+    };
+};
+
+const photoCheck = () => (value, path) => {
+    if (typeof value !== 'string') throw new SchemaError(path, `expected a data URL, got ${typeName(value)}`);
+    return value || null;
+};
+
+const COMPILERS = { text: (field) => textCheck(field.limit), list: listCheck, skills: skillsCheck, entries: entriesCheck, photo: photoCheck };
+
+const CHECKS = FIELDS.map((field) => ({
+    name: field.name,
+    keys: [field.name, ...(field.aliases || [])],
+    check: COMPILERS[field.kind](field),
+}));
+
+// The normalized form of `data`: the field table's names only, absent fields
+// left out, skills as [{ name, level }]. Throws SchemaError.
+const normalizePayload = (data) => {
+    if (!data || typeof data !== 'object' || Array.isArray(data)) {
+        throw new SchemaError('payload', `expected an object, got ${typeName(data)}`);
+    }
+    const payload = {};
+    for (const { name, keys, check } of CHECKS) {
+        const key = keys.find((candidate) => data[candidate] != null);
+        if (key === undefined) continue;
+        const value = check(data[key], key);
+        if (value != null) payload[name] = value;
+    }
+    return payload;
+};
+
+// Base64 carries 3 bytes in every 4 characters
+const dataUrlBytes = (photo) => Math.floor((photo.length - photo.indexOf(',') - 1) * 3 / 4);
+
+// Middleware for the render routes: replaces req.body with the normalized
+// payload, or answers 400/413 without touching the render pool. `onReject`
+// is called with the SchemaError.
+const validatePayload = ({ maxPhotoBytes = 10 * 1024 * 1024, onReject = () => {} } = {}) => (req, res, next) => {
+    try {
+        const payload = normalizePayload(req.body);
+        const photoBytes = req.photo ? req.photo.data.length : (payload.photo ? dataUrlBytes(payload.photo) : 0);
+        if (photoBytes > maxPhotoBytes) throw new SchemaError('photo', `larger than ${maxPhotoBytes} bytes`, 413);
+        req.body = payload;
+    } catch (err) {
+        if (!(err instanceof SchemaError)) throw err;
+        onReject(err);
+        res.status(err.status).json({ error: err.message, path: err.path });
+        return;
+    }
+    next();
+};
+
+module.exports = { FIELDS, SchemaError, normalizePayload, validatePayload };
@@ -1,104 +1,440 @@
 const express = require('express');
 const bodyParser = require('body-parser');
 const cors = require('cors');
-const { spawn } = require('child_process');
 const path = require('path');
-const fs = require('fs');
+const os = require('os');
+const { RenderPool } = require('./render_pool');
+const { RenderScheduler, parseLimits } = require('./render_scheduler');
+const { RenderCache } = require('./render_cache');
+const { renderUpload } = require('./multipart');
+const { BUNDLE_FILES } = require('./bundle');
+const { validatePayload } = require('./schema');
+const { JobStore, MemoryQueue, FileQueue, JobRunner } = require('./jobs');
+const { MetricsRegistry, SECONDS_BUCKETS, BYTES_BUCKETS, CONTENT_TYPE } = require('./metrics');
 
 const app = express();
 const PORT = 3000;
 
-app.use(cors());
-app.use(bodyParser.json());
+// Let pages on other origins read the render headers, e.g. the ETag
+// js/live_preview.js sends back to have an unchanged preview answered with 304
+app.use(cors({ exposedHeaders: ['ETag', 'X-Render-Cache', 'X-Render-Builder', 'X-Render-Degraded'] }));
+
+// Request size caps. A JSON body may carry the largest photo schema.js accepts
+// as a base64 data URL, next to as much text as an upload leaves room for, so
+// payloads too large for the schema get its 413 naming the field instead
+const MAX_PHOTO_BYTES = (parseInt(process.env.RENDER_PHOTO_MB, 10) || 10) * 1024 * 1024;
+const MAX_UPLOAD_BYTES = (parseInt(process.env.RENDER_UPLOAD_MB, 10) || 16) * 1024 * 1024;
+const MAX_JSON_BYTES = Math.ceil(MAX_PHOTO_BYTES / 3) * 4 + Math.max(MAX_UPLOAD_BYTES - MAX_PHOTO_BYTES, 1024 * 1024);
+app.use(bodyParser.json({ limit: MAX_JSON_BYTES }));
+// Photos can be uploaded as a file next to the JSON instead of a data URL in it
+app.use(renderUpload({ limit: MAX_UPLOAD_BYTES }));
 app.use(express.static(path.join(__dirname, '.')));
 
-// Ensure output directory exists
-const outputDir = path.join(__dirname, 'docx');
-if (!fs.existsSync(outputDir)) {
-    fs.mkdirSync(outputDir);
-}
+// Per-phase render timings reported by the workers, scraped from /metrics
+const metrics = new MetricsRegistry();
+const phaseSeconds = metrics.histogram('recegen_render_phase_seconds',
+    'Time spent per render phase (queue, load, photo, build, save).', ['endpoint', 'phase'], SECONDS_BUCKETS);
+const outputBytes = metrics.histogram('recegen_render_output_bytes',
+    'Size of rendered documents.', ['endpoint'], BYTES_BUCKETS);
+const requestSeconds = metrics.histogram('recegen_request_duration_seconds',
+    'Render request duration, including cache hits.', ['endpoint', 'status'], SECONDS_BUCKETS);
+const workerStartupSeconds = metrics.histogram('recegen_worker_startup_seconds',
+    'Time from process start until a render worker was ready.', [], SECONDS_BUCKETS);
+
+// Long-lived Python workers that keep the builders loaded between requests
+const renderPool = new RenderPool({
+    size: parseInt(process.env.RENDER_POOL_SIZE, 10) || Math.max(1, Math.min(os.cpus().length, 4)),
+    maxJobsPerWorker: parseInt(process.env.RENDER_MAX_JOBS, 10) || 200,
+    healthCheckInterval: parseInt(process.env.RENDER_HEALTH_INTERVAL_MS, 10) || 10000,
+    healthCheckTimeout: parseInt(process.env.RENDER_HEALTH_TIMEOUT_MS, 10) || 5000,
+    python: process.env.PYTHON || 'python',
+    // Sampled profiling of production renders, see python/profile_report.py
+    profileEvery: parseInt(process.env.RENDER_PROFILE_EVERY, 10) || 0,
+    profileDir: process.env.RENDER_PROFILE_DIR || path.join(os.tmpdir(), 'recegen-profiles'),
+    profileKeep: parseInt(process.env.RENDER_PROFILE_KEEP, 10) || 50,
+    onWorkerReady: (worker, header) => {
+        if (header.startup_ms != null) workerStartupSeconds.observe({}, header.startup_ms / 1000);
+    },
+}).start();
+
+// Bounded queue in front of the pool so bursts are rejected instead of piling up
+const scheduler = new RenderScheduler(renderPool, {
+    maxQueue: parseInt(process.env.RENDER_QUEUE_SIZE, 10) || 100,
+    queueTimeoutMs: parseInt(process.env.RENDER_QUEUE_TIMEOUT_MS, 10) || 30000,
+    renderTimeoutMs: parseInt(process.env.RENDER_TIMEOUT_MS, 10) || 60000,
+    builderLimits: parseLimits(process.env.RENDER_BUILDER_CONCURRENCY),
+});
+
+// Builders are deterministic, so identical payloads can be served from cache
+const renderCache = new RenderCache({
+    maxBytes: (parseInt(process.env.RENDER_CACHE_MB, 10) || 64) * 1024 * 1024,
+});
+
+metrics.gauge('recegen_render_queue_depth', 'Requests waiting for a render slot.',
+    () => scheduler.stats().queueDepth);
+metrics.gauge('recegen_render_running', 'Renders in progress.', () => scheduler.running);
+metrics.gauge('recegen_render_workers', 'Render workers by state.', () => {
+    const { workers, idle } = renderPool.stats();
+    return [[{ state: 'idle' }, idle], [{ state: 'busy' }, workers - idle]];
+}, ['state']);
+metrics.counter('recegen_render_jobs_total', 'Render jobs seen by the scheduler, by outcome.',
+    () => Object.entries(scheduler.counters).map(([outcome, value]) => [{ outcome }, value]), ['outcome']);
+metrics.counter('recegen_render_cache_events_total', 'Render cache lookups and evictions.',
+    () => Object.entries(renderCache.counters).map(([event, value]) => [{ event }, value]), ['event']);
+metrics.gauge('recegen_render_cache_bytes', 'Bytes held by the render cache.', () => renderCache.bytes);
+metrics.gauge('process_resident_memory_bytes', 'Resident memory of the server process, without its render workers.',
+    () => process.memoryUsage().rss);
 
-// Helper function to run Python script
-const runPythonScript = (scriptPath, data, res, outputFilename) => {
-    const tempJsonPath = path.join(__dirname, 'temp_data.json');
-    fs.writeFileSync(tempJsonPath, JSON.stringify(data));
+// Payloads are validated and normalized before they reach the cache or a
+// worker; rejected ones are counted by status (400 malformed, 413 too large)
+const rejectedPayloads = {};
+const checkPayload = validatePayload({
+    maxPhotoBytes: MAX_PHOTO_BYTES,
+    onReject: (err) => {
+        rejectedPayloads[err.status] = (rejectedPayloads[err.status] || 0) + 1;
+    },
+});
+metrics.counter('recegen_rejected_payloads_total', 'Render requests rejected by payload validation.',
+    () => Object.entries(rejectedPayloads).map(([status, value]) => [{ status }, value]), ['status']);
+
+// Degradations workers applied to fit renders in their budgets, by step
+const degradations = {};
+metrics.counter('recegen_render_degradations_total', 'Renders degraded to fit the worker budgets, by step.',
+    () => Object.entries(degradations).map(([step, value]) => [{ step }, value]), ['step']);
 
-    console.log(`Executing python script: ${scriptPath}`);
-    const pythonProcess = spawn('python', [scriptPath, tempJsonPath]);
+// Records the timings a worker reported for one render
+const observeRender = (endpoint, { header, waitMs }) => {
+    const steps = [...(header.degraded || []), ...(header.manifest || []).flatMap((entry) => entry.degraded || [])];
+    for (const step of steps) degradations[step] = (degradations[step] || 0) + 1;
+    phaseSeconds.observe({ endpoint, phase: 'queue' }, waitMs / 1000);
+    for (const [phase, ms] of Object.entries(header.timings || {})) {
+        phaseSeconds.observe({ endpoint, phase }, ms / 1000);
+    }
+    if (header.size != null) outputBytes.observe({ endpoint }, header.size);
+};
 
-    let errorOutput = '';
+const DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document';
 
-    pythonProcess.stdout.on('data', (data) => {
-        console.log(`stdout: ${data}`);
+const matchesEtag = (req, etag) => {
+    const header = req.get('If-None-Match');
+    if (!header) return false;
+    return header.split(',').some((tag) => {
+        const value = tag.trim();
+        return value === '*' || value.replace(/^W\//, '') === etag;
     });
+};
 
-    pythonProcess.stderr.on('data', (data) => {
-        console.error(`stderr: ${data}`);
-        errorOutput += data.toString();
+// Renders through the cache: identical requests share one render, and the
+// worker pool is only used on a miss. Resolves with { body, cache, degraded,
+// builder, filename } where `degraded` lists the steps a worker took to stay
+// within its budgets and `builder`/`filename` name the template that rendered
+// (another one after a template-fallback); degraded documents aren't cached,
+// so a cache hit is always the template asked for. A `type` of 'preview'
+// renders the HTML preview instead, and 'bundle' a zip of `builders` with its
+// `manifest`; both are cached under their own keys.
+const renderCached = (builder, data, photo, { key, endpoint, affinity = null, signal, type = 'render', builders = null }) => {
+    const render = (renderSignal) => {
+        console.log(`Rendering ${type === 'render' ? '' : `${type} of `}${builders || builder} on worker pool`);
+        const options = { signal: renderSignal, affinity, photo: photo && photo.data, type, builders };
+        return scheduler.submit(builder, data, options).then((result) => {
+            observeRender(endpoint, result);
+            const { degraded = [], builder: rendered, filename, manifest } = result.header;
+            // A bundle missing a document, or with a degraded one, is degraded too
+            const complete = !manifest || manifest.every((entry) => entry.ok && !entry.degraded);
+            return { body: result.body, cacheable: !degraded.length && complete, degraded, builder: rendered, filename, manifest };
+        });
+    };
+    const cacheBuilder = type === 'render' ? builder : [type, builder, ...(builders || [])].join(':');
+    return renderCache.fetch(key || renderCache.keyFor(cacheBuilder, data, photo && photo.data), render, { signal });
+};
+
+// Helper function to render a document on the worker pool and stream it back
+const renderDocument = (builder, req, res, outputFilename) => {
+    const data = req.body;
+    const photo = req.photo || null;
+    const endpoint = req.path;
+    const startedAt = process.hrtime.bigint();
+    res.on('finish', () => {
+        const seconds = Number(process.hrtime.bigint() - startedAt) / 1e9;
+        requestSeconds.observe({ endpoint, status: res.statusCode }, seconds);
     });
 
-    pythonProcess.on('error', (err) => {
-        console.error('Failed to start subprocess:', err);
-        res.status(500).send(`Failed to execute Python script: ${err.message}`);
+    const key = renderCache.keyFor(builder, data, photo && photo.data);
+    const etag = renderCache.etagFor(key);
+
+    // Same payload and code version means the same bytes the client already has
+    res.set('ETag', etag);
+    res.set('Cache-Control', 'private, no-cache');
+    if (matchesEtag(req, etag)) {
+        res.status(304).end();
+        return;
+    }
+
+    // Drop the job from the queue if the client goes away before it starts
+    const controller = new AbortController();
+    res.on('close', () => {
+        if (!res.writableFinished) controller.abort();
     });
 
-    pythonProcess.on('close', (code) => {
-        if (fs.existsSync(tempJsonPath)) {
-            fs.unlinkSync(tempJsonPath); // Clean up temp file
-        }
+    // Edits from one editor session go to the same worker, which only
+    // re-renders the sections that changed
+    const session = req.get('X-Edit-Session');
+    const affinity = session ? `${builder}:${session}` : null;
 
-        if (code === 0) {
-            const filePath = path.join(outputDir, outputFilename);
-            if (fs.existsSync(filePath)) {
-                res.download(filePath, outputFilename, (err) => {
-                    if (err) {
-                        console.error('Error downloading file:', err);
-                        if (!res.headersSent) {
-                            res.status(500).send('Error downloading file');
-                        }
-                    }
-                });
+    renderCached(builder, data, photo, { key, endpoint, affinity, signal: controller.signal })
+        .then(({ body, cache, degraded = [], builder: rendered = builder, filename = outputFilename }) => {
+            if (controller.signal.aborted) return;
+            res.set('X-Render-Cache', cache);
+            res.set('X-Render-Builder', rendered);
+            if (degraded.length) {
+                res.set('X-Render-Degraded', degraded.join(','));
+                // Not what this payload renders to under normal load, so the
+                // client mustn't keep it by revalidating
+                res.removeHeader('ETag');
+                res.set('Cache-Control', 'no-store');
+            }
+            res.attachment(filename);
+            res.type(DOCX_MIME);
+            res.send(body);
+        })
+        .catch((err) => {
+            if (err.code === 'CANCELLED' || controller.signal.aborted) return;
+            console.error(`Render failed: ${err.message}`);
+            res.removeHeader('ETag');
+            if (err.status) {
+                res.set('Retry-After', '5');
+                res.status(err.status).send(err.message);
             } else {
-                console.error('Generated file not found');
-                res.status(500).send('Generated file not found');
+                res.status(500).send(`Error generating document: ${err.message}`);
             }
+        });
+};
+
+// Asynchronous jobs: results are kept for RENDER_JOB_TTL_S after they finish.
+// With RENDER_JOB_QUEUE_DIR jobs go through a spool directory that
+// python/job_worker.py processes can also pull from; RENDER_JOB_CONCURRENCY=0
+// then leaves all rendering to them.
+const jobStore = new JobStore({
+    ttlMs: (parseInt(process.env.RENDER_JOB_TTL_S, 10) || 900) * 1000,
+    maxBytes: (parseInt(process.env.RENDER_JOB_STORE_MB, 10) || 256) * 1024 * 1024,
+    maxPending: parseInt(process.env.RENDER_JOB_MAX_PENDING, 10) || 1000,
+});
+const jobQueue = (process.env.RENDER_JOB_QUEUE_DIR
+    ? new FileQueue({ dir: process.env.RENDER_JOB_QUEUE_DIR })
+    : new MemoryQueue()
+).start({
+    onClaimed: (id) => jobStore.start(id),
+    onResult: (id, result) => {
+        if (result.ok) {
+            jobStore.complete(id, result.body, result);
         } else {
-            console.error(`Python script exited with code ${code}`);
-            res.status(500).send(`Error generating document (Exit Code ${code}): ${errorOutput}`);
+            jobStore.fail(id, result.error);
         }
+    },
+});
+const jobConcurrency = parseInt(process.env.RENDER_JOB_CONCURRENCY, 10);
+new JobRunner(jobQueue, jobStore, ({ builder, data, photo }) => (
+    renderCached(builder, data, photo && { data: photo }, { endpoint: '/api/jobs' })
+), { concurrency: Number.isNaN(jobConcurrency) ? renderPool.options.size : jobConcurrency }).start();
+
+metrics.gauge('recegen_jobs', 'Asynchronous render jobs by status.', () => {
+    const { bytes, ...byStatus } = jobStore.stats();
+    return Object.entries(byStatus).map(([status, value]) => [{ status }, value]);
+}, ['status']);
+metrics.gauge('recegen_job_result_bytes', 'Bytes held by finished job results.', () => jobStore.bytes);
+
+// Queues a render and answers 202 with the job straight away.
+// ?builder=cv picks the template; the body is the same as for the
+// /api/generate-* endpoints.
+app.post('/api/jobs', checkPayload, (req, res) => {
+    const builder = req.query.builder;
+    if (!BUNDLE_FILES[builder]) {
+        res.status(400).send(`Unknown builder: ${builder}. Expected one of: ${Object.keys(BUNDLE_FILES).join(', ')}`);
+        return;
+    }
+    let job;
+    try {
+        job = jobStore.create(builder, BUNDLE_FILES[builder]);
+    } catch (err) {
+        res.set('Retry-After', '5');
+        res.status(err.status || 500).send(err.message);
+        return;
+    }
+    jobQueue.push({ id: job.id, builder, data: req.body, photo: req.photo ? req.photo.data : null });
+    res.set('Location', `/api/jobs/${job.id}`);
+    res.status(202).json({ ...jobStore.describe(job), resultUrl: `/api/jobs/${job.id}/result` });
+});
+
+app.get('/api/jobs/:id', (req, res) => {
+    const job = jobStore.get(req.params.id);
+    if (!job) {
+        res.status(404).json({ error: 'Unknown or expired job' });
+        return;
+    }
+    res.json(jobStore.describe(job));
+});
+
+// 409 while the job is still queued or running
+app.get('/api/jobs/:id/result', (req, res) => {
+    const job = jobStore.get(req.params.id);
+    if (!job) {
+        res.status(404).json({ error: 'Unknown or expired job' });
+        return;
+    }
+    if (job.status === 'failed') {
+        res.status(job.errorStatus || 500).json(jobStore.describe(job));
+        return;
+    }
+    if (job.status !== 'done') {
+        res.status(409).json(jobStore.describe(job));
+        return;
+    }
+    res.set('X-Render-Builder', job.renderedBuilder || job.builder);
+    res.attachment(job.filename);
+    res.type(DOCX_MIME);
+    res.send(jobStore.result(job.id));
+});
+
+// Renders several templates from one payload into one zip. ?builders=cv,ats-cv
+// picks the templates (default: all). The bundle is a single worker job
+// (python/bundle.py), so the payload is parsed and its photo decoded once for
+// every template. manifest.json in the zip reports each template's outcome.
+app.post('/api/generate-bundle', checkPayload, (req, res) => {
+    const builders = req.query.builders
+        ? [...new Set(String(req.query.builders).split(',').map((b) => b.trim()))]
+        : Object.keys(BUNDLE_FILES);
+    const unknown = builders.filter((builder) => !BUNDLE_FILES[builder]);
+    if (unknown.length || !builders.length) {
+        res.status(400).send(`Unknown builders: ${unknown.join(', ')}. Expected some of: ${Object.keys(BUNDLE_FILES).join(', ')}`);
+        return;
+    }
+
+    const photo = req.photo || null;
+    const endpoint = req.path;
+    const startedAt = process.hrtime.bigint();
+    res.on('finish', () => {
+        const seconds = Number(process.hrtime.bigint() - startedAt) / 1e9;
+        requestSeconds.observe({ endpoint, status: res.statusCode }, seconds);
+    });
+    const controller = new AbortController();
+    res.on('close', () => {
+        if (!res.writableFinished) controller.abort();
     });
-};
 
-app.post('/api/generate-resume', (req, res) => {
-    const data = req.body;
-    const scriptPath = path.join(__dirname, 'python', 'resume_builder.py');
-    runPythonScript(scriptPath, data, res, 'resume_output.docx');
+    renderCached('bundle', req.body, photo, { endpoint, type: 'bundle', builders, signal: controller.signal })
+        .then(({ body, cache, manifest }) => {
+            if (controller.signal.aborted) return;
+            // Only complete bundles are cached, so a hit has no manifest to check
+            if (manifest && !manifest.some((entry) => entry.ok)) {
+                res.status(500).json({ error: 'No document could be rendered', manifest });
+                return;
+            }
+            res.set('X-Render-Cache', cache);
+            // Missing or degraded documents: let the next request render again
+            if (manifest && manifest.some((entry) => !entry.ok || entry.degraded)) res.set('Cache-Control', 'no-store');
+            res.attachment('resume_bundle.zip');
+            res.type('application/zip');
+            res.send(body);
+        })
+        .catch((err) => {
+            if (err.code === 'CANCELLED' || controller.signal.aborted) return;
+            console.error(`Bundle failed: ${err.message}`);
+            if (err.status === 429 || err.status === 503) res.set('Retry-After', '5');
+            res.status(err.status || 500).json({ error: err.message });
+        });
 });
 
-app.post('/api/generate-cv', (req, res) => {
-    const data = req.body;
-    const scriptPath = path.join(__dirname, 'python', 'generate_cv.py');
-    runPythonScript(scriptPath, data, res, 'cv_output.docx');
+// Queue depth, wait/render time percentiles and pool state, for sizing the pool
+app.get('/api/render-stats', (req, res) => {
+    res.json({ ...scheduler.stats(), cache: renderCache.stats() });
 });
 
-app.post('/api/generate-ats-cv', (req, res) => {
-    const data = req.body;
-    const scriptPath = path.join(__dirname, 'python', 'ats_cv_builder.py');
-    runPythonScript(scriptPath, data, res, 'ats_cv_output.docx');
+// Prometheus scrape endpoint
+app.get('/metrics', (req, res) => {
+    res.type(CONTENT_TYPE).send(metrics.render());
 });
 
-app.post('/api/generate-ats-resume', (req, res) => {
+// HTML previews for editors: the same layouts as the documents, rendered in
+// about a millisecond, so a page can post every (debounced) edit here and
+// only ask for the DOCX on download. See js/live_preview.js.
+app.post('/api/preview/:builder', checkPayload, (req, res) => {
+    const { builder } = req.params;
+    if (!BUNDLE_FILES[builder]) {
+        res.status(400).send(`Unknown builder: ${builder}. Expected one of: ${Object.keys(BUNDLE_FILES).join(', ')}`);
+        return;
+    }
     const data = req.body;
-    const scriptPath = path.join(__dirname, 'python', 'ats_resume_builder.py');
-    runPythonScript(scriptPath, data, res, 'ats_resume_output.docx');
+    const photo = req.photo || null;
+    const endpoint = '/api/preview';
+    const startedAt = process.hrtime.bigint();
+    res.on('finish', () => {
+        const seconds = Number(process.hrtime.bigint() - startedAt) / 1e9;
+        requestSeconds.observe({ endpoint, status: res.statusCode }, seconds);
+    });
+
+    const key = renderCache.keyFor(`preview:${builder}`, data, photo && photo.data);
+    const etag = renderCache.etagFor(key);
+    res.set('ETag', etag);
+    res.set('Cache-Control', 'private, no-cache');
+    if (matchesEtag(req, etag)) {
+        res.status(304).end();
+        return;
+    }
+
+    // A newer keystroke aborts the request for the older one
+    const controller = new AbortController();
+    res.on('close', () => {
+        if (!res.writableFinished) controller.abort();
+    });
+
+    renderCached(builder, data, photo, { key, endpoint, type: 'preview', signal: controller.signal })
+        .then(({ body, cache }) => {
+            if (controller.signal.aborted) return;
+            res.set('X-Render-Cache', cache);
+            res.type('text/html; charset=utf-8');
+            res.send(body);
+        })
+        .catch((err) => {
+            if (err.code === 'CANCELLED' || controller.signal.aborted) return;
+            console.error(`Preview failed: ${err.message}`);
+            res.removeHeader('ETag');
+            if (err.status) {
+                res.set('Retry-After', '5');
+                res.status(err.status).send(err.message);
+            } else {
+                res.status(500).send(`Error rendering preview: ${err.message}`);
+            }
+        });
 });
 
-app.post('/api/generate-modern-resume', (req, res) => {
-    const data = req.body;
-    const scriptPath = path.join(__dirname, 'python', 'modern_resume_builder.py');
-    runPythonScript(scriptPath, data, res, 'modern_resume.docx');
+app.post('/api/generate-resume', checkPayload, (req, res) => {
+    renderDocument('resume', req, res, 'resume_output.docx');
+});
+
+app.post('/api/generate-cv', checkPayload, (req, res) => {
+    renderDocument('cv', req, res, 'cv_output.docx');
+});
+
+app.post('/api/generate-ats-cv', checkPayload, (req, res) => {
+    renderDocument('ats-cv', req, res, 'ats_cv_output.docx');
 });
 
+app.post('/api/generate-ats-resume', checkPayload, (req, res) => {
+    renderDocument('ats-resume', req, res, 'ats_resume_output.docx');
+});
+
+app.post('/api/generate-modern-resume', checkPayload, (req, res) => {
+    renderDocument('modern-resume', req, res, 'modern_resume.docx');
+});
+
+const shutdown = () => {
+    jobQueue.stop();
+    renderPool.stop();
+    process.exit(0);
+};
+process.on('SIGINT', shutdown);
+process.on('SIGTERM', shutdown);
+
 app.listen(PORT, () => {
     console.log(`Server is running on http://localhost:${PORT}`);
 });